@@ -0,0 +1,182 @@
+from app.accruals.cipca.calculator.tariffs import get_groups_list
+from processing.models.billing.accrual import Accrual
+from processing.models.billing.service_type import ServiceType
+from processing.models.billing.tariff_plan import TariffPlan
+
+# кэш документа по коду главной услуги (как в SERVICE_GROUP_CACHE_FUNCS)
+CACHE_HEAD_TYPES = {
+    'cold_water': 'water_individual',
+    'hot_water': 'heating_water_individual',
+    'heat_water_other': 'heat_water',
+    'heat': 'heat',
+    'electricity': 'electricity_individual',
+    'cold_water_public': 'water_public',
+    'hot_water_public': 'heating_water_public',
+    'electricity_public': 'electricity_public',
+    'waste_water': 'waste_water',
+    'gas': 'gas_supply',
+}
+# кэш документа по группе тарифа
+CACHE_TARIFF_GROUPS = {
+    'housing': 0,
+    'communal': 1,
+    'other': 2,
+    'capital_repair': 3,
+}
+CACHE_NAMES = (*CACHE_HEAD_TYPES, *CACHE_TARIFF_GROUPS)
+_COMMUNAL_SERVICES_BIT = 1 << len(CACHE_NAMES)
+_DEFAULT_TARIFF_GROUP = 2
+
+
+def get_doc_cache_services(doc):
+    """
+    Суммы кэша документа начислений, посчитанные агрегацией в базе.
+    Документ и начисления в память не загружаются - суммы по услугам
+    раскладываются по группам кэша битовыми масками услуг
+
+    :param doc: AccrualDoc (нужны id, tariff_plan и sector_binds)
+    """
+    services_sums, penalties = aggregate_doc_services(doc.id)
+    membership = get_cache_membership(
+        {bind.provider for bind in doc.sector_binds},
+        get_doc_service_groups(doc.id, doc.tariff_plan),
+        services_sums,
+    )
+    cache_services = dict.fromkeys(CACHE_NAMES, 0)
+    all_communal = 0
+    for service_type, value in services_sums.items():
+        mask = membership.get(service_type, 0)
+        for ix, cache_name in enumerate(CACHE_NAMES):
+            if mask & (1 << ix):
+                cache_services[cache_name] += value
+        if mask & _COMMUNAL_SERVICES_BIT:
+            all_communal += value
+    cache_services['penalties'] = penalties
+    cache_services['communal_other_services'] = (
+            cache_services['communal']
+            - all_communal
+    )
+    cache_services['heat_water_other'] = (
+            cache_services['heat_water_other']
+            - cache_services['hot_water']
+            - cache_services['hot_water_public']
+    )
+    return cache_services
+
+
+def aggregate_doc_services(doc_id):
+    """
+    Суммы начислений документа по услугам и сумма пени
+
+    :returns: {ServiceTypeId: сумма}, пени
+    """
+    match_query = {
+        'doc._id': doc_id,
+        'is_deleted': {'$ne': True},
+    }
+    penalties = list(
+        Accrual.objects.aggregate(
+            {'$match': match_query},
+            {'$group': {'_id': None, 'p': {'$sum': '$totals.penalties'}}},
+        ),
+    )
+    services = Accrual.objects.aggregate(
+        {'$match': match_query},
+        {'$project': {'services': 1}},
+        {'$unwind': '$services'},
+        {
+            '$group': {
+                '_id': '$services.service_type',
+                'result': {
+                    '$sum': {
+                        # TODO: убрать $ifNull после миграции поля result
+                        '$ifNull': [
+                            '$services.result',
+                            {'$add': [
+                                '$services.value',
+                                '$services.totals.recalculations',
+                                '$services.totals.shortfalls',
+                                '$services.totals.privileges',
+                            ]},
+                        ],
+                    },
+                },
+            },
+        },
+    )
+    return (
+        {s['_id']: s['result'] for s in services},
+        penalties[0]['p'] if penalties else 0,
+    )
+
+
+def get_doc_service_groups(doc_id, default_tariff_plan=None):
+    """
+    Группы тарифов услуг по тарифным планам начислений документа.
+    Для услуги берётся группа из первого тарифного плана, где она есть
+    """
+    tariff_plans = [
+        tp for tp in Accrual.objects(
+            doc__id=doc_id,
+        ).distinct('tariff_plan')
+        if tp
+    ]
+    if default_tariff_plan:
+        tariff_plans = [
+            default_tariff_plan,
+            *(tp for tp in tariff_plans if tp != default_tariff_plan),
+        ]
+    plans = {
+        tp['_id']: tp
+        for tp in TariffPlan.objects(
+            pk__in=tariff_plans,
+        ).only(
+            'tariffs.service_type',
+            'tariffs.group',
+        ).as_pymongo()
+    }
+    result = {}
+    for tp_id in tariff_plans:
+        for tariff in plans.get(tp_id, {}).get('tariffs', []):
+            result.setdefault(tariff['service_type'], tariff.get('group', 0))
+    return result
+
+
+def get_cache_membership(providers, service_groups, services):
+    """
+    Битовая маска групп кэша (в порядке CACHE_NAMES) для каждой услуги
+
+    :returns: {ServiceTypeId: маска}
+    """
+    closures = [ServiceType.get_closure(provider) for provider in providers]
+    head_ids = {
+        cache_name: {
+            service_id
+            for closure in closures
+            for service_id in closure.descendants_of_code(head_code)
+        }
+        for cache_name, head_code in CACHE_HEAD_TYPES.items()
+    }
+    communal_ids = {
+        service_id
+        for closure in closures
+        for service_id in closure.descendants_of_code('communal_services')
+    }
+    groups = {
+        cache_name: set(get_groups_list(group))
+        for cache_name, group in CACHE_TARIFF_GROUPS.items()
+    }
+    result = {}
+    for service_type in services:
+        mask = 0
+        tariff_group = service_groups.get(service_type, _DEFAULT_TARIFF_GROUP)
+        for ix, cache_name in enumerate(CACHE_NAMES):
+            if cache_name in head_ids:
+                if service_type in head_ids[cache_name]:
+                    mask |= 1 << ix
+            elif tariff_group in groups[cache_name]:
+                mask |= 1 << ix
+        if service_type in communal_ids:
+            mask |= _COMMUNAL_SERVICES_BIT
+        result[service_type] = mask
+    return result
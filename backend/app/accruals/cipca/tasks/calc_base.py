@@ -14,6 +14,7 @@ from app.personnel.models.personnel import Worker
 from lib.dates import start_of_month, end_of_month, start_of_day
 from processing.models.billing.accrual import Accrual
 from app.accruals.models.accrual_document import AccrualDoc
+from app.accruals.tasks.caching import update_deleted_accruals_cache
 from processing.models.billing.responsibility import Responsibility
 from processing.models.choices import AccrualDocumentType
 
@@ -171,11 +172,15 @@ def tariff_plan_apply_func(author_id, doc_id, accounts_ids, sector,
                         'его нельзя использовать в расчёте.'
         }
     if not tp.get('tariffs', []):
-        Accrual.objects(__raw__={
+        accruals = Accrual.objects(__raw__={
             'doc._id': doc_id,
             'account._id': {'$in': accounts_ids},
             'sector_code': sector
-        }).delete()
+        })
+        deleted_ids = accruals.distinct('id')
+        accruals.delete()
+        # удалённые начисления уже не найти по ЛС - передаём их явно
+        update_deleted_accruals_cache(doc_id, sector, deleted_ids)
         doc.add_offsets_task(accounts_ids)
         return {'doc': None, 'result': 'deleted'}
     debts = []
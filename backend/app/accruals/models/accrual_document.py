@@ -277,6 +277,7 @@ class AccrualDoc(BindedModelMixin, Document):
         ProviderHouseGroupBinds,
         verbose_name='Привязки к группе домов и провайдеру'
     )
+    _HOUSE_BINDS_KEYS = ('house._id', None)
 
     CHANGEABLE_LOCK_FIELDS = {
         'status',
@@ -255,6 +255,7 @@ class CipcaTask(CommonAccrualTask):
                 cls.run_after_tasks(
                     task.extract_docs_ids(),
                     parent_task_id=task.parent,
+                    accounts_ids=task.extract_accounts_ids(),
                 )
         if state:
             timestamp = datetime.datetime.now()
@@ -287,9 +288,14 @@ class CipcaTask(CommonAccrualTask):
         return houses
 
     @classmethod
-    def run_after_tasks(cls, docs_ids, parent_task_id=None):
+    def run_after_tasks(cls, docs_ids, parent_task_id=None,
+                        accounts_ids=None):
         for doc_id in docs_ids:
-            update_accrual_doc_cache.delay(doc_id, parent_task_id)
+            update_accrual_doc_cache.delay(
+                doc_id,
+                parent_task_id,
+                accounts_ids=accounts_ids,
+            )
 
     def extract_accounts_ids(self):
         if self.account_id:
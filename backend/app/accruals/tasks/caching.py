@@ -1,16 +1,15 @@
-from app.accruals.cipca.caching.doc_sevice_groups import \
-    SERVICE_GROUP_CACHE_FUNCS, get_service_groups_by_pipca
+from app.accruals.cipca.caching.doc_cache import get_doc_cache_services
 from app.accruals.models.cache import (
     ReceiptAccrualCache,
     ReceiptsStatisticsCache,
 )
-from app.accruals.pipca.document import PipcaDocument
 from app.celery_admin.workers.config import celery_app
 from lib.dates import start_of_month
-from app.accruals.cipca.calculator.tariffs import get_groups_list
 from app.accruals.models.accrual_document import AccrualDoc
+from processing.models.billing.accrual import Accrual
 from settings import CELERY_SOFT_TIME_MODIFIER
-from app.caching.tasks.cache_update import update_house_accruals_cache
+from app.caching.tasks.cache_update import update_house_accruals_cache, \
+    update_house_accruals_cache_delta
 
 
 @celery_app.task(
@@ -19,83 +18,23 @@ from app.caching.tasks.cache_update import update_house_accruals_cache
     soft_time_limit=60 * 5 * CELERY_SOFT_TIME_MODIFIER,
     default_retry_delay=30
 )
-def update_accrual_doc_cache(self, doc_id, parent_task_id=None):
+def update_accrual_doc_cache(self, doc_id, parent_task_id=None,
+                             accounts_ids=None):
     AccrualDoc.objects(
         pk=doc_id,
     ).update(
         caching_wip=True,
     )
-    doc = PipcaDocument.load_doc(doc_id)
-    accruals = [d.doc_m for d in doc.debts]
-    st_groups = get_service_groups_by_pipca(doc)
-    cache_services = {
-        'housing': 0,
-        'other': 0,
-        'communal': 0,
-        'capital_repair': 0,
-        'cold_water': 0,
-        'hot_water': 0,
-        'heat_water_other': 0,
-        'heat': 0,
-        'electricity': 0,
-        'cold_water_public': 0,
-        'hot_water_public': 0,
-        'electricity_public': 0,
-        'waste_water': 0,
-        'gas': 0,
-        'communal_other_services': 0,
-        'penalties': 0,
-    }
-    services_funcs = SERVICE_GROUP_CACHE_FUNCS
-    cache_service_ids = {
-        'cold_water': services_funcs['cold_water'](doc),
-        'hot_water': services_funcs['hot_water'](doc),
-        'heat_water_other': services_funcs['heat_water'](doc),
-        'heat': services_funcs['heat'](doc),
-        'electricity': services_funcs['electricity'](doc),
-        'cold_water_public': services_funcs['cold_water_public'](doc),
-        'hot_water_public': services_funcs['hot_water_public'](doc),
-        'electricity_public': services_funcs['electricity_public'](doc),
-        'waste_water': services_funcs['waste_water'](doc),
-        'gas': services_funcs['gas'](doc),
-    }
-    communal_services = doc.get_services_by_head_type('communal_services')
-    cache_groups = {
-        'housing': get_groups_list(0),
-        'communal': get_groups_list(1),
-        'other': get_groups_list(2),
-        'capital_repair': get_groups_list(3),
-    }
-    all_communal = 0
-    for debt in accruals:
-        cache_services['penalties'] += debt['totals']['penalties']
-        for service in debt['services']:
-            # TODO: Удалить после миграции поля result
-            if 'result' not in service:
-                service['result'] = (
-                        service['value']
-                        + service['totals']['recalculations']
-                        + service['totals']['shortfalls']
-                        + service['totals']['privileges']
-                )
-
-            for cache_name, service_ids in cache_service_ids.items():
-                if service['service_type'] in service_ids:
-                    cache_services[cache_name] += service['result']
-            for cache_name, groups in cache_groups.items():
-                if st_groups.get(service['service_type'], 2) in groups:
-                    cache_services[cache_name] += service['result']
-            if service['service_type'] in communal_services:
-                all_communal += service['result']
-    cache_services['communal_other_services'] = (
-            cache_services['communal']
-            - all_communal
-    )
-    cache_services['heat_water_other'] = (
-            cache_services['heat_water_other']
-            - cache_services['hot_water']
-            - cache_services['hot_water_public']
-    )
+    doc = AccrualDoc.objects(
+        pk=doc_id,
+    ).only(
+        'id',
+        'house',
+        'date_from',
+        'tariff_plan',
+        'sector_binds',
+    ).get()
+    cache_services = get_doc_cache_services(doc)
     AccrualDoc.objects(
         pk=doc_id,
     ).update(
@@ -106,12 +45,54 @@ def update_accrual_doc_cache(self, doc_id, parent_task_id=None):
         from app.accruals.models.tasks import HousesCalculateTask
         HousesCalculateTask.check_caching_state(parent_task_id)
     resum_services(doc_id)
-    for bind in doc.doc_m.sector_binds:
+    for bind in doc.sector_binds:
+        if accounts_ids:
+            # пересчитаны отдельные ЛС - достаточно дельты по их начислениям
+            accruals_ids = Accrual.objects(
+                doc__id=doc_id,
+                account__id__in=list(accounts_ids),
+                sector_code=bind.sector_code,
+            ).distinct('id')
+            update_house_accruals_cache_delta.delay(
+                provider_id=bind.provider,
+                house_id=doc.house.id,
+                month=start_of_month(doc.date_from),
+                sector=bind.sector_code,
+                accruals_ids=accruals_ids,
+            )
+            continue
         update_house_accruals_cache.delay(
             provider_id=bind.provider,
-            house_id=doc.doc_m.house.id,
-            month=start_of_month(doc.doc_m.date_from),
+            house_id=doc.house.id,
+            month=start_of_month(doc.date_from),
+            sector=bind.sector_code,
+        )
+
+
+def update_deleted_accruals_cache(doc_id, sector, accruals_ids):
+    """
+    Вычитает из кэша суммарных начислений по дому вклад удалённых
+    начислений документа. Пропущенное сверит ночная пересборка
+    """
+    if not accruals_ids:
+        return
+    doc = AccrualDoc.objects(
+        pk=doc_id,
+    ).only(
+        'id',
+        'house',
+        'date_from',
+        'sector_binds',
+    ).get()
+    for bind in doc.sector_binds:
+        if bind.sector_code != sector:
+            continue
+        update_house_accruals_cache_delta.delay(
+            provider_id=bind.provider,
+            house_id=doc.house.id,
+            month=start_of_month(doc.date_from),
             sector=bind.sector_code,
+            accruals_ids=accruals_ids,
         )
 
 
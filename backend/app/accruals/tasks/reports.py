@@ -119,7 +119,12 @@ def _get_parent_calc_tasks_info(fias_tree, fias_code, month):
     if not fias_code:
         return []
     fias_addrobjs = []
-    fill_fias_parents_by_aoguid(fias_tree['tree'], fias_code, fias_addrobjs)
+    fill_fias_parents_by_aoguid(
+        fias_tree['tree'],
+        fias_code,
+        fias_addrobjs,
+        fias_tree.get('paths'),
+    )
     return _get_calc_tasks_info_by_adrobjs(fias_addrobjs, month)
 
 
@@ -196,7 +201,7 @@ def _get_fias_tree(provider_id):
 
 def _get_fias_children_and_houses(tree, fias):
     if fias:
-        node = find_branch_by_aoguid(tree['tree'], fias)
+        node = find_branch_by_aoguid(tree['tree'], fias, tree.get('paths'))
     else:
         node = {
             'inheritors': tree['tree'],
@@ -5,6 +5,7 @@ from processing.data_producers.associated.base import get_binded_houses
 from app.house.models.house import House
 from app.area.models.area import Area
 from processing.models.billing.account import Tenant
+from processing.models.billing.binds_resolver import HOUSE_GROUPS
 from processing.models.billing.house_group import HouseGroup
 from app.admin.core.data_restore.base import DataRestore
 from processing.models.billing.responsibility import Responsibility
@@ -26,6 +27,11 @@ class HouseGroupsDataRestore(DataRestore):
         (HouseGroup, 'provider'),
     ]
 
+    def _restore_data_element(self, el, source_id):
+        super()._restore_data_element(el, source_id)
+        # группы домов записаны в обход модели - сбросим карту групп
+        HOUSE_GROUPS.invalidate()
+
 
 def restore_house_data(house_id, batch_size=None, host='10.1.1.221'):
     restorer = HouseDataRestore(
@@ -383,6 +383,7 @@ class Area(Document, BindedModelMixin):
         HouseGroupBinds,
         verbose_name='Привязки к группе домов'
     )
+    _HOUSE_BINDS_KEYS = ('house._id', '_id')
 
     rosreestr = EmbeddedDocumentField(
         RosreestrParams,
@@ -525,10 +526,14 @@ class Area(Document, BindedModelMixin):
         else:
             denormalize_fields = self._has_foreign_denormalizing_changes()
         rosreestr_data_changed = self._check_cad_numbers()
+        filter_data_changed = self._is_triggers(self._FILTER_DATA_FIELDS)
         result = super().save(*args,  **kwargs)
         if denormalize_fields:
             for field in denormalize_fields:
                 self._foreign_denormalize(field)
+        if filter_data_changed:
+            from app.caching.models.filters import FilterDataVersion
+            FilterDataVersion.bump(self.house.id)
         if rosreestr_data_changed:
             from app.rosreestr.model.tasks import RosreestrAreaExchangeTask
             no_sq = 'cadastral_number' in rosreestr_data_changed
@@ -598,12 +603,20 @@ class Area(Document, BindedModelMixin):
         '_type',
     ]
 
+    _FILTER_DATA_FIELDS = [
+        'house',
+        'porch',
+        'has_lift',
+        'rooms',
+    ]  # поля, по которым фильтруются жители (FilterDataVersion)
+
     def _has_foreign_denormalizing_changes(self):
         return self._is_triggers(self._FOREIGN_DENORMALIZE_FIELDS)
 
     def _foreign_denormalize(self, field):
-        from app.caching.tasks.denormalization import foreign_denormalize_data
-        foreign_denormalize_data.delay(
+        from app.caching.tasks.denormalization import \
+            schedule_foreign_denormalize
+        schedule_foreign_denormalize(
             model_from=Area,
             field_name=field,
             object_id=self.pk,
@@ -2,10 +2,11 @@ from datetime import datetime
 
 from api.v4.authentication import RequestAuth
 from api.v4.serializers import PrimaryKeySerializer
-from app.caching.core.accounts_filter import filter_accounts
+from app.caching.core.accounts_filter import filter_accounts, \
+    get_filter_params_hash
 from api.v4.viewsets import BaseLoggedViewSet
 from app.caching.api.v4.serializers import AccrualFilterSerializer
-from app.caching.models.filters import FilterCache
+from app.caching.models.filters import FilterCache, FilterDataVersion
 from app.caching.tasks.cache_update import prepare_filter_cache
 from processing.models.billing.accrual import Accrual
 from processing.models.billing.account import Tenant
@@ -20,6 +21,28 @@ class AccrualFilterViewSet(BaseLoggedViewSet):
         del serializer.validated_data['house']
         request_auth = RequestAuth(request)
         binds = request_auth.get_binds()
+        provider_id = request_auth.get_provider_id()
+        # начисления не версионируются - фильтр с документом не переиспользуем
+        reusable = not serializer.validated_data.get('accrual_doc')
+        params_hash = get_filter_params_hash(
+            serializer.validated_data,
+            house=house_id,
+            binds=binds,
+        )
+        data_version = FilterDataVersion.get_version(house_id)
+        if reusable:
+            prepared = FilterCache.find_prepared(
+                provider_id,
+                params_hash,
+                data_version,
+            )
+            if prepared:
+                return self.json_response(
+                    {
+                        'filter_id': prepared['_id'],
+                        'count': len(prepared['objs']),
+                    },
+                )
         filtered_accounts = filter_accounts(
             accounts_ids=None,
             house_id=house_id,
@@ -40,13 +63,14 @@ class AccrualFilterViewSet(BaseLoggedViewSet):
         else:
             purpose = ''
             extra_keys = {}
-        request_auth = RequestAuth(request)
         filter_cache = FilterCache(
-            provider=request_auth.get_provider_id(),
+            provider=provider_id,
             objs=filtered_accounts,
             purpose=purpose,
             extra=extra_keys,
             used=datetime.now(),
+            params_hash=params_hash if reusable else None,
+            data_version=data_version,
         )
         filter_cache.save()
         if purpose:
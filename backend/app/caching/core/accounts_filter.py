@@ -1,12 +1,14 @@
 import copy
+import hashlib
+import json
+from collections import defaultdict
 from datetime import datetime
 
 from dateutil.relativedelta import relativedelta
 
-from mongoengine import Q
-
 from app.area.models.area import Area
 from app.caching.core.utils import parse_str_number_list, parse_number_list
+from app.caching.models.filters import FilterDataVersion
 from app.house.models.house import House
 from app.meters.models.meter import AreaMeter
 
@@ -15,6 +17,25 @@ from lib.dates import start_of_month
 from processing.models.billing.account import Tenant
 from processing.models.billing.coefficient import Coefficient
 
+_METER_FILTERS = (
+    ('cold_water_meter', ('ColdWaterAreaMeter',)),
+    ('hot_water_meter', ('HotWaterAreaMeter',)),
+    ('gas_meter', ('GasRateAreaMeter',)),
+    (
+        'electric_meter',
+        (
+            'ElectricOneRateAreaMeter',
+            'ElectricTwoRateAreaMeter',
+            'ElectricThreeRateAreaMeter',
+        ),
+    ),
+    ('heat_meter', ('HeatAreaMeter',)),
+)
+_AREA_FILTERS = ('lift', 'radio', 'antenna', *(f for f, _ in _METER_FILTERS))
+# индексы домов, построенные в процессе: {house_id: HouseFilterIndex}
+_HOUSE_INDEXES = {}
+_HOUSE_INDEXES_LIMIT = 256
+
 
 def filter_accounts(
         accounts_ids,
@@ -25,8 +46,34 @@ def filter_accounts(
         date_from=None,
         for_report=False
 ):
+    """
+    Фильтрация лицевых счетов. Всё, что можно, выполняется запросом в базу,
+    фильтры по помещениям (подъезды, лифт, антенна, радио, счётчики) -
+    пересечением множеств по индексу дома, коэффициенты и признаки - по
+    уже загруженным данным лицевых счетов
+    """
     if not date_on:
         date_on = datetime.now()
+    params = compile_filter_params(filter_params)
+    account_data = _get_accounts(
+        params,
+        accounts_ids,
+        house_id,
+        binds,
+        for_report,
+    )
+    # Фильтруем лицевые счета по параметрам помещений
+    account_data = _filter_by_house_indexes(params, account_data, date_on)
+    # Фильтрация по признаку квартиры
+    account_data = _filter_by_area_sign(
+        params, account_data, date_on, date_from,
+    )
+    # Фильтрация по коэффициенту квартиры
+    account_data = _filter_by_area_coefficient(params, account_data, date_on)
+    return list(account_data)
+
+
+def compile_filter_params(filter_params):
     params = copy.copy(filter_params)
     if params.get('areas_str'):
         params['areas_list'] = parse_str_number_list(params['areas_str'])
@@ -36,30 +83,184 @@ def filter_accounts(
         params['porches_list'] = parse_number_list(params['porches_str'])
     else:
         params['porches_list'] = None
-    account_data = _get_accounts(params, accounts_ids, house_id, binds)
-    # Фильтруем по льготникам, если требуется
-    if params.get('only_privileged'):
-        # TODO: Костыль, который позволяет отделить фильтрацию по льготникам в
-        #  отчетах от фильтрации в создании начислений
-        account_data = _filter_by_privileges(params, account_data, for_report)
-    # Фильтруем лицевые счета по подъездам
-    account_data = _filter_by_porches_and_area_params(
-        params,
-        account_data,
-        date_on,
-    )
-    # Фильтрация по ЛС по счетчикам
-    account_data = _filter_by_meters(params, account_data, date_on)
-    # Фильтрация по признаку квартиры
-    account_data = _filter_by_area_sign(params, account_data, date_on, date_from)
-    # Фильтрация по коэффициенту квартиры
-    account_data = _filter_by_area_coefficient(params, account_data, date_on)
-    return list(account_data)
+    return params
+
+
+def get_filter_params_hash(filter_params, **extra):
+    """
+    Хэш параметров фильтра для поиска ранее построенного FilterCache
+    """
+    data = {**filter_params, **extra}
+    dump = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.md5(dump.encode()).hexdigest()
+
+
+def get_house_filter_index(house_id):
+    """
+    Индекс дома для фильтрации. Перестраивается при изменении версии
+    данных дома (FilterDataVersion)
+    """
+    version = FilterDataVersion.get_version(house_id)
+    index = _HOUSE_INDEXES.get(house_id)
+    if index is None or index.version != version:
+        if len(_HOUSE_INDEXES) >= _HOUSE_INDEXES_LIMIT:
+            _HOUSE_INDEXES.clear()
+        index = HouseFilterIndex(house_id, version)
+        _HOUSE_INDEXES[house_id] = index
+    return index
 
 
-def _get_accounts(params, accounts_ids, house_id, binds):
+class HouseFilterIndex:
     """
-    Подтягиваем данные аккаунтов
+    Предрассчитанные множества помещений дома: по подъездам, лифту,
+    истории антенн и радиоточек и типам счётчиков
+    """
+
+    def __init__(self, house_id, version=0):
+        self.house_id = house_id
+        self.version = version
+        house = House.objects(pk=house_id).only('porches').as_pymongo().first()
+        porch_numbers = {
+            p['_id']: p.get('number')
+            for p in (house or {}).get('porches', [])
+        }
+        self.porch_areas = defaultdict(set)  # номер подъезда: {area_id}
+        self.lift_areas = set()
+        self.areas = set()
+        # area_id: {'radio_count': [(дата, сумма по комнатам), ...]}
+        self.devices = {}
+        areas = Area.objects(
+            house__id=house_id,
+        ).only(
+            'id',
+            'porch',
+            'has_lift',
+            'rooms.radio_count',
+            'rooms.antenna_count',
+        ).as_pymongo()
+        for area in areas:
+            self.areas.add(area['_id'])
+            if area.get('porch') in porch_numbers:
+                self.porch_areas[porch_numbers[area['porch']]].add(
+                    area['_id'],
+                )
+            if area.get('has_lift'):
+                self.lift_areas.add(area['_id'])
+            for device_type in ('radio_count', 'antenna_count'):
+                devices = self._sum_devices(area, device_type)
+                if devices:
+                    self.devices.setdefault(area['_id'], {})[device_type] = \
+                        devices
+        # тип счётчика: {area_id: [дата окончания учёта или None, ...]}
+        self.meters = defaultdict(lambda: defaultdict(list))
+        meters = AreaMeter.objects(
+            area__house__id=house_id,
+            is_deleted__ne=True,
+        ).only(
+            'area.id',
+            '_type',
+            'working_finish_date',
+        ).as_pymongo()
+        for meter in meters:
+            for meter_type in meter['_type']:
+                if meter_type == 'AreaMeter':
+                    continue
+                self.meters[meter_type][meter['area']['_id']].append(
+                    meter.get('working_finish_date'),
+                )
+
+    @staticmethod
+    def _sum_devices(area, device_type):
+        """
+        Значения устройств, просуммированные по комнатам за одну дату,
+        в порядке дат
+        """
+        values = defaultdict(int)
+        for room in area.get('rooms') or []:
+            for device in room.get(device_type) or []:
+                values[device['date']] += device['value']
+        return sorted(values.items())
+
+    def areas_by_porches(self, porch_numbers):
+        result = set()
+        for number in porch_numbers:
+            result |= self.porch_areas.get(number, set())
+        return result
+
+    def areas_by_lift(self, has_lift):
+        if has_lift:
+            return self.lift_areas
+        return self.areas - self.lift_areas
+
+    def areas_by_device(self, device_type, has_device, date_on):
+        """
+        Помещения, где на дату (по ближайшей меньшей дате истории)
+        наличие устройства совпадает с требуемым
+        """
+        with_device = set()
+        for area_id, devices in self.devices.items():
+            values = [v for d, v in devices.get(device_type, []) if d < date_on]
+            if values and values[-1] > 0:
+                with_device.add(area_id)
+        if has_device:
+            return with_device
+        return self.areas - with_device
+
+    def areas_with_meter_types(self, meter_types, date_on):
+        """
+        Помещения, где есть действующий на дату счётчик одного из типов
+        """
+        result = set()
+        for meter_type in meter_types:
+            for area_id, finish_dates in self.meters[meter_type].items():
+                if any(d is None or d >= date_on for d in finish_dates):
+                    result.add(area_id)
+        return result
+
+    def filter_areas(self, params, date_on):
+        """
+        Множество помещений дома, подходящих под фильтры по помещениям
+        """
+        areas = self.areas
+        if params.get('porches_list'):
+            areas = areas & self.areas_by_porches(params['porches_list'])
+        if params.get('lift') is not None:
+            areas = areas & self.areas_by_lift(params['lift'])
+        if params.get('radio') is not None:
+            areas = areas & self.areas_by_device(
+                'radio_count',
+                params['radio'],
+                date_on,
+            )
+        if params.get('antenna') is not None:
+            areas = areas & self.areas_by_device(
+                'antenna_count',
+                params['antenna'],
+                date_on,
+            )
+        for filter_name, meter_types in _METER_FILTERS:
+            has_meter = params.get(filter_name)
+            if has_meter is None:
+                continue
+            if has_meter:
+                # должны быть счётчики каждого из требуемых типов
+                for meter_type in meter_types:
+                    areas = areas & self.areas_with_meter_types(
+                        (meter_type,),
+                        date_on,
+                    )
+            else:
+                areas = areas - self.areas_with_meter_types(
+                    meter_types,
+                    date_on,
+                )
+        return areas
+
+
+def _get_accounts(params, accounts_ids, house_id, binds, for_report=False):
+    """
+    Подтягиваем данные аккаунтов, применяя фильтры, которые выполнимы
+    запросом в базу
     :param accounts_ids: list
     :return: list
     """
@@ -87,206 +288,43 @@ def _get_accounts(params, accounts_ids, house_id, binds):
         account_query.update({
             'area.str_number': {'$in': params.get('areas_list')}
         })
+    # Фильтруем по льготникам, если требуется
+    if params.get('only_privileged'):
+        # TODO: Костыль, который позволяет отделить фильтрацию по льготникам в
+        #  отчетах от фильтрации в создании начислений
+        account_query.update(_get_privileges_query(params, for_report))
+    fields = ['id', 'area.id', 'area.house.id', 'short_name', 'str_name',
+              'number']
+    if params.get('feat') is not None or params.get('coef') is not None:
+        fields.append('coefs')
     account_data = Tenant.objects(
         __raw__=account_query,
     ).only(
-        'id',
-        'area',
-        'coefs',
-        'short_name',
-        'str_name',
-        'number',
-        'phones',
+        *fields,
     ).as_pymongo()
 
     return list(account_data)
 
 
-def _extract_devices(area, device_type, date_on):
+def _filter_by_house_indexes(params, account_data, date_on):
     """
-    Извлекаем все радио/антенны из комнат,
-    которые удовлетворяют дате и сортируем
-    :param area: квартира
-    :param device_type: варианты: antenna_count / radio_count
-    :return: сортированный список значений
-    """
-    # Извлекаем все радио из комнат,
-    # которые удовлетворяют дате,
-    # сортируем и берем ближайшую последнюю
-    devices = [radio for room in area.get('rooms', [])
-               for radio in room.get(device_type, [])
-               if radio['date'] < date_on]
-    if not devices:
-        return
-    # Суммируем значения value по комнатам за одну и ту же дату
-    devices = list(
-        map(lambda date: dict(date=date,
-                              value=sum([v['value']
-                                         for v in devices
-                                         if v['date'] == date])),
-            list(set([x['date'] for x in devices])))
-    )
-    devices.sort(key=lambda x: x['date'])
-    return devices
-
-
-def _filter_by_porches_and_area_params(params, account_data, date_on):
-    """
-    Фильтрация ЛС по подъездам, лифту, антенне, радио
+    Фильтрация ЛС по параметрам помещений через индексы домов
     :param account_data: list - лицевые счета
-    :return: list - отфильтрованный по подъездам список ЛС
-    """
-
-    area_attributes = any([
-        True
-        for x in (
-            params.get('lift'),
-            params.get('radio'),
-            params.get('antenna')
-        )
-        if x is not None
-    ])
-    if not params.get('porches_list') and not area_attributes:
-        return account_data
-
-    area_query = Q(id__in=[x['area']['_id'] for x in account_data])
-
-    # Если нужен фильтр по подъездам
-    if params.get('porches_list'):
-        house = House.objects(pk=params.get('house')).get()
-        porches_ids = [
-            x.id
-            for x in house.porches
-            if x.number in params.get('porches_list')
-        ]
-        area_query &= Q(porch__in=porches_ids)
-
-    # Фильтр по лифту
-    if params.get('lift') is not None:
-        area_query &= Q(has_lift=params.get('lift'))
-
-    filtered_areas = Area.objects(area_query).only(
-        'id', 'rooms', 'has_lift'
-    ).as_pymongo()
-
-    # Применим фильтры по антенне и радио по offsets_date_to или
-    # ближайшей меньшей дате
-    if params.get('radio') is not None or params.get('antenna') is not None:
-        # Айди будущих подошедших квартир
-        radio_filter, antenna_filter = set(), set()
-        has_radio_query = params.get('radio')
-        has_antenna_query = params.get('antenna')
-        for area in filtered_areas:
-            if has_radio_query is not None:
-                # Извлекаем все радио из комнат,
-                # которые удовлетворяют дате,
-                # сортируем и берем ближайшую последнюю
-                radios = _extract_devices(area, 'radio_count', date_on)
-                has_radio = False if not radios else radios[-1]['value'] > 0
-                if has_radio is has_radio_query:
-                    radio_filter.add(area['_id'])
-            if has_antenna_query is not None:
-                # Извлекаем все антенны из комнат,
-                # которые удовлетворяют дате,
-                # сортируем и берем ближайшую последнюю
-                antennas = _extract_devices(area, 'antenna_count', date_on)
-                has_antenna = False if not antennas \
-                    else antennas[-1]['value'] > 0
-                if has_antenna is has_antenna_query:
-                    antenna_filter.add(area['_id'])
-        # Фильтруем
-        if has_antenna_query is None and has_radio_query is not None:
-            additional_filters = radio_filter
-        elif has_antenna_query is not None and has_radio_query is None:
-            additional_filters = antenna_filter
-        else:
-            additional_filters = radio_filter & antenna_filter
-        account_data = [x for x in account_data
-                        if x['area']['_id'] in additional_filters]
-    else:
-        filtered_areas = [x['_id'] for x in filtered_areas]
-        account_data = [x for x in account_data
-                        if x['area']['_id'] in filtered_areas]
-    return account_data
-
-
-def _filter_by_meters(params, account_data, date_on):
+    :return: list - отфильтрованный список ЛС
     """
-    Фильтрация ЛС по наличию счетчиков определенного типа
-    :param account_data: list
-    :return: list: измененный account_data
-    """
-    meter_types = (
-        (params.get('cold_water_meter'), ['ColdWaterAreaMeter']),
-        (params.get('hot_water_meter'), ['HotWaterAreaMeter']),
-        (params.get('gas_meter'), ['GasRateAreaMeter']),
-        (
-            params.get('electric_meter'),
-            [
-                'ElectricOneRateAreaMeter',
-                'ElectricTwoRateAreaMeter',
-                'ElectricThreeRateAreaMeter',
-            ],
-        ),
-        (params.get('heat_meter'), ['HeatAreaMeter'])
-    )
-    # Если хотя бы один есть из фильтров
-    if not any([True for x in meter_types if x[0] is not None]):
+    if (
+            not params.get('porches_list')
+            and all(params.get(f) is None for f in _AREA_FILTERS)
+    ):
         return account_data
-
-    # Формирование запроса по фильтру + только активные счетчики
-    # (working_finish_date которых больше текущей даты или не задан)
-    meters_query = (
-            Q(area__id__in=[x['area']['_id'] for x in account_data])
-            & Q(is_deleted__ne=True)
-            & (Q(working_finish_date__gte=date_on)
-               | Q(working_finish_date=None))
-    )
-    is_true = []
-    is_false = []
-    for is_type, type_list in meter_types:
-        if is_type is True:
-            is_true.extend(type_list)
-        elif is_type is False:
-            is_false.extend(type_list)
-
-    meters_filter = AreaMeter.objects(
-        meters_query).only('area.id', '_type').as_pymongo()
-    # Собираем типы счетчиков для каждой квартиры
-    area_meter_groups = {}
-    for meter in meters_filter:
-        area_group = area_meter_groups.setdefault(meter['area']['_id'], [])
-        meter['_type'].remove('AreaMeter')
-        if meter['_type'][0] not in area_group:
-            area_group.extend(meter['_type'])
-
-    def meter_type_filter(area_id):
-        """
-        Проверяем, что типы счетчиков в квартире удовлетворяют фильтру
-        :param area_id: id квартиры
-        :return: bool
-        """
-        # Список типов счетчиков квартиры
-        a_meter_types = area_meter_groups.get(area_id, [])
-        if is_true:
-            # Убедимся, что все счетчики из требуемого листа
-            # входят в квартиру
-            if not all(map(lambda x: x in a_meter_types, is_true)):
-                return False
-        if is_false:
-            # Убедимся, что ни один счетчик квартиры
-            # не входит в запрещенный лист
-            if any(map(lambda x: x in a_meter_types, is_false)):
-                return False
-        return True
-
-    # Фильтруем ЛС
-    account_data = [
-        x for x in account_data
-        if meter_type_filter(x['area']['_id'])
-    ]
-
-    return account_data
+    houses = {a['area']['house']['_id'] for a in account_data}
+    areas = set()
+    for house_id in houses:
+        areas |= get_house_filter_index(house_id).filter_areas(
+            params,
+            date_on,
+        )
+    return [x for x in account_data if x['area']['_id'] in areas]
 
 
 def _filter_by_sign_or_coefficient(account_data,
@@ -426,9 +464,8 @@ def _filter_by_area_coefficient(params, account_data, date_on):
     )
 
 
-def _filter_by_privileges(params, account_data, for_report=False):
-    account_ids = [account['_id'] for account in account_data]
-    query = {'_id': {'$in': account_ids}, 'is_privileged': True}
+def _get_privileges_query(params, for_report=False):
+    query = {'is_privileged': True}
     if not for_report:
         date_from = params.get('date_from')
         date_till = params.get('date_till')
@@ -454,8 +491,4 @@ def _filter_by_privileges(params, account_data, for_report=False):
                 }
             }
         )
-    tenants = Tenant.objects(__raw__=query).as_pymongo().distinct('id')
-    account_data = [
-        account for account in account_data if account['_id'] in tenants
-    ]
-    return account_data
+    return query
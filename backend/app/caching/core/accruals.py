@@ -87,7 +87,37 @@ def get_house_accruals_by_aggregate(provider_id, house_id, month, sector):
     return accruals
 
 
+ACCRUALS_CACHE_FILTERS = ('all', 'no_developer', 'not_run')
+_CONTRIBUTION_FIELDS = (
+    'account.id',
+    'services.service_type',
+    'services.value',
+    'services.totals.recalculations',
+    'services.totals.shortfalls',
+    'services.totals.privileges',
+    'services.consumption',
+    'services.tariff',
+    'totals.penalties',
+    'doc.status',
+    'is_deleted',
+)
+
+
 def get_house_accruals(provider_id, house_id, month, sector):
+    contributions = get_house_accruals_contributions(
+        provider_id,
+        house_id,
+        month,
+        sector,
+    )
+    return sum_accruals_contributions(contributions.values())
+
+
+def get_house_accruals_contributions(provider_id, house_id, month, sector):
+    """
+    Вклад каждого начисления дома в кэш суммарных начислений.
+    Возвращает словарь {id начисления: вклад}
+    """
     # получаем жителей дома
     tenants = Account.objects(
         area__house__id=house_id,
@@ -109,67 +139,140 @@ def get_house_accruals(provider_id, house_id, month, sector):
     ).hint(
         'account.area.house._id_1_month_1',
     ).as_pymongo().only(
-        'account.id',
-        'services.service_type',
-        'services.value',
-        'services.totals.recalculations',
-        'services.totals.shortfalls',
-        'services.totals.privileges',
-        'services.consumption',
-        'services.tariff',
-        'totals.penalties',
-        'doc.status',
+        *_CONTRIBUTION_FIELDS,
     )
-
-    def sum_dict(result_dict, service):
-        data = result_dict['services'].setdefault(
-            service['service_type'],
-            {
-                't': 0,
-                'd': 0,
-                'v': 0,
-                'r': 0,
-                'p': 0,
-                's': 0,
-                'c': 0,
-                'tar': set(),
-            },
-        )
-        total = (
-                service['value']
-                + service['totals']['recalculations']
-                + service['totals']['shortfalls']
-                + service['totals']['privileges']
+    return {
+        a['_id']: get_accrual_contribution(
+            a,
+            tenants.get(a['account']['_id'], {}).get('is_developer'),
         )
-        data['t'] += total
-        if total > 0:
-            data['d'] += total
-        data['v'] += service['value']
-        data['r'] += service['totals']['recalculations']
-        data['p'] += service['totals']['privileges']
-        data['s'] += service['totals']['shortfalls']
-        data['c'] += service['consumption']
-        data['tar'].add(service['tariff'])
-
-    result_all = {'services': {}, 'penalties': 0}
-    result_no_dev = {'services': {}, 'penalties': 0}
-    result_not_run = {'services': {}, 'penalties': 0}
+        for a in accruals
+    }
+
+
+def get_accruals_contributions(accruals_ids):
+    """
+    Текущий вклад перечисленных начислений в кэш суммарных начислений.
+    Удалённые начисления получают пустой вклад
+    """
+    accruals = list(
+        Accrual.objects(
+            pk__in=accruals_ids,
+        ).as_pymongo().only(
+            *_CONTRIBUTION_FIELDS,
+        ),
+    )
+    tenants = Account.objects(
+        pk__in=list({a['account']['_id'] for a in accruals}),
+    ).as_pymongo().only(
+        'id',
+        'is_developer',
+    )
+    tenants = {t['_id']: t for t in tenants}
+    result = {a_id: _empty_contribution() for a_id in accruals_ids}
     for a in accruals:
-        if a['doc']['status'] == 'wip':
-            for s in a['services']:
-                sum_dict(result_not_run, s)
-            result_not_run['penalties'] += a['totals']['penalties']
+        if a.get('is_deleted'):
             continue
-        for s in a['services']:
-            sum_dict(result_all, s)
-        result_all['penalties'] += a['totals']['penalties']
-        if not tenants[a['account']['_id']].get('is_developer'):
-            for s in a['services']:
-                sum_dict(result_no_dev, s)
-            result_no_dev['penalties'] += a['totals']['penalties']
+        result[a['_id']] = get_accrual_contribution(
+            a,
+            tenants.get(a['account']['_id'], {}).get('is_developer'),
+        )
+    return result
+
+
+def get_accrual_contribution(accrual, is_developer):
+    """
+    Вклад одного начисления: в какие фильтры по жителям оно попадает,
+    суммы по услугам и пени
+    """
+    if accrual['doc']['status'] == 'wip':
+        filters = ['not_run']
+    elif is_developer:
+        filters = ['all']
+    else:
+        filters = ['all', 'no_developer']
+    result = _empty_contribution()
+    result['filters'] = filters
+    result['penalties'] = accrual['totals']['penalties']
+    for service in accrual['services']:
+        _sum_service(result, service)
+    return result
+
+
+def sum_accruals_contributions(contributions):
+    result = {
+        filter_name: {'services': {}, 'penalties': 0}
+        for filter_name in ACCRUALS_CACHE_FILTERS
+    }
+    for contribution in contributions:
+        for filter_name in contribution['filters']:
+            _add_contribution(result[filter_name], contribution)
+    return result
+
+
+def get_accruals_contributions_delta(contributions_before,
+                                     contributions_after):
+    """
+    Разница кэша суммарных начислений по фильтрам между старым и новым
+    вкладом начислений. Тарифы из дельты не вычитаются - лишние тарифы
+    убирает полная пересборка кэша
+    """
+    result = sum_accruals_contributions(contributions_after)
+    for contribution in contributions_before:
+        for filter_name in contribution['filters']:
+            _add_contribution(result[filter_name], contribution, sign=-1)
+    return result
+
+
+def _empty_contribution():
+    return {'filters': [], 'services': {}, 'penalties': 0}
+
+
+def _empty_service_sums():
     return {
-        'all': result_all,
-        'no_developer': result_no_dev,
-        'not_run': result_not_run,
+        't': 0,
+        'd': 0,
+        'v': 0,
+        'r': 0,
+        'p': 0,
+        's': 0,
+        'c': 0,
+        'tar': set(),
     }
 
+
+def _sum_service(result_dict, service):
+    data = result_dict['services'].setdefault(
+        service['service_type'],
+        _empty_service_sums(),
+    )
+    total = (
+            service['value']
+            + service['totals']['recalculations']
+            + service['totals']['shortfalls']
+            + service['totals']['privileges']
+    )
+    data['t'] += total
+    if total > 0:
+        data['d'] += total
+    data['v'] += service['value']
+    data['r'] += service['totals']['recalculations']
+    data['p'] += service['totals']['privileges']
+    data['s'] += service['totals']['shortfalls']
+    data['c'] += service['consumption']
+    data['tar'].add(service['tariff'])
+
+
+def _add_contribution(result_dict, contribution, sign=1):
+    result_dict['penalties'] += sign * contribution['penalties']
+    for s_type, values in contribution['services'].items():
+        data = result_dict['services'].setdefault(
+            s_type,
+            _empty_service_sums(),
+        )
+        for key, value in values.items():
+            if key == 'tar':
+                if sign > 0:
+                    data['tar'].update(value)
+            else:
+                data[key] += sign * value
@@ -0,0 +1,37 @@
+import redis
+
+import settings
+
+
+class CacheRedisClient:
+    """
+    Клиент Redis общих для процессов кэшей.
+
+    Кэши хранятся отдельно от очередей брокера Celery: сервер
+    CACHE_REDIS_URL, база CACHE_REDIS_DB. Подключение создается
+    при первом обращении
+    """
+
+    def __init__(self, redis_url=None, db_num=None):
+        self.redis_url = redis_url or settings.CACHE_REDIS_URL
+        self.db_num = settings.CACHE_REDIS_DB if db_num is None else db_num
+        self._redis = None
+
+    @property
+    def redis(self) -> redis.StrictRedis:
+        if self._redis is None:
+            self.set_redis_client()
+        return self._redis
+
+    def set_redis_client(self):
+        """Клиент редиса базы кэшей"""
+        redis_host = self.redis_url.replace('redis://', '').split('/')[0]
+        data = redis_host.split(':')
+        self._redis = redis.StrictRedis(
+            host=data[0],
+            port=int(data[1]) if len(data) > 1 else 6379,
+            db=self.db_num,
+        )
+
+
+CACHE_REDIS = CacheRedisClient()
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 _SUFFIXES = ['Н', 'П', '']
 
 
@@ -7,6 +9,12 @@ def parse_str_number_list(number_list, max_number=10000):
     Допускает использование диапозонов.
         '1,2,3,4,5-20,60-67,80П,81Н,90-95П,100-120Н'
     """
+    return list(_parse_str_numbers(number_list, max_number))
+
+
+@lru_cache(maxsize=1024)
+def _parse_str_numbers(number_list, max_number):
+    """Номера строки (разбираются один раз на строку)"""
     numbers = set()
 
     try:
@@ -29,7 +37,7 @@ def parse_str_number_list(number_list, max_number=10000):
     except (IndexError, ValueError):
         raise ValueError('Неверный формат списка номеров')
 
-    return list(numbers)
+    return frozenset(numbers)
 
 
 def parse_number_list(number_list, max_number=10000):
@@ -1,3 +1,4 @@
+import bisect
 import datetime
 
 from bson import ObjectId
@@ -24,6 +25,12 @@ class AccountFiasTree(Document):
                              verbose_name='Ссылка на организацию')
     account = ObjectIdField(verbose_name='Ссылка на на работника')
     tree = ListField(DictField(verbose_name='Дерево ФИАСа для работника/орг.'))
+    paths = DictField(
+        verbose_name='Индекс узлов: AOGUID -> путь AOGUID от корня дерева',
+    )
+    houses_index = DictField(
+        verbose_name='Индекс домов: ид дома -> AOGUID улицы',
+    )
     updated = DateTimeField()
 
     @classmethod
@@ -44,6 +51,12 @@ class AccountFiasTree(Document):
         Метод находит все дома организации и строит дерево,
         если передан, то дерево строится для него
         """
+        self.build_tree(self.get_houses())
+
+    def get_houses(self):
+        """
+        Дома организации или, если передан работник, дома из его прав
+        """
         houses_ids = get_binded_houses(self.provider)
         # Поиск домов работника в правах
         if self.account:
@@ -68,7 +81,7 @@ class AccountFiasTree(Document):
         else:
             houses = houses_ids
         self.__houses = houses
-        self.build_tree(houses)
+        return houses
 
     def build_tree(self, houses_id):
         """
@@ -99,17 +112,7 @@ class AccountFiasTree(Document):
         street_guid_list = list({x['fias_street_guid'] for x in houses})
 
         # упорядочивание
-        def get_order(str_num):
-            if str_num.isdigit():
-                return str_num.zfill(5)
-            else:
-                return '10000{}'.format(str_num)
-
-        houses = sorted(houses, key=lambda i: (
-            get_order(i.get('number') or ''),
-            get_order(i.get('bulk') or ''),
-            get_order(i.get('structure') or ''),
-        ))
+        houses = sorted(houses, key=_get_house_order)
         # Построение дерева, двигаясь из корня
         tree = {}
         # Добавление домов в каждую ветку
@@ -159,6 +162,175 @@ class AccountFiasTree(Document):
         # Если на первом уровне один элемент - убираем его
         # и вставляем наследников, добавляя названиям улиц адрес родитиля
         self.tree = self._tree_scoping(tuple(tree.values()))
+        self._reindex()
+
+    def _reindex(self):
+        """Построение индексов узлов и домов по готовому дереву"""
+        self.paths = {}
+        self.houses_index = {}
+
+        def walk(nodes, path):
+            for node in nodes:
+                node_path = path + [node['AOGUID']]
+                self.paths[node['AOGUID']] = node_path
+                for house in node.get('houses') or []:
+                    self.houses_index[str(house['_id'])] = node['AOGUID']
+                walk(node.get('inheritors') or [], node_path)
+
+        walk(self.tree, [])
+
+    def find_node(self, aoguid):
+        """Поиск узла дерева по AOGUID за O(глубины)"""
+        return find_branch_by_aoguid(self.tree, aoguid, self.paths)
+
+    def patch_house(self, house_id):
+        """
+        Точечное изменение дерева при добавлении или удалении дома.
+        Правится только путь к улице дома, после чего уровни с одним
+        наследником схлопываются как при построении (_tree_scoping).
+        Возвращает False, если дерево нужно перестроить целиком (нет
+        индекса, меняется верх дерева или схлопнутый уровень)
+        """
+        if self.tree and not self.paths:
+            return False
+        houses = self._get_houses()
+        in_tree = str(house_id) in self.houses_index
+        if house_id in houses and not in_tree:
+            patched = self._add_house(house_id)
+        elif house_id not in houses and in_tree:
+            patched = self._remove_house(house_id)
+        else:
+            return True
+        if patched:
+            self.tree = list(self._tree_scoping(self.tree))
+            self._reindex()
+        return patched
+
+    def _add_house(self, house_id):
+        from app.house.models.house import House
+        house = House.objects(
+            pk=house_id,
+        ).only(
+            'id',
+            'fias_street_guid',
+            'short_address',
+            'number',
+            'bulk',
+            'structure',
+        ).as_pymongo().first()
+        if not house or not house.get('fias_street_guid'):
+            return False
+        street_guid = house['fias_street_guid']
+        street = self.find_node(street_guid)
+        if street is None:
+            # достраиваем недостающую ветку от улицы до имеющегося узла
+            street = self._graft_branch(street_guid)
+            if street is None:
+                return False
+        street_houses = street.setdefault('houses', [])
+        orders = {
+            h['_id']: _get_house_order(h)
+            for h in House.objects(
+                id__in=[h['_id'] for h in street_houses],
+            ).only(
+                'number',
+                'bulk',
+                'structure',
+            ).as_pymongo()
+        }
+        order = _get_house_order(house)
+        position = len(street_houses)
+        for ix, street_house in enumerate(street_houses):
+            if orders.get(street_house['_id'], order) > order:
+                position = ix
+                break
+        street_houses.insert(
+            position,
+            dict(_id=house['_id'], short_address=house['short_address']),
+        )
+        self.houses_index[str(house['_id'])] = street_guid
+        return True
+
+    def _graft_branch(self, street_guid):
+        """
+        Создание ветки от улицы вверх до первого узла, имеющегося в
+        дереве. Возвращает узел улицы или None, если общий узел не найден
+        или его наследники - схлопнутый уровень (узел ветки мог быть убран
+        из дерева при схлопывании)
+        """
+        new_nodes = []
+        aoguid = street_guid
+        while aoguid and aoguid not in self.paths:
+            fias_doc = Fias.objects(
+                AOGUID=aoguid,
+            ).only(
+                'PARENTGUID',
+                'AOGUID',
+                'AOLEVEL',
+                'SHORTNAME',
+                'FORMALNAME',
+            ).order_by(
+                '-LIVESTATUS',
+            ).as_pymongo().first()
+            if not fias_doc:
+                return None
+            new_nodes.append(dict(
+                AOGUID=fias_doc['AOGUID'],
+                name='{} {}'.format(
+                    fias_doc['SHORTNAME'],
+                    fias_doc['FORMALNAME'],
+                ),
+                level=fias_doc['AOLEVEL'],
+                parent=fias_doc.get('PARENTGUID'),
+            ))
+            aoguid = fias_doc.get('PARENTGUID')
+        if not aoguid:
+            # дошли до корня ФИАС - меняется верхний уровень дерева
+            return None
+        parent = self.find_node(aoguid)
+        if any(
+                x.get('parent') != aoguid
+                for x in parent.get('inheritors') or []
+        ):
+            # наследники узла - дети схлопнутого уровня
+            return None
+        for node in reversed(new_nodes):
+            inheritors = parent.setdefault('inheritors', [])
+            names = [x['name'] for x in inheritors]
+            inheritors.insert(bisect.bisect_right(names, node['name']), node)
+            parent = node
+        return parent
+
+    def _remove_house(self, house_id):
+        street_guid = self.houses_index.pop(str(house_id))
+        path = self.paths.get(street_guid)
+        street = self.find_node(street_guid)
+        if street is None:
+            return False
+        street['houses'] = [
+            h for h in street.get('houses') or [] if h['_id'] != house_id
+        ]
+        # удаляем опустевшие узлы вверх по пути
+        for depth in range(len(path) - 1, -1, -1):
+            node = self.find_node(path[depth])
+            if node is None:
+                return False
+            if node.get('houses') or node.get('inheritors'):
+                break
+            siblings = (
+                self.find_node(path[depth - 1])['inheritors']
+                if depth
+                else self.tree
+            )
+            siblings.remove(node)
+            self.paths.pop(path[depth])
+        return True
+
+    def _get_houses(self):
+        houses = getattr(self, '_AccountFiasTree__houses', None)
+        if houses is None:
+            houses = self.get_houses()
+        return houses
 
     def _get_next_branches(self, parents_ids, branches):
         """Получение следующей ветки из предыдущих веток"""
@@ -302,8 +474,38 @@ class AccountFiasTree(Document):
         super().save(*arg, **kwargs)
         statistic_for_house_in_cache.delay(self.__houses)
 
+    def update_by_house(self, house_id):
+        """
+        Обновление дерева при изменении привязки одного дома: точечно,
+        если возможно, иначе полной перестройкой
+        """
+        if not self.patch_house(house_id):
+            self.save()
+            return
+        self.updated = datetime.datetime.now()
+        super().save()
+        statistic_for_house_in_cache.delay([house_id])
+
+
+def _get_house_order(house):
+    """Ключ упорядочивания домов по номеру, корпусу и строению"""
 
-def find_branch_by_aoguid(tree_as_dicts_list, aoguid):
+    def get_order(str_num):
+        if str_num.isdigit():
+            return str_num.zfill(5)
+        else:
+            return '10000{}'.format(str_num)
+
+    return (
+        get_order(house.get('number') or ''),
+        get_order(house.get('bulk') or ''),
+        get_order(house.get('structure') or ''),
+    )
+
+
+def find_branch_by_aoguid(tree_as_dicts_list, aoguid, paths=None):
+    if paths:
+        return _find_branch_by_path(tree_as_dicts_list, paths.get(aoguid))
     for node in tree_as_dicts_list:
         if node['AOGUID'] == aoguid:
             return node
@@ -315,7 +517,27 @@ def find_branch_by_aoguid(tree_as_dicts_list, aoguid):
     return None
 
 
-def fill_fias_parents_by_aoguid(tree_as_dicts_list, aoguid, target_list):
+def _find_branch_by_path(tree_as_dicts_list, path):
+    """Спуск по дереву по пути AOGUID от корня"""
+    if not path:
+        return None
+    node = None
+    nodes = tree_as_dicts_list
+    for aoguid in path:
+        node = next((x for x in nodes if x['AOGUID'] == aoguid), None)
+        if node is None:
+            return None
+        nodes = node.get('inheritors') or []
+    return node
+
+
+def fill_fias_parents_by_aoguid(tree_as_dicts_list, aoguid, target_list,
+                                paths=None):
+    if paths:
+        node = _find_branch_by_path(tree_as_dicts_list, paths.get(aoguid))
+        if node:
+            target_list.append(node['AOGUID'])
+        return node
     for node in tree_as_dicts_list:
         if node['AOGUID'] == aoguid:
             target_list.append(node['AOGUID'])
@@ -1,7 +1,7 @@
 import datetime
 
 from mongoengine import Document, ReferenceField, StringField, ListField, \
-    ObjectIdField, DictField, DateTimeField
+    ObjectIdField, DictField, DateTimeField, IntField
 
 from processing.models.billing.provider.main import Provider
 from processing.models.choices import FILTER_CODES_CHOICES, \
@@ -18,6 +18,10 @@ class FilterCache(Document):
     meta = {
         'db_alias': 'cache-db',
         'collection': 'filters',
+        'index_background': True,
+        'indexes': [
+            ('provider', 'params_hash', 'data_version'),
+        ],
     }
 
     provider = ReferenceField(Provider, verbose_name='Организация')
@@ -37,6 +41,37 @@ class FilterCache(Document):
         verbose_name='Коды готовых данных',
     )
     used = DateTimeField(verbose_name='Дата последнего использования')
+    params_hash = StringField(verbose_name='Хэш параметров фильтра')
+    data_version = IntField(
+        verbose_name='Версия данных дома, по которым построен фильтр',
+    )
+
+    @classmethod
+    def find_prepared(cls, provider_id, params_hash, data_version,
+                      max_age_secs=3600):
+        """
+        Ищет ранее построенный фильтр с теми же параметрами по той же
+        версии данных дома и отмечает его использование
+        """
+        filter_ins = cls.objects(
+            provider=provider_id,
+            params_hash=params_hash,
+            data_version=data_version,
+            used__gte=(
+                    datetime.datetime.now()
+                    - datetime.timedelta(seconds=max_age_secs)
+            ),
+        ).only(
+            'id',
+            'objs',
+        ).as_pymongo().first()
+        if filter_ins:
+            cls.objects(
+                pk=filter_ins['_id'],
+            ).update(
+                used=datetime.datetime.now(),
+            )
+        return filter_ins
 
     @classmethod
     def extract_objs(cls, filter_id):
@@ -74,3 +109,44 @@ class FilterPreparedData(Document):
     created = DateTimeField(verbose_name='Время создания')
     used = DateTimeField(verbose_name='Время последнего использования')
 
+
+class FilterDataVersion(Document):
+    """
+    Версия данных дома, влияющих на фильтры по жителям (помещения,
+    счётчики, лицевые счета). Увеличивается при их сохранении и
+    используется для инвалидации индексов и кэша фильтров
+    """
+
+    meta = {
+        'db_alias': 'cache-db',
+        'collection': 'filters_data_versions',
+        'index_background': True,
+        'indexes': [
+            'house',
+        ],
+    }
+
+    house = ObjectIdField(verbose_name='Дом')
+    version = IntField(default=0, verbose_name='Версия данных')
+    updated = DateTimeField(verbose_name='Время изменения')
+
+    @classmethod
+    def bump(cls, house_id):
+        if not house_id:
+            return
+        cls.objects(
+            house=house_id,
+        ).update_one(
+            inc__version=1,
+            set__updated=datetime.datetime.now(),
+            upsert=True,
+        )
+
+    @classmethod
+    def get_version(cls, house_id):
+        version = cls.objects(
+            house=house_id,
+        ).only(
+            'version',
+        ).as_pymongo().first()
+        return version['version'] if version else 0
@@ -1,6 +1,7 @@
 from mongoengine import (
     DateTimeField, Document, EmbeddedDocument, EmbeddedDocumentField,
-    FloatField, IntField, ListField, ReferenceField, StringField,
+    FloatField, IntField, ListField, ObjectIdField, ReferenceField,
+    StringField,
 )
 
 from app.house.models.house import House
@@ -44,6 +45,7 @@ class HouseAccrualsCached(Document):
                 ],
                 'unique': True,
             },
+            'deltas_applied',
         ],
     }
 
@@ -55,4 +57,40 @@ class HouseAccrualsCached(Document):
     sector = StringField(choices=ACCRUAL_SECTOR_TYPE_CHOICES,
                          verbose_name='Направление')
     accounts_filter = StringField(verbose_name='Код фильтра по жителям')
+    deltas_applied = IntField(
+        default=0,
+        verbose_name='Сколько дельт применено после полной пересборки',
+    )
+    rebuilt = DateTimeField(verbose_name='Дата последней полной пересборки')
+
+
+class HouseAccrualContributionCached(Document):
+    """
+    Вклад отдельного начисления в суммарные начисления по дому.
+    Нужен для расчёта дельты при изменении части начислений дома
+    """
+
+    meta = {
+        'db_alias': 'cache-db',
+        'collection': 'house_accruals_contributions',
+        'index_background': True,
+        'auto_create_index': False,
+        'indexes': [
+            'accrual',
+            ('house', 'provider', 'sector', 'month'),
+        ],
+    }
+
+    accrual = ObjectIdField(verbose_name='Начисление')
+    provider = ObjectIdField(verbose_name='Организация')
+    house = ObjectIdField(verbose_name='Дом')
+    month = DateTimeField(verbose_name='Месяц начисления')
+    sector = StringField(choices=ACCRUAL_SECTOR_TYPE_CHOICES,
+                         verbose_name='Направление')
+    accounts_filters = ListField(
+        StringField(),
+        verbose_name='Коды фильтров по жителям, куда входит начисление',
+    )
+    services = ListField(EmbeddedDocumentField(HouseServiceAccrualsCached))
+    penalties = IntField(verbose_name='Сумма пени')
 
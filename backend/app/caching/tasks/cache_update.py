@@ -1,7 +1,11 @@
 from datetime import datetime
 
+from pymongo import DeleteMany, InsertOne
+
 import settings
-from app.caching.core.accruals import get_house_accruals
+from app.caching.core.accruals import get_accruals_contributions, \
+    get_accruals_contributions_delta, get_house_accruals_contributions, \
+    sum_accruals_contributions
 from app.caching.core.references import PREPARE_FUNCS
 from app.caching.models.filters import FilterCache
 from app.celery_admin.workers.config import celery_app
@@ -10,11 +14,14 @@ from app.personnel.models.personnel import Worker
 from processing.models.billing.tariff_plan import TariffsTree
 from app.caching.models.cache_lock import CacheLock
 from app.caching.models.house_accruals import HouseAccrualsCached, \
-    HouseServiceAccrualsCached
+    HouseServiceAccrualsCached, HouseAccrualContributionCached
 from app.caching.models.fias_tree import AccountFiasTree, \
     FiasTreeAccountError
 from app.caching.core.metabase import get_stat
 
+# после скольких дельт кэш по дому пересобирается полностью
+HOUSE_ACCRUALS_DELTAS_LIMIT = 50
+
 
 @celery_app.task(
     bind=True,
@@ -45,51 +52,269 @@ def update_house_accruals_cache(self, provider_id, house_id, month, sector):
         if self.request.retries < self.max_retries:
             raise self.retry()
     try:
-        accruals = get_house_accruals(provider_id, house_id, month, sector)
-        # сохраняем новый кэш
-        for filter_name, data in accruals.items():
-            services_cache = []
-            for s_type, values in data['services'].items():
-                services_cache.append(
-                    HouseServiceAccrualsCached(
-                        service=s_type,
-                        total=values['t'],
-                        debt=values['d'],
-                        value=values['v'],
-                        recalculations=values['r'],
-                        shortfalls=values['s'],
-                        privileges=values['p'],
-                        consumption=values['c'],
-                        tariff=values['tar'],
-                    ),
-                )
-            HouseAccrualsCached.objects(
-                provider=provider_id,
-                house=house_id,
-                sector=sector,
-                accounts_filter=filter_name,
-                month=month,
-            ).upsert_one(
-                services=services_cache,
-                penalties=data['penalties'],
-            )
+        _rebuild_house_accruals_cache(provider_id, house_id, month, sector)
     finally:
         if self:
             _unlock_cache_use(model='HouseAccrualsCached', obj=house_id)
     return 'success v{}'.format(settings.RELEASE)
 
 
+@celery_app.task(
+    bind=True,
+    rate_limit="100/s",
+    max_retries=7,
+    soft_time_limit=total_seconds(seconds=60),
+    default_retry_delay=10,
+)
+def update_house_accruals_cache_delta(self, provider_id, house_id, month,
+                                      sector, accruals_ids):
+    """
+    Применяет к кэшу суммарных начислений по дому изменения только
+    перечисленных начислений (удалённые из базы вычитаются). Если кэша ещё
+    нет или дельт накопилось слишком много, кэш пересобирается полностью
+    """
+    if not _lock_cache_use(model='HouseAccrualsCached', obj=house_id):
+        if self.request.retries < self.max_retries:
+            raise self.retry()
+    try:
+        key = dict(
+            provider=provider_id,
+            house=house_id,
+            sector=sector,
+            month=month,
+        )
+        caches = list(
+            HouseAccrualsCached.objects(**key).only(
+                'id',
+                'deltas_applied',
+            ).as_pymongo(),
+        )
+        if (
+                not caches
+                or max(c.get('deltas_applied', 0) for c in caches)
+                >= HOUSE_ACCRUALS_DELTAS_LIMIT
+        ):
+            _rebuild_house_accruals_cache(provider_id, house_id, month, sector)
+            return 'rebuilt v{}'.format(settings.RELEASE)
+        _apply_house_accruals_delta(key, accruals_ids)
+    finally:
+        _unlock_cache_use(model='HouseAccrualsCached', obj=house_id)
+    return 'success v{}'.format(settings.RELEASE)
+
+
+@celery_app.task(
+    bind=True,
+    rate_limit="100/m",
+    max_retries=3,
+    soft_time_limit=total_seconds(seconds=60),
+)
+def verify_house_accruals_cache(self):
+    """
+    Полная пересборка кэшей, изменённых дельтами, для сверки
+    """
+    caches = HouseAccrualsCached.objects(
+        deltas_applied__gt=0,
+    ).only(
+        'provider',
+        'house',
+        'month',
+        'sector',
+    ).as_pymongo()
+    keys = {
+        (c['provider'], c['house'], c['month'], c['sector'])
+        for c in caches
+    }
+    for provider_id, house_id, month, sector in keys:
+        update_house_accruals_cache.delay(
+            provider_id=provider_id,
+            house_id=house_id,
+            month=month,
+            sector=sector,
+        )
+    return f'houses {len(keys)}'
+
+
+def _rebuild_house_accruals_cache(provider_id, house_id, month, sector):
+    contributions = get_house_accruals_contributions(
+        provider_id,
+        house_id,
+        month,
+        sector,
+    )
+    accruals = sum_accruals_contributions(contributions.values())
+    # сохраняем новый кэш
+    rebuilt = datetime.now()
+    for filter_name, data in accruals.items():
+        HouseAccrualsCached.objects(
+            provider=provider_id,
+            house=house_id,
+            sector=sector,
+            accounts_filter=filter_name,
+            month=month,
+        ).upsert_one(
+            services=_get_services_cache(data['services']),
+            penalties=data['penalties'],
+            deltas_applied=0,
+            rebuilt=rebuilt,
+        )
+    # сохраняем вклад каждого начисления для последующих дельт
+    key = dict(
+        provider=provider_id,
+        house=house_id,
+        sector=sector,
+        month=month,
+    )
+    HouseAccrualContributionCached.objects(**key).delete()
+    if contributions:
+        HouseAccrualContributionCached._get_collection().insert_many(
+            [
+                _get_contribution_document(key, accrual_id, contribution)
+                for accrual_id, contribution in contributions.items()
+            ],
+            ordered=False,
+        )
+
+
+def _apply_house_accruals_delta(key, accruals_ids):
+    contributions_before = HouseAccrualContributionCached.objects(
+        accrual__in=accruals_ids,
+        **key,
+    ).as_pymongo()
+    contributions_after = get_accruals_contributions(accruals_ids)
+    delta = get_accruals_contributions_delta(
+        [_get_contribution_from_cache(c) for c in contributions_before],
+        contributions_after.values(),
+    )
+    for filter_name, data in delta.items():
+        if not data['services'] and not data['penalties']:
+            continue
+        cache = HouseAccrualsCached.objects(
+            accounts_filter=filter_name,
+            **key,
+        ).as_pymongo().first()
+        services = _add_services_delta(
+            cache['services'] if cache else [],
+            data['services'],
+        )
+        HouseAccrualsCached.objects(
+            accounts_filter=filter_name,
+            **key,
+        ).update_one(
+            __raw__={
+                '$set': {'services': services},
+                '$inc': {
+                    'penalties': data['penalties'],
+                    'deltas_applied': 1,
+                },
+            },
+            upsert=True,
+        )
+    bulk = []
+    for accrual_id, contribution in contributions_after.items():
+        bulk.append(
+            DeleteMany({'accrual': accrual_id, **key}),
+        )
+        if contribution['filters']:
+            bulk.append(
+                InsertOne(
+                    _get_contribution_document(key, accrual_id, contribution),
+                ),
+            )
+    if bulk:
+        HouseAccrualContributionCached._get_collection().bulk_write(
+            bulk,
+            ordered=True,
+        )
+
+
+def _add_services_delta(services, delta):
+    services = {s['service']: s for s in services}
+    for s_type, values in delta.items():
+        service = services.setdefault(
+            s_type,
+            {
+                'service': s_type,
+                'total': 0,
+                'debt': 0,
+                'value': 0,
+                'recalculations': 0,
+                'shortfalls': 0,
+                'privileges': 0,
+                'consumption': 0,
+                'tariff': [],
+            },
+        )
+        service['total'] += values['t']
+        service['debt'] += values['d']
+        service['value'] += values['v']
+        service['recalculations'] += values['r']
+        service['shortfalls'] += values['s']
+        service['privileges'] += values['p']
+        service['consumption'] += values['c']
+        service['tariff'] = list(set(service['tariff']) | values['tar'])
+    return list(services.values())
+
+
+def _get_services_cache(services):
+    return [
+        HouseServiceAccrualsCached(
+            service=s_type,
+            total=values['t'],
+            debt=values['d'],
+            value=values['v'],
+            recalculations=values['r'],
+            shortfalls=values['s'],
+            privileges=values['p'],
+            consumption=values['c'],
+            tariff=values['tar'],
+        )
+        for s_type, values in services.items()
+    ]
+
+
+def _get_contribution_document(key, accrual_id, contribution):
+    return HouseAccrualContributionCached(
+        accrual=accrual_id,
+        accounts_filters=contribution['filters'],
+        services=_get_services_cache(contribution['services']),
+        penalties=contribution['penalties'],
+        **key,
+    ).to_mongo().to_dict()
+
+
+def _get_contribution_from_cache(contribution):
+    return {
+        'filters': contribution['accounts_filters'],
+        'penalties': contribution.get('penalties') or 0,
+        'services': {
+            s['service']: {
+                't': s['total'],
+                'd': s['debt'],
+                'v': s['value'],
+                'r': s['recalculations'],
+                'p': s['privileges'],
+                's': s['shortfalls'],
+                'c': s['consumption'],
+                'tar': set(s['tariff']),
+            }
+            for s in contribution['services']
+        },
+    }
+
+
 @celery_app.task(
     bind=True,
     rate_limit="100/s",
     max_retries=7,
     soft_time_limit=total_seconds(seconds=120),
 )
-def create_fias_tree_cache(self, provider_id, account_id=None):
+def create_fias_tree_cache(self, provider_id, account_id=None,
+                           house_id=None):
     """
     Создание дерева ФИАСа по следующим триггерам:
         1. Добавление/удаление дома в правах сотрудника.
         2. Добавление/удаление привязки организации к дому.
+    Если передан дом, имеющееся дерево правится точечно
     """
     query = (
         dict(provider=provider_id, account=account_id)
@@ -98,7 +323,9 @@ def create_fias_tree_cache(self, provider_id, account_id=None):
     )
     acc_tree = AccountFiasTree.objects(**query).first()
     try:
-        if acc_tree:
+        if acc_tree and house_id:
+            acc_tree.update_by_house(house_id)
+        elif acc_tree:
             # Если уже есть
             acc_tree.save()
         else:
@@ -115,18 +342,21 @@ def create_fias_tree_cache(self, provider_id, account_id=None):
     max_retries=7,
     soft_time_limit=total_seconds(seconds=60),
 )
-def create_provider_fias_tree_cache(self, provider_id):
+def create_provider_fias_tree_cache(self, provider_id, house_id=None):
     """
     Создание дерева ФИАСа по следующим триггерам:
         1. Добавление/удаление дома в правах сотрудника.
         2. Добавление/удаление привязки организации к дому.
+    Если передан дом, имеющиеся деревья правятся точечно
     """
     # Строим дерево для организации
     prov_tree = AccountFiasTree.objects(
         provider=provider_id,
         account__exists=False
     ).first()
-    if prov_tree:
+    if prov_tree and house_id:
+        prov_tree.update_by_house(house_id)
+    elif prov_tree:
         # Если уже есть
         prov_tree.save()
     else:
@@ -140,7 +370,7 @@ def create_provider_fias_tree_cache(self, provider_id):
         is_deleted__ne=True,
     ).distinct('id')
     for worker in workers:
-        create_fias_tree_cache.delay(provider_id, worker)
+        create_fias_tree_cache.delay(provider_id, worker, house_id=house_id)
     return 'success'
 
 
@@ -1,11 +1,23 @@
+import datetime
+import logging
+
+from bson import ObjectId
 from mongoengine import ListField, EmbeddedDocumentField
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
 
+from app.c300.models.choices import BaseTaskState
 from app.caching.models.denormalization import DenormalizationTask
 from app.caching.tasks.cache_update import total_seconds
 from app.celery_admin.workers.config import celery_app
 from processing.models.denormalizing_schema import DENORMALIZING_SCHEMA
 from utils.crm_utils import provider_can_tenant_access
 
+logger = logging.getLogger('c300')
+
+DENORMALIZE_COALESCE_SECONDS = 15  # ожидание повторных изменений поля
+DENORMALIZE_CHUNK_SIZE = 1000  # документов в одном обновлении
+
 
 @celery_app.task(
     bind=True,
@@ -48,7 +60,7 @@ def denormalize_house_sectors_to_cabinets(self, house_id, task_id):
         self.soft_time_limit if self else None,
     )
     from app.auth.models.actors import Actor
-    from app.house.models.house import House
+    from app.house.models.house import House, AreasRange
     from app.area.models.area import Area
     house = House.objects(pk=house_id).get()
     actor_sectors = house.get_sectors_by_area_ranges()
@@ -57,13 +69,20 @@ def denormalize_house_sectors_to_cabinets(self, house_id, task_id):
     ).update(
         sectors=[],
     )
+    house_areas = [
+        (area['_id'], (area['_type'][0], area['number']))
+        for area in Area.objects(
+            house__id=house_id,
+        ).only('id', '_type', 'number').as_pymongo()
+        if area.get('_type') and area.get('number') is not None
+    ] if actor_sectors else []
     updated = 0
     for areas, sectors in actor_sectors.items():
-        query = house.parse_areas_range_to_query(areas)
-        query['house._id'] = house_id
+        areas_range = AreasRange.compile(areas)
         bound_areas = [
-            area['_id']
-            for area in Area.objects(__raw__=query).only('id').as_pymongo()
+            area_id
+            for area_id, area in house_areas
+            if area in areas_range
         ]
         if not bound_areas:
             continue
@@ -188,15 +207,58 @@ def _cut_catalogue_restrictions(permissions, provider_id, house_id):
         permissions.pop('catalogue_cabinet_positions')
 
 
+def schedule_foreign_denormalize(model_from, field_name, object_id):
+    """
+    Поставить денормализацию поля объекта в очередь.
+
+    События по одному полю объекта объединяются: пока задача ожидает
+    запуска (в течение DENORMALIZE_COALESCE_SECONDS), новая не ставится -
+    ожидающая задача прочитает последнее значение поля при запуске
+    """
+    task_id = ObjectId()
+    pending = DenormalizationTask._get_collection().find_one_and_update(
+        {
+            'model_name': model_from.__name__,
+            'field_name': field_name,
+            'obj_id': object_id,
+            'func_name': None,
+            'state': BaseTaskState.NEW,
+        },
+        {
+            '$setOnInsert': {
+                '_id': task_id,
+                'created': datetime.datetime.now(),
+                'tries': 0,
+            },
+        },
+        upsert=True,
+        projection={'_id': True},
+        return_document=ReturnDocument.AFTER,
+    )
+    if pending['_id'] != task_id:
+        return None
+    foreign_denormalize_data.apply_async(
+        kwargs=dict(
+            model_from=model_from,
+            field_name=field_name,
+            object_id=object_id,
+            task_id=task_id,
+        ),
+        countdown=DENORMALIZE_COALESCE_SECONDS,
+    )
+    return task_id
+
+
 @celery_app.task(
     bind=True,
     rate_limit="100/m",
     max_retries=3,
-    soft_time_limit=total_seconds(seconds=60),
+    soft_time_limit=total_seconds(minutes=10),
 )
 def foreign_denormalize_data(self, model_from, field_name, object_id,
                              task_id=None):
     if task_id:
+        # до чтения значения: новые изменения поставят новую задачу
         DenormalizationTask.set_wip_state(
             task_id,
             self.soft_time_limit if self else None,
@@ -208,53 +270,99 @@ def foreign_denormalize_data(self, model_from, field_name, object_id,
         field_name,
     ).get()
     field_value = getattr(obj, field_name)
-    schema = DENORMALIZING_SCHEMA[model_from]
+    plan = _DENORMALIZING_PLAN[model_from].get(field_name, [])
     exception = None
-    for model in schema:
-        path = _get_path(model, model_from, field_name)
-        if path:
-            try:
-                _update_object_field_by_path(
-                    model,
-                    object_id,
-                    path,
-                    field_name,
-                    field_value,
-                )
-            except Exception as ex:
-                exception = ex
-                continue
+    for ix, (model, path, value_cls, hint) in enumerate(plan):
+        try:
+            updated = _update_object_field_by_path(
+                model,
+                object_id,
+                path,
+                field_name,
+                value_cls.from_ref(field_value)
+                if hasattr(value_cls, 'from_ref') else field_value,
+                hint,
+            )
+        except Exception as ex:
+            exception = ex
+            continue
+        logger.info(
+            'Denormalized %s.%s of %s to %s: %d',
+            model_from.__name__, field_name, object_id,
+            model.__name__, updated,
+        )
+        if self and self.request.id:
+            self.update_state(
+                state='PROGRESS',
+                meta={'models': f'{ix + 1}/{len(plan)}', 'updated': updated},
+            )
     if exception:
         raise exception
     if task_id:
         DenormalizationTask.set_success_state(task_id)
 
 
-def _update_object_field_by_path(model, obj_id, path, field_name, field_value):
-    cls = _get_cls_by_path(model, path, field_name)
-    if hasattr(cls, 'from_ref'):
-        value = cls.from_ref(field_value)
-    else:
-        value = field_value
-    path = '__'.join(path)
-    model.objects(
-        **{f'{path}__id': obj_id},
+def _update_object_field_by_path(model, obj_id, path, field_name, value,
+                                 hint=None):
+    """Обновление денормализованного поля документов модели пачками"""
+    query = {f'{path}__id': obj_id}
+    ids = model.objects(**query).only('id').as_pymongo()
+    index = _get_path_index(model, hint) if hint else None
+    if index:
+        ids = ids.hint(index)
+    updated = 0
+    chunk = []
+    for doc in ids.batch_size(DENORMALIZE_CHUNK_SIZE):
+        chunk.append(doc['_id'])
+        if len(chunk) == DENORMALIZE_CHUNK_SIZE:
+            updated += _update_chunk(model, query, chunk, path, field_name,
+                                     value)
+            chunk = []
+    if chunk:
+        updated += _update_chunk(model, query, chunk, path, field_name, value)
+    return updated
+
+
+def _update_chunk(model, query, ids, path, field_name, value):
+    return model.objects(
+        id__in=ids,
+        **query,
     ).update(
         **{f'set__{path}__{field_name}': value},
     )
 
 
-def _get_cls_by_path(model, path, field_name):
-    result = model._fields[path[0]].document_type_obj
-    if len(path) > 1:
-        return _get_cls_by_path(result, path[1:], field_name)
-    if hasattr(result._fields[field_name], 'document_type_obj'):
-        return result._fields[field_name].document_type_obj
-    return result._fields[field_name]
+def _compile_plan(schema):
+    """
+    План денормализации: {модель-источник: {поле: [(модель, путь,
+    класс значения, ключ индекса по пути)]}}
+    """
+    plan = {}
+    for model_from, models in schema.items():
+        fields_plan = plan.setdefault(model_from, {})
+        for model in models:
+            found = _find_embedded(model, model_from.__name__)
+            if not found:
+                continue
+            path, db_path, embedded_cls = found
+            hint = f'{".".join(db_path)}._id'
+            for name, field in embedded_cls._fields.items():
+                fields_plan.setdefault(name, []).append((
+                    model,
+                    '__'.join(path),
+                    getattr(field, 'document_type_obj', field),
+                    hint,
+                ))
+    return plan
 
 
-def _get_path(model, model_from, field_name, path=None):
-    result = path or []
+def _find_embedded(model, model_from_name, path=None, db_path=None):
+    """
+    Путь к первому вложенному документу модели, денормализованному
+    из модели-источника: (путь, путь в базе, класс вложенного документа)
+    """
+    path = path or []
+    db_path = db_path or []
     for name, field in model._fields.items():
         if (
                 isinstance(field, ListField)
@@ -265,22 +373,37 @@ def _get_path(model, model_from, field_name, path=None):
             embedded_cls = field.document_type_obj
         else:
             continue
-        if (
-                not hasattr(embedded_cls, 'DENORMALIZE_FROM')
-                or embedded_cls.DENORMALIZE_FROM != model_from.__name__
-        ):
-            embedded_result = _get_path(
-                embedded_cls,
-                model_from,
-                field_name,
-                result + [name],
-            )
-            if embedded_result:
-                return embedded_result
+        if getattr(embedded_cls, 'DENORMALIZE_FROM', None) == model_from_name:
+            return path + [name], db_path + [field.db_field], embedded_cls
+        found = _find_embedded(
+            embedded_cls,
+            model_from_name,
+            path + [name],
+            db_path + [field.db_field],
+        )
+        if found:
+            return found
+    return None
+
+
+def _get_path_index(model, key):
+    """
+    Ключи имеющегося в базе индекса коллекции модели, начинающегося
+    с ключа key. Индексы не создаются автоматически (auto_create_index),
+    поэтому берутся из базы, а не из meta
+    """
+    try:
+        indexes = model._get_collection().index_information()
+    except PyMongoError as ex:
+        logger.warning('Indexes of %s are unavailable: %s',
+                       model.__name__, ex)
+        return None
+    for index in indexes.values():
+        if index.get('partialFilterExpression') or index.get('sparse'):
             continue
-        if embedded_cls.DENORMALIZE_FROM == model_from.__name__:
-            if field_name in embedded_cls._fields:
-                return result + [name]
-            else:
-                return []
-    return []
+        if index['key'][0][0] == key:
+            return list(index['key'])
+    return None
+
+
+_DENORMALIZING_PLAN = _compile_plan(DENORMALIZING_SCHEMA)
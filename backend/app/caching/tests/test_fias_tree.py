@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, mock
+
+from bson import ObjectId
+
+from app.caching.models.fias_tree import AccountFiasTree
+from app.house.models.house import House
+from processing.models.billing.fias import Fias
+
+# регион -> города -> (микрорайоны) -> улицы
+FIAS = [
+    ('R', None, 'обл', 'Ленинградская', '1'),
+    ('C', 'R', 'г', 'Гатчина', '4'),
+    ('D', 'R', 'г', 'Выборг', '4'),
+    ('K', 'C', 'мкр', 'Аэродром', '5'),
+    ('L', 'D', 'мкр', 'Южный', '5'),
+    ('S1', 'K', 'ул', 'Авиатриссы', '7'),
+    ('S2', 'K', 'ул', 'Ленинградская', '7'),
+    ('S3', 'D', 'ул', 'Морская', '7'),
+    ('S5', 'D', 'ул', 'Рубежная', '7'),
+    ('S6', 'L', 'ул', 'Пушкина', '7'),
+]
+HOUSES = {
+    name: {
+        '_id': ObjectId(),
+        'fias_street_guid': street,
+        'short_address': f'{street}, д. {number}',
+        'number': str(number),
+    }
+    for name, street, number in (
+        ('h1', 'S1', 1),
+        ('h2', 'S2', 2),
+        ('h3', 'S3', 3),
+        ('h4', 'S5', 4),
+        ('h5', 'S6', 5),
+    )
+}
+
+
+class _QuerySet:
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def only(self, *args):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def as_pymongo(self):
+        return self
+
+    def first(self):
+        return self.docs[0] if self.docs else None
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class _Manager:
+
+    def __init__(self, docs, key):
+        self.docs = docs
+        self.key = key
+
+    def __call__(self, **query):
+        docs = self.docs
+        for name, value in query.items():
+            values = value if name.endswith('__in') else [value]
+            docs = [doc for doc in docs if doc[self.key] in values]
+        return _QuerySet(docs)
+
+
+def _fias_docs():
+    return [
+        dict(
+            AOGUID=aoguid,
+            PARENTGUID=parent,
+            SHORTNAME=short_name,
+            FORMALNAME=formal_name,
+            AOLEVEL=level,
+        )
+        for aoguid, parent, short_name, formal_name, level in FIAS
+    ]
+
+
+def _normalized(nodes):
+    """Дерево без учета порядка узлов одного уровня"""
+    return sorted(
+        (
+            node['AOGUID'],
+            node['name'],
+            tuple(house['_id'] for house in node.get('houses') or []),
+            _normalized(node.get('inheritors') or []),
+        )
+        for node in nodes
+    )
+
+
+@mock.patch.object(House, 'objects', _Manager([*HOUSES.values()], '_id'))
+@mock.patch.object(Fias, 'objects', _Manager(_fias_docs(), 'AOGUID'))
+class FiasTreePatchTestCase(TestCase):
+    """Точечное изменение дерева совпадает с полным построением"""
+
+    @staticmethod
+    def get_tree(*names):
+        tree = AccountFiasTree(provider=ObjectId())
+        house_ids = [HOUSES[name]['_id'] for name in names]
+        tree._AccountFiasTree__houses = house_ids
+        tree.build_tree(house_ids)
+        return tree
+
+    def patch(self, tree, name, *names):
+        tree._AccountFiasTree__houses = [HOUSES[x]['_id'] for x in names]
+        return tree.patch_house(HOUSES[name]['_id'])
+
+    def assertRebuilt(self, tree, *names):
+        rebuilt = self.get_tree(*names)
+        self.assertEqual(_normalized(tree.tree), _normalized(rebuilt.tree))
+        self.assertEqual(tree.paths, rebuilt.paths)
+        self.assertEqual(tree.houses_index, rebuilt.houses_index)
+
+    def test_add_to_existing_level(self):
+        tree = self.get_tree('h1', 'h2', 'h3')
+        self.assertTrue(self.patch(tree, 'h4', 'h1', 'h2', 'h3', 'h4'))
+        self.assertRebuilt(tree, 'h1', 'h2', 'h3', 'h4')
+
+    def test_add_collapsed_branch(self):
+        tree = self.get_tree('h1', 'h2', 'h3')
+        self.assertTrue(self.patch(tree, 'h5', 'h1', 'h2', 'h3', 'h5'))
+        self.assertRebuilt(tree, 'h1', 'h2', 'h3', 'h5')
+
+    def test_add_under_collapsed_level(self):
+        # микрорайон K схлопнут: его улица - наследник города C
+        tree = self.get_tree('h1', 'h3')
+        self.assertFalse(self.patch(tree, 'h2', 'h1', 'h2', 'h3'))
+
+    def test_remove_collapses_level(self):
+        tree = self.get_tree('h1', 'h2', 'h3')
+        self.assertTrue(self.patch(tree, 'h3', 'h1', 'h2'))
+        self.assertRebuilt(tree, 'h1', 'h2')
+
+    def test_remove_house(self):
+        tree = self.get_tree('h1', 'h2', 'h3', 'h4')
+        self.assertTrue(self.patch(tree, 'h4', 'h1', 'h2', 'h3'))
+        self.assertRebuilt(tree, 'h1', 'h2', 'h3')
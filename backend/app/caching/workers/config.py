@@ -6,6 +6,10 @@ CACHING_TASK_SCHEDULE = {
         'task': 'app.caching.tasks.periodic.restart_denormalize_tasks',
         'schedule': crontab(minute="*/17"),
     },
+    'house-accruals-cache-verifying': {
+        'task': 'app.caching.tasks.cache_update.verify_house_accruals_cache',
+        'schedule': crontab(minute=40, hour='3'),
+    },
 }
 CACHING_TASK_ROUTES = {
     'app.caching.tasks.cache_update.update_tariffs_cache': {
@@ -14,6 +18,12 @@ CACHING_TASK_ROUTES = {
     'app.caching.tasks.cache_update.update_house_accruals_cache': {
         'queue': _QUEUE,
     },
+    'app.caching.tasks.cache_update.update_house_accruals_cache_delta': {
+        'queue': _QUEUE,
+    },
+    'app.caching.tasks.cache_update.verify_house_accruals_cache': {
+        'queue': _QUEUE,
+    },
     'app.caching.tasks.cache_update.create_fias_tree_cache': {
         'queue': _QUEUE,
     },
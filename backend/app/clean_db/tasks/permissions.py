@@ -8,6 +8,7 @@ from app.celery_admin.workers.config import celery_app
     bind=True
 )
 def find_and_clean_unused_house_group(self, provider_id=None):
+    from processing.models.billing.binds_resolver import HOUSE_GROUPS
     from processing.models.billing.house_group import HouseGroup
     from processing.models.billing.provider.main import Provider
     from app.personnel.models.personnel import Worker
@@ -31,6 +32,7 @@ def find_and_clean_unused_house_group(self, provider_id=None):
         if not provider:
             cleaned = HouseGroup.clean_group_from_data(hg_id)
             HouseGroup.objects(pk=hg_id).delete()
+            HOUSE_GROUPS.invalidate()
             return f'cleaned {cleaned} of {hg_id}'
         if (
                 provider.get('_binds_permissions')
@@ -48,6 +50,7 @@ def find_and_clean_unused_house_group(self, provider_id=None):
             continue
         cleaned = HouseGroup.clean_group_from_data(hg_id)
         HouseGroup.objects(pk=hg_id).delete()
+        HOUSE_GROUPS.invalidate()
         if cleaned == 0:
             continue
         now_hour = datetime.datetime.now().hour
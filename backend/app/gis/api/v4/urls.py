@@ -13,6 +13,7 @@ from app.gis.api.v4.view import (
     HouseProvidersViewSet,
     GisSendRequestViewSet,
     GisFetchResultViewSet, AllGisRecordViewSet, GisRecordErrorsViewSet,
+    GisReconciliationViewSet,
 )
 
 gis_router = DefaultRouter()
@@ -70,6 +71,12 @@ gis_router.register(
     basename='gis_guids',
 )
 
+gis_router.register(
+    'gis/reconciliation',
+    GisReconciliationViewSet,
+    basename='gis_reconciliation',
+)
+
 gis_router.register(
     'gis/scheduled',
     GisQueuedViewSet,
@@ -39,6 +39,7 @@ from app.gis.models.gis_queued import GisQueued
 from app.gis.models.gis_record import GisRecord
 from app.gis.models.guid import GUID
 from app.gis.models.log_models import GisInErrorsLog
+from app.gis.models.reconciliation import GisReconciliation
 
 from app.gis.tasks.gis_task import GisTask
 from app.gis.tasks.bills import export_pd, withdraw_pd
@@ -225,6 +226,12 @@ class FullRecordViewSet(BaseCrudViewSet):
             # 'saved': {'$gte': GisRecordViewSet.actual_time()},
         }).order_by('-saved')
 
+    def get_object(self):
+        """Запись об операции с журналом (выполнения) операции"""
+        record: GisRecord = super().get_object()
+        record.log = record.journal or None  # WARN не сохраняется
+        return record
+
 
 class AllGisRecordViewSet(BaseCrudViewSet):
     serializer_class = AllRecordSerializer
@@ -420,6 +427,30 @@ class GisQueuedViewSet(BaseCrudViewSet):
         }).order_by('-saved')
 
 
+class GisReconciliationViewSet(BaseLoggedViewSet):
+
+    slug = ('gis_zkh', 'houses')
+
+    @permission_validator
+    def list(self, request):
+        """
+        Сводки сверки (с ГИС ЖКХ) домов организации
+
+        ?house=HouseId&house=... - только указанных домов
+        """
+        provider_id: ObjectId = RequestAuth(request).get_provider_id()
+
+        try:
+            house_ids: list = [ObjectId(house_id)
+                for house_id in request.query_params.getlist('house')]
+        except Exception as exc:
+            return HttpResponseBadRequest(str(exc))
+
+        return self.json_response(
+            GisReconciliation.of_provider(provider_id, *house_ids)
+        )
+
+
 class GisProviderNSIViewSet(BaseLoggedViewSet):
 
     slug = 'gis_zkh'
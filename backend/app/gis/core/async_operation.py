@@ -27,6 +27,7 @@ from app.gis.core.exceptions import (
 from app.gis.utils.common import reset_logging, sb, json, pct_of, \
     deep_update, as_guid, get_guid, get_time, mongo_time, fmt_period
 from app.gis.utils.houses import get_binded_houses, get_house_providers
+from app.gis.utils.house_context import HOUSE_CONTEXT
 
 from app.gis.models.choices import (
     GisObjectType, GisOperationType, GisRecordStatusType, GisManagerContext,
@@ -36,6 +37,8 @@ from app.gis.models.choices import (
 from app.gis.models.gis_record import GisRecord, DenormalizedHouseInfoEmbedded, \
     DenormalizedProviderInfoEmbedded
 from app.gis.models.guid import GUID
+from app.gis.models.log_models import GisRecordLog
+from app.gis.models.reconciliation import GisReconciliation
 
 from lib.gridfs import put_file_to_gridfs, get_file_from_gridfs
 
@@ -160,6 +163,11 @@ class AsyncOperation(object):
 
     VERSION: str = None  # поддерживаемая версия элемента запроса
     ELEMENT_LIMIT: int = 0  # ограничение (ГИС ЖКХ) на кол-во элементов запроса
+    REQUEST_SIZE_LIMIT: int = 2 * 1024 * 1024  # оценка размера запроса, байт
+
+    ADAPTIVE_HISTORY: int = 20  # записей истории для подбора кол-ва элементов
+    ADAPTIVE_LATENCY: int = 15 * 60  # целевое время обработки запроса, сек.
+    ADAPTIVE_MIN_LIMIT: int = 10  # минимальное подбираемое кол-во элементов
 
     FORCED_EXECUTION: bool = False  # выполнять операцию в любом состоянии?
 
@@ -171,8 +179,10 @@ class AsyncOperation(object):
     GET_RESULT_DELAY = 30  # задержка перед запросом результата (в обработке)
 
     REQUIREMENTS: dict = {}  # признаки с процентом требуемых ид-ов операции
+    CONTEXT_ATTRS: tuple = ()  # загружаемые _preload общие для частей данные
 
     DEFAULT_LOG_LEVEL: int = WARNING  # (минимальный) уровень журнала операции
+    LOG_FLUSH_SIZE: int = 100  # записей журнала операции в пачке сохранения
     # endregion ПАРАМЕТРЫ ОПЕРАЦИИ
 
     # region ПЕРЕМЕННЫЕ КЛАССА
@@ -184,6 +194,7 @@ class AsyncOperation(object):
 
     _house_providers: dict = None  # обслуживаемые дома управляющих организаций
     _mapped_guids: dict = None  # сопоставления идентификаторов операции
+    _adaptive_limit: int = None  # подобранное по истории кол-во элементов
     # endregion ПЕРЕМЕННЫЕ КЛАССА
 
     # region СТАТИЧЕСКИЕ МЕТОДЫ
@@ -451,7 +462,13 @@ class AsyncOperation(object):
         """Ограничение количества элементов запроса операции"""
         assert isinstance(self.ELEMENT_LIMIT, int), \
             "Некорректное ограничение элементов запроса (0 - без ограничений)"
-        return self['element_limit'] or self.ELEMENT_LIMIT
+        return self['element_limit'] or self._adaptive_limit \
+            or self.ELEMENT_LIMIT
+
+    @property
+    def request_size_limit(self) -> int:
+        """Ограничение (оценки) размера запроса операции, байт"""
+        return self['request_size_limit'] or self.REQUEST_SIZE_LIMIT
 
     @property
     def object_type(self) -> Optional[str]:
@@ -877,13 +894,33 @@ class AsyncOperation(object):
             INFO if info else DEBUG
 
         if level >= self._logger.level and self.debug_mode:
-            if self._record.log is None:  # журнал пуст?
-                self._record.log = [error or warn or info or debug]
-            else:  # журнал имеет записи!
-                self._record.log.append(error or warn or info or debug)
+            # WARN экземпляр загруженной операции создается без __init__
+            log_lines: list = self.__dict__.setdefault('_log_lines', [])
+            log_lines.append(error or warn or info or debug)
+            if len(log_lines) >= self.LOG_FLUSH_SIZE:  # накоплена пачка?
+                self.flush_log()
 
         return self._log(debug, info, warn, error)
 
+    def flush_log(self):
+        """
+        Дописать накопленные записи в журнал (выполнения) операции
+
+        Журнал хранится отдельно от записи об операции (GisRecordLog)
+        """
+        log_lines: list = self.__dict__.get('_log_lines')
+        if not log_lines:  # нет новых записей?
+            return
+
+        logged: dict = self.__dict__.setdefault('_log_written', {})
+        if self.record_id not in logged:  # журнал операции не дописывался?
+            logged[self.record_id] = GisRecordLog.count_of(self.record_id)
+
+        logged[self.record_id] = GisRecordLog.write(
+            self.record_id, log_lines, logged[self.record_id]
+        )
+        self._log_lines = []
+
     def _with(self, gis_record: GisRecord):
         """
         Выполнять операцию с иной записью
@@ -1259,6 +1296,7 @@ class AsyncOperation(object):
 
         self.log("Сохранено состояние (выполнения) операции"
             f" с идентификатором (записи) {record.generated_id}")
+        self.flush_log()  # WARN журнал не входит в запись об операции
 
     def _produce(self, producer: Callable, subjects: Iterable) -> list:
         """
@@ -1674,8 +1712,12 @@ class AsyncOperation(object):
 
         assert requests, \
             "Список подлежащих сохранению идентификаторов не сформирован"
+        # изменения сводки сверки дома загружаются до записи идентификаторов
+        delta = GisReconciliation.delta(self.provider_id, self.house_id,
+            self.name, pending_guids.values()) if self.house_id else None
+
         # TODO ошибки сохранения ид-ов обрабатываются внешним контекстом
-        write_result = GUID.write([*requests.values()])  # записываем данные
+        write_result = GUID.write([*requests.values()], delta)  # записываем
 
         self.log(info=f"В результате записи {len(pending_guids)} GUID"
             f" создано {write_result.inserted_count} новых,"
@@ -1743,15 +1785,21 @@ class AsyncOperation(object):
 
         return UUID(ack.MessageGUID)  # : str - Ид. сообщения ГИС ЖКХ
 
-    def _spread(self) -> GisRecord:
+    def _spread(self, element_limit: int = None) -> GisRecord:
         """
         Распределить аргументы запроса операции
+
+        :param element_limit: кол-во остающихся аргументов, по умолчанию
+            ограничение количества элементов запроса операции
         """
-        assert len(self.object_ids) > self.element_limit > 0, \
+        if element_limit is None:  # не по размеру запроса?
+            element_limit = self.element_limit
+
+        assert len(self.object_ids) > element_limit > 0, \
             "Распределение аргументов запроса не требуется"
 
         # WARN запись о порождающей операции сохраняется менеджером
-        child_record: GisRecord = self._record.heir(self.element_limit)
+        child_record: GisRecord = self._record.heir(element_limit)
         assert self.child_id == child_record.generated_id, \
             "Связь порождающей операции с порожденной не установлена"
         assert child_record.object_ids, \
@@ -1777,6 +1825,203 @@ class AsyncOperation(object):
         self.log(info="Загрузка необходимых для выполнения"
             f" операции {self.record_id} данных не требуется")
 
+    def _context_key(self) -> tuple:
+        """Ключ общих для частей операции данных (контекста) дома"""
+        # порожденные части связаны с порождающей или первой частью
+        return self.house_id, self.parent_id or self.record_id, \
+            self.object_type
+
+    def _share_context(self, object_ids: list):
+        """
+        Сохранить загруженные данные для порожденных частей операции
+        """
+        if not self.CONTEXT_ATTRS:  # нет общих для частей данных?
+            return
+
+        context: dict = {attr: getattr(self, attr)
+            for attr in self.CONTEXT_ATTRS if hasattr(self, attr)}
+
+        if HOUSE_CONTEXT.put(*self._context_key(), object_ids, context):
+            self.log(info="Сохранены общие для частей операции"
+                f" {self.record_id} данные {len(object_ids)} объектов")
+
+    def _restore_context(self) -> bool:
+        """
+        Получить загруженные порождающей частью операции данные
+
+        :returns: True - данные получены, загрузка не требуется
+        """
+        if not self.CONTEXT_ATTRS or not self.is_fractured \
+                or self.is_first:  # WARN первая часть загружает данные
+            return False
+
+        context: dict = HOUSE_CONTEXT.get(*self._context_key(),
+            self.object_ids)
+        if context is None or \
+                any(attr not in context for attr in self.CONTEXT_ATTRS):
+            return False
+
+        for attr, value in context.items():
+            setattr(self, attr, value)
+
+        self.log(info="Получены загруженные порождающей частью"
+            f" данные операции {self.record_id}")
+        return True
+
+    def _adapt_limit(self):
+        """
+        Подобрать ограничение количества элементов запроса по истории
+
+        Учитываются последние запросы операции организации: средний размер
+        элемента (в пределах request_size_limit), время обработки ГИС ЖКХ
+        (в пределах ADAPTIVE_LATENCY) и не принятые ГИС ЖКХ запросы
+        (вдвое меньше отклоненного, если больший с тех пор не выполнен)
+        """
+        if not self.ELEMENT_LIMIT or self['element_limit'] \
+                or len(self.object_ids) <= self.ADAPTIVE_MIN_LIMIT:
+            return  # ограничение не подбирается
+
+        limit: int = self.ELEMENT_LIMIT  # WARN не превышает допустимое
+        passed: int = 0  # наибольшее кол-во элементов принятого запроса
+
+        for record in GisRecord.request_history(self.name, self.provider_id,
+                self.object_type, self.ADAPTIVE_HISTORY):  # от последних
+            count: int = len(record.get('object_ids') or [])
+            if not count:  # запрос без аргументов?
+                continue
+
+            limit = min(limit,  # по среднему размеру элемента
+                self.request_size_limit * count // record['request_size'])
+
+            if not record.get('acked'):  # запрос не принят ГИС ЖКХ?
+                if record['status'] == GisRecordStatusType.ERROR \
+                        and count > passed:  # больший не принят?
+                    limit = min(limit, count // 2)
+                continue
+            passed = max(passed, count)
+
+            latency: float = (record['stated'] - record['acked']) \
+                .total_seconds() if record.get('stated') else 0
+            if latency > 0 and \
+                    record['status'] in SUCCESSFUL_STATUSES:  # обработан?
+                limit = min(limit,
+                    int(self.ADAPTIVE_LATENCY * count / latency))
+
+        limit = max(limit, min(self.ADAPTIVE_MIN_LIMIT, self.ELEMENT_LIMIT))
+        if limit < self.ELEMENT_LIMIT:
+            self.log(warn=f"По истории выполнения установлено ограничение"
+                f" в {limit} элементов запроса операции"
+                f" от {self.ELEMENT_LIMIT} максимально допустимых")
+        self._adaptive_limit = limit
+
+    @staticmethod
+    def _request_size(request_data: dict) -> int:
+        """Оценка размера (сериализованного) запроса операции, байт"""
+        from json import dumps  # WARN кириллица в UTF-8, а не \uXXXX
+
+        return len(dumps(request_data, default=str,
+            ensure_ascii=False).encode())
+
+    @classmethod
+    def _request_elements(cls, request_data) -> list:
+        """Самый длинный (множественный) элемент данных запроса"""
+        longest: list = []
+        values = request_data.values() if isinstance(request_data, dict) \
+            else request_data if isinstance(request_data, list) else []
+        for value in values:
+            if isinstance(value, list) and len(value) > len(longest):
+                longest = value
+            nested: list = cls._request_elements(value) \
+                if isinstance(value, (dict, list)) else []
+            if len(nested) > len(longest):
+                longest = nested
+        return longest
+
+    def _fitting_count(self, request_data: dict, request_size: int) -> int:
+        """
+        Количество остающихся в запросе аргументов
+
+        Размер каждого (сформированного) элемента множественных данных
+        запроса накапливается до допустимого размера запроса, элементы
+        сопоставляются аргументам по порядку (или пропорционально)
+        """
+        object_count: int = len(self.object_ids)
+        elements: list = self._request_elements(request_data)
+        if elements:  # множественные данные запроса?
+            sizes: list = [self._request_size(element) + 1  # с разделителем
+                for element in elements]
+            budget: int = self.request_size_limit \
+                - (request_size - sum(sizes))  # без множественных данных
+            fitting, total = 0, 0
+            for size in sizes:
+                if total + size > budget:
+                    break
+                total += size
+                fitting += 1
+            if len(elements) != object_count:  # не по элементу на аргумент?
+                fitting = object_count * fitting // len(elements)
+        else:  # WARN размер аргументов принимается одинаковым
+            fitting = object_count * self.request_size_limit // request_size
+
+        if self.element_limit > 0:  # ограничение количества элементов
+            fitting = min(fitting, self.element_limit)
+        return min(max(fitting, 1), object_count - 1)  # хотя бы 1 в части
+
+    def _fit_request(self, request_data: dict) -> bool:
+        """
+        Распределить аргументы превышающего допустимый размер запроса
+
+        :returns: True - аргументы распределены, требуется формирование
+        """
+        request_size: int = self._request_size(request_data)
+        self._record.request_size = request_size
+
+        if request_size <= self.request_size_limit \
+                or len(self.object_ids) < 2:  # не делится?
+            return False
+
+        fitting: int = self._fitting_count(request_data, request_size)
+        self.log(warn=f"Размер запроса операции {self.record_id}"
+            f" ({request_size} байт) превышает {self.request_size_limit},"
+            f" в запросе остаются {fitting} из {len(self.object_ids)}"
+            " аргументов")
+
+        is_dispatched: bool = bool(self.child_id) and self._is_parallel
+        is_shared: bool = bool(self.parent_id or self.is_fractured)
+        is_inserted: bool = bool(self.child_id) and bool(self.is_fractured)
+        object_ids: list = self.object_ids  # до распределения
+
+        child_record: GisRecord = self._spread(fitting)
+        if is_inserted:  # номер следующей части уже занят порожденной?
+            parts: int = 1 + GisRecord.objects(  # с первой (порождающей)
+                parent_id=self.parent_id or self.record_id,  # индекс
+                fraction__ne=None,
+            ).count()  # WARN включая сохраненную выделенную часть
+            child_record.fraction = [parts, parts]  # дополнительная часть
+        if is_dispatched:  # порожденная выполняется параллельно?
+            child_record.child_id = None  # WARN не выполняем повторно
+        if is_inserted or is_dispatched:
+            child_record.save()
+        if not is_shared:  # данные не сохранены для частей?
+            self._share_context(object_ids)
+
+        self._mapped_guids = {}  # WARN сопоставления формируются заново
+        return True
+
+    @property
+    def _is_parallel(self) -> bool:
+        """Порожденная часть формирует запрос параллельно с текущей?"""
+        return not self.is_forced and not self.is_synchronous
+
+    def _execute_child(self):
+        """
+        Инициировать выполнение порожденной операции
+        """
+        self.log(info=f"Выполняется следующая за {self.record_id}"
+            f" порожденная {self.parent_id or 'текущей'} операция"
+                f" с идентификатором записи {self.child_id}")
+        self.execute(self.child_id)  # выполняем порожденную операцию
+
     def make_request(self):
         """
         Сформировать и отправить сообщение (с запросом) в ГИС ЖКХ
@@ -1784,11 +2029,17 @@ class AsyncOperation(object):
         with self.manager(GisManagerContext.SPREAD) as context:  # безусловно
             self._purge_guids()  # инициализируем сопоставления
 
-            self._preload()  # WARN выбрасывает откладывающее исключение
+            is_restored: bool = self._restore_context()  # загружены ранее?
+            if not is_restored:  # WARN первая часть или без общих данных
+                self._preload()  # WARN выбрасывает откладывающее исключение
             self._record.pending_id = None  # предшествующей нет или выполнена
 
+            self._adapt_limit()  # WARN до распределения аргументов
             if len(self.object_ids) > self.element_limit > 0:  # по умолчанию 0
+                object_ids: list = self.object_ids  # до распределения
                 self._spread()  # WARN создается связь порождающей с порожденной
+                if not is_restored:  # WARN сохранено порождающей частью
+                    self._share_context(object_ids)  # для порожденных частей
             else:  # ограничения количества аргументов нет или удовлетворено!
                 self.log("Ограничение количества аргументов запроса"
                     f" операции {self.record_id} не требуется")
@@ -1804,6 +2055,12 @@ class AsyncOperation(object):
             # WARN предупреждение подавляется в задаче send_request
             raise context.exception  # завершаем выполнение текущей операции
 
+        # порожденная часть формирует запрос параллельно с текущей
+        # WARN в последовательном режиме - после формирования запроса
+        is_dispatched: bool = bool(self.child_id) and self._is_parallel
+        if is_dispatched:  # порожденная операция?
+            self._execute_child()
+
         self.log("Формирование данных запроса операции ГИС ЖКХ"
             f" с идентификатором сообщения {self.message_guid}")
 
@@ -1812,8 +2069,18 @@ class AsyncOperation(object):
                 self.log(f"Идентификаторы операции {self.record_id}"
                     " сопоставлены до начала формирования запроса")
 
+            fails, warnings = self._record.fails, \
+                [*self._record.warnings] if self._record.warnings else None
             # перед формированием создается (изменяемая) копия данных запроса
             request_data: dict = deep_update(self._request(), self._compose())
+            # WARN делится до соответствия размеру (или одного аргумента)
+            while self._fit_request(request_data):  # превышен размер?
+                self._record.fails = fails  # WARN ошибки объектов заново
+                self._record.warnings = warnings
+                request_data = deep_update(self._request(), self._compose())
+                if self._is_parallel:  # WARN иначе после отправки запроса
+                    self._execute_child()  # выполняем выделенную часть
+                    is_dispatched = True
             # проверяем наличие (непустых) элементов запроса операции
             if not request_data:  # запрос не сформирован?
                 raise NoRequestWarning("Запрос операции не сформирован")
@@ -1831,11 +2098,9 @@ class AsyncOperation(object):
 
             self.flush_guids()  # WARN сохраняем подготовленные идентификаторы
 
-        if self.child_id and not self.is_forced:  # порожденная операция?
-            self.log(info=f"Выполняется следующая за {self.record_id}"
-                f" порожденная {self.parent_id or 'текущей'} операция"
-                    f" с идентификатором записи {self.child_id}")
-            self.execute(self.child_id)  # выполняем порожденную операцию
+        if self.child_id and not self.is_forced \
+                and not is_dispatched:  # порожденная операция?
+            self._execute_child()
 
         # WARN проверка предупреждения ПОСЛЕ запуска порожденной операции
         if context.exception:  # при формировании получено предупреждение?
@@ -0,0 +1,19 @@
+"""Постановка в очереди плановых задач (reanimate, resurrect) записей
+об операциях, сохраненных до появления очередей.
+
+Выполняется однократно, плановые задачи читают только очереди:
+
+    python -m app.gis.migrations.fill_queues [дней назад]
+"""
+import sys
+
+from mongoengine_connections import register_mongoengine_connections
+
+from app.gis.models.gis_record import GisRecord
+from app.gis.utils.common import get_time
+
+
+if __name__ == '__main__':
+    register_mongoengine_connections()
+    after = get_time(days=-int(sys.argv[1])) if len(sys.argv) > 1 else None
+    print('queued', GisRecord.fill_queues(after))
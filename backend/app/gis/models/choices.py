@@ -96,6 +96,29 @@ IDLE_RECORD_STATUSES = (
     GisRecordStatusType.CANCELED,
 )  # TODO пополнить список состояний бесперспективных операций
 
+RESURRECTABLE_ERRORS = (
+    "Исчерпан лимит получения результата обработки сообщения",
+    "EXP001000: Произошла ошибка при передаче данных. Попробуйте"
+    " осуществить передачу данных повторно. В случае, если повторная"
+    " передача данных не проходит - направьте обращение в службу"
+    " поддержки пользователей ГИС ЖКХ.",
+    "Превышено ограничение по времени выполнения"
+    " задачи отправки запроса операции",
+    "Превышено ограничение по времени выполнения"
+    " задачи получения результата операции",
+)  # ошибки (сбои) ГИС ЖКХ, после которых операция перезапускается
+
+
+class GisRecordQueueType:
+    REANIMATE = 'reanimate'  # выполняемые ГИС ЖКХ (ожидают результата)
+    RESURRECT = 'resurrect'  # не выполненные из-за сбоя ГИС ЖКХ
+
+
+GIS_RECORD_QUEUE_CHOICES = (
+    (GisRecordQueueType.REANIMATE, 'Получение результата'),
+    (GisRecordQueueType.RESURRECT, 'Перезапуск после сбоя'),
+)
+
 GIS_RECORD_OLD_STATUS_CHOICES = (
     ('created', '-Создана-'),
     ('pending', '-Ожидает-'),
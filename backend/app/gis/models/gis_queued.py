@@ -2,6 +2,8 @@ from settings import GIS
 
 from bson import ObjectId
 
+from pymongo import UpdateOne
+
 from mongoengine.document import Document
 from mongoengine.fields import ObjectIdField, StringField, DateTimeField
 
@@ -99,6 +101,37 @@ class GisQueued(Document):
         """
         Поставить документ в очередь на выгрузку в ГИС ЖКХ
         """
+        return cls.export(document.__class__.__name__, document.id,
+            cls._house_id_of(document), **time_delta)
+
+    @classmethod
+    def put_many(cls, documents: list, **time_delta) -> int:
+        """
+        Поставить документы в очередь на выгрузку в ГИС ЖКХ (одним запросом)
+
+        :returns: кол-во созданных и обновленных записей
+        """
+        if not documents:
+            return 0
+
+        if not time_delta:
+            time_delta = {'minutes': cls._DEFAULT_MIN_DELAY}
+
+        saved = get_time()
+        scheduled = get_time(**time_delta)
+
+        result = cls._get_collection().bulk_write([UpdateOne({
+            'object_id': document.id, 'house_id': cls._house_id_of(document),
+            'object_type': document.__class__.__name__,
+        }, {
+            '$set': {'saved': saved, 'scheduled': scheduled},
+        }, upsert=True) for document in documents], ordered=False)
+
+        return result.upserted_count + result.modified_count
+
+    @staticmethod
+    def _house_id_of(document: Document) -> ObjectId:
+        """Идентификатор дома выгружаемого документа"""
         class_name: str = document.__class__.__name__
 
         from app.house.models.house import House
@@ -109,24 +142,23 @@ class GisQueued(Document):
         from processing.models.billing.accrual import Accrual
 
         if isinstance(document, House):  # включая подъезды и лифты
-            house_id = document.id  # house_id = object_id
+            return document.id  # house_id = object_id
         elif isinstance(document, Area):  # включая комнаты
-            house_id = document.house.id
+            return document.house.id
         elif isinstance(document, Tenant):
-            house_id = document.area.house.id
+            return document.area.house.id
         elif isinstance(document, AreaMeter):
-            house_id = document.area.house.id
+            return document.area.house.id
         elif isinstance(document, HouseMeter):
-            house_id = document.house.id
+            return document.house.id
         elif isinstance(document, AccrualDoc):
-            house_id = document.house.id  # из ЛС
+            return document.house.id  # из ЛС
         elif isinstance(document, Accrual):
-            house_id = document.account.house.id  # из ЛС
-        else:  # неизвестный тип объекта?
-            raise NotImplementedError("Выгрузка в ГИС ЖКХ объекта"
-                f" типа {sb(class_name)} не поддерживается")
+            return document.account.house.id  # из ЛС
 
-        return cls.export(class_name, document.id, house_id, **time_delta)
+        # неизвестный тип объекта?
+        raise NotImplementedError("Выгрузка в ГИС ЖКХ объекта"
+            f" типа {sb(class_name)} не поддерживается")
 
     @classmethod
     def distributed(cls, *type_s: str) -> dict:
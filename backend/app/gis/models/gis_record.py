@@ -4,6 +4,7 @@ from datetime import datetime
 from uuid import UUID
 from bson import ObjectId
 
+from pymongo import UpdateOne
 from mongoengine import QuerySet, Document, EmbeddedDocument, BooleanField
 from mongoengine.fields import StringField, IntField, DateTimeField, \
     DictField, ListField, ObjectIdField, UUIDField, EmbeddedDocumentField
@@ -12,9 +13,11 @@ from app.gis.models.choices import (
     GisRecordStatusType,
     GIS_OPERATION_CHOICES, CANCELABLE_STATUSES, GIS_RECORD_STATUSES,
     GIS_RECORD_STATUS_CHOICES, GIS_RECORD_OLD_STATUS_CHOICES, GisTaskStateType,
-    GIS_TASK_STATE_CHOICES
+    GIS_TASK_STATE_CHOICES,
+    GisRecordQueueType, GIS_RECORD_QUEUE_CHOICES, RESURRECTABLE_ERRORS
 )
 
+from app.gis.models.log_models import GisRecordLog
 from app.gis.utils.common import get_guid, get_time, deep_update, dt_from
 from processing.models.billing.embeddeds.base import DenormalizedEmbeddedMixin
 
@@ -82,6 +85,10 @@ class GisRecord(Document):
             ('agent_id', '-saved'),
             ('provider_id', '-saved'),  # порядок(-) только в составных индексах
             ('status', '-saved'),  # purge
+            {
+                'fields': ['queue', 'queued'],  # очереди плановых задач
+                'partialFilterExpression': {'queue': {'$exists': True}},
+            },
         ], index_background=True, auto_create_index=False,
     )
     # TODO collection = GisRecord._get_collection()
@@ -129,6 +136,8 @@ class GisRecord(Document):
     period = DateTimeField(verbose_name="Период (первое число месяца) данных")
     request = DictField(default=None,  # по умолчанию default = {}
         verbose_name="Ключевая (сформированная) часть запроса операции")
+    request_size = IntField(  # заполняется при формировании запроса
+        verbose_name="Оценка размера (сериализованного) запроса, байт")
 
     fraction = ListField(field=IntField(min_value=1), default=None,  # [cur,tot]
         verbose_name="Порядковый номер подзапроса и их общее количество")
@@ -179,7 +188,12 @@ class GisRecord(Document):
     trace = StringField(verbose_name="Причина возникновения ошибки (если есть)")
 
     log = ListField(StringField(min_length=1), default=None,  # не []
-        verbose_name="Журнал (выполнения) операции")
+        verbose_name="Журнал (выполнения) операции")  # WARN см. GisRecordLog
+    queue = StringField(choices=GIS_RECORD_QUEUE_CHOICES,  # None не хранится
+        verbose_name="Очередь (обработки плановой задачей) операции")
+    queued = DateTimeField(
+        verbose_name="Время постановки операции в очередь")
+
     task_owner = ObjectIdField(
         null=True,
         default=None,
@@ -198,6 +212,11 @@ class GisRecord(Document):
             self.request.get('version') if self.request else None
         ) or 'ОТСУТСТВУЕТ'
 
+    @property
+    def journal(self) -> list:
+        """Журнал (выполнения) операции, включая хранимый в записи"""
+        return (self.log or []) + GisRecordLog.lines_of(self.generated_id)
+
     @property
     def is_import(self) -> bool:
         """Запись об операции импорта (загрузки в) ГИС ЖКХ?"""
@@ -255,6 +274,26 @@ class GisRecord(Document):
         }).distinct('id')  # .count?
     # endregion СВОЙСТВА ЗАПИСИ ОБ ОПЕРАЦИИ
 
+    @classmethod
+    def request_history(cls, operation: str, provider_id: ObjectId,
+            object_type: str = None, limit: int = 20) -> list:
+        """
+        Данные последних выполненных (или нет) запросов операции
+
+        :returns: [ { object_ids, request_size, acked, stated, status } ]
+        """
+        return list(cls.objects(__raw__={
+            'provider_id': provider_id,  # ('provider_id', '-saved')
+            'operation': operation, 'object_type': object_type,
+            'status': {'$in': [
+                GisRecordStatusType.DONE, GisRecordStatusType.WARNING,
+                GisRecordStatusType.ERROR,
+            ]},
+            'request_size': {'$ne': None},  # запрос был сформирован
+        }).only(
+            'object_ids', 'request_size', 'acked', 'stated', 'status',
+        ).order_by('-saved').limit(limit).as_pymongo())
+
     @classmethod
     def insert_the(cls, data: dict):
         """Сохранить запись об операции"""
@@ -436,6 +475,27 @@ class GisRecord(Document):
 
         self.saved = get_time()  # дата и время последнего сохранения
 
+        self._set_queue()  # WARN после даты и времени сохранения
+
+    def _set_queue(self):
+        """
+        Поставить в очередь (или исключить из очереди) плановой задачи
+
+        Операция входит в очередь и покидает ее при изменении состояния
+        """
+        if self.status == GisRecordStatusType.EXECUTING and self.acked:
+            queue, queued = GisRecordQueueType.REANIMATE, self.acked
+        elif self.status == GisRecordStatusType.ERROR \
+                and self.error in RESURRECTABLE_ERRORS:
+            queue, queued = GisRecordQueueType.RESURRECT, self.saved
+        else:  # не подлежит обработке плановыми задачами!
+            queue, queued = None, None
+
+        if self.queue != queue:  # операция сменила очередь?
+            self.queue, self.queued = queue, queued
+        elif queue == GisRecordQueueType.REANIMATE:
+            self.queued = queued  # квитанция могла быть получена повторно
+
     def warning(self, message: str):
         """Добавить предупреждение в запись об операции"""
         if self.warnings is None:  # список предупреждений пуст?
@@ -504,9 +564,91 @@ class GisRecord(Document):
 
         if record_ids:
             cls.objects(__raw__={'_id': {'$in': record_ids}}).delete()
+            GisRecordLog.purge(record_ids)  # не дожидаясь истечения срока
 
         return record_ids
 
+    @classmethod
+    def queued_in(cls, queue: str, before: datetime,
+            limit: int = None) -> QuerySet:
+        """
+        Находящиеся в очереди ранее указанного времени (записи об) операции
+
+        :param limit: ограничение количества записей
+        """
+        records: QuerySet = cls.objects(__raw__={
+            'queue': queue, 'queued': {'$lt': before},
+        }).order_by('queued')  # индекс
+
+        return records.limit(limit) if limit else records
+
+    @classmethod
+    def dequeue_stale(cls, queue: str, saved_before: datetime) -> int:
+        """
+        Исключить из очереди неактуальные (давно не сохранявшиеся) операции
+
+        :returns: количество исключенных из очереди операций
+        """
+        return cls.objects(__raw__={
+            'queue': queue, 'saved': {'$lte': saved_before},
+        }).update(unset__queue=1, unset__queued=1)
+
+    @classmethod
+    def queue_stats(cls, queue: str, before: datetime) -> tuple:
+        """
+        Глубина очереди и отставание (в секундах) ее обработки
+
+        :param before: время, ранее которого операции подлежат обработке
+        :returns: кол-во операций в очереди, время ожидания первой в очереди
+        """
+        depth: int = cls.objects(__raw__={'queue': queue}).count()
+
+        first: dict = cls.queued_in(queue, before, 1) \
+            .only('queued').as_pymongo().first()
+        lag: int = int((before - first['queued']).total_seconds()) \
+            if first else 0
+
+        return depth, lag
+
+    @classmethod
+    def fill_queues(cls, after: datetime = None) -> int:
+        """
+        Поставить в очереди сохраненные до их появления (записи об) операции
+
+        Выполняется однократно (app/gis/migrations/fill_queues.py), далее
+        очереди заполняются при сохранении записей
+
+        :param after: сохраненные после указанной даты, по умолчанию все
+        :returns: количество поставленных в очереди операций
+        """
+        collection = cls._get_collection()
+
+        query: dict = {'$or': [
+            {'status': GisRecordStatusType.EXECUTING, 'acked': {'$ne': None}},
+            {'status': GisRecordStatusType.ERROR,
+                'error': {'$in': list(RESURRECTABLE_ERRORS)}},
+        ], 'queue': {'$exists': False}}
+        if after:  # сохраненные после даты?
+            query['saved'] = {'$gt': after}
+
+        requests: list = []
+        queued_count: int = 0
+        for record in collection.find(query,
+                {'status': 1, 'acked': 1, 'saved': 1}):
+            queue, queued = (GisRecordQueueType.REANIMATE, record['acked']) \
+                if record['status'] == GisRecordStatusType.EXECUTING \
+                else (GisRecordQueueType.RESURRECT, record['saved'])
+            requests.append(UpdateOne({'_id': record['_id']}, {
+                '$set': {'queue': queue, 'queued': queued},
+            }))
+            if len(requests) >= 1000:
+                queued_count += collection.bulk_write(requests).modified_count
+                requests = []
+        if requests:
+            queued_count += collection.bulk_write(requests).modified_count
+
+        return queued_count
+
 
 if __name__ == '__main__':
 
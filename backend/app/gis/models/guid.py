@@ -222,8 +222,13 @@ class GUID(Document, GisTransportable):
         return GUID.OBJECT_TAGS.get(tag) or f"с признаком {sb(tag)}"
 
     @classmethod
-    def write(cls, requests: list) -> BulkWriteResult:
-        """Выполнить запросы на изменение данных в БД"""
+    def write(cls, requests: list, delta=None) -> BulkWriteResult:
+        """
+        Выполнить запросы на изменение данных в БД
+
+        :param delta: изменения сводки сверки дома (ReconciliationDelta),
+            вносятся после успешной записи идентификаторов
+        """
         try:
             pymongo_collection = cls._get_collection()  # низкоуровневая
 
@@ -246,6 +251,9 @@ class GUID(Document, GisTransportable):
             raise InternalError(details='\n'.join(error['errmsg']
                 for error in bulk_write_error.details['writeErrors']))
 
+        if delta is not None:  # изменяется сводка сверки дома?
+            delta.apply()  # WARN ошибки изменения сводки не возбуждаются
+
         return write_result
     # endregion КЛАССОВЫЕ МЕТОДЫ
 
@@ -1,6 +1,8 @@
 import datetime
 
-from mongoengine import Document, DateTimeField, StringField
+from bson import ObjectId
+from mongoengine import Document, DateTimeField, StringField, IntField, \
+    ListField, ObjectIdField
 
 
 class GisInErrorsLog(Document):
@@ -15,3 +17,93 @@ class GisInErrorsLog(Document):
     }
     created = DateTimeField(default=datetime.datetime.now)
     message = StringField()
+
+
+class GisRecordLog(Document):
+    """
+    Блок журнала (выполнения) операции
+
+    Записи журнала дописываются пачками в блок текущего часа, заполненный
+    блок продолжается новым. Количество записей операции ограничено,
+    блоки удаляются по истечении срока хранения (TTL-индекс)
+    """
+    meta = {
+        'db_alias': 'logs-db',
+        'collection': 'gis_record_log',
+        'index_background': True,
+        'auto_create_index': False,
+        'indexes': [
+            ('record_id', 'bucket'),
+            {'fields': ['expires'], 'expireAfterSeconds': 0},
+        ],
+    }
+
+    BUCKET_SIZE = 1000  # записей в блоке журнала
+    RECORD_LIMIT = 20000  # записей журнала одной операции
+    KEEP_DAYS = 62  # срок хранения журнала (не меньше срока хранения записи)
+
+    record_id = ObjectIdField(required=True,
+        verbose_name="Идентификатор записи об операции")
+    bucket = DateTimeField(required=True,
+        verbose_name="Начало (часа) периода записей блока")
+    expires = DateTimeField(verbose_name="Время удаления блока журнала")
+    count = IntField(default=0, verbose_name="Количество записей блока")
+    lines = ListField(StringField(), verbose_name="Записи журнала")
+
+    @classmethod
+    def count_of(cls, record_id: ObjectId) -> int:
+        """Количество записей журнала операции"""
+        result = list(cls.objects(record_id=record_id).aggregate(
+            {'$group': {'_id': None, 'count': {'$sum': '$count'}}},
+        ))
+        return result[0]['count'] if result else 0
+
+    @classmethod
+    def write(cls, record_id: ObjectId, lines: list, written: int = 0) -> int:
+        """
+        Дописать записи в журнал операции
+
+        :param written: количество ранее внесенных записей операции
+        :returns: количество внесенных записей операции с учетом новых
+        """
+        if written >= cls.RECORD_LIMIT or not lines:
+            return written
+        lines = lines[:cls.RECORD_LIMIT - written]
+        if written + len(lines) >= cls.RECORD_LIMIT:
+            lines[-1] = f"Журнал операции ограничен {cls.RECORD_LIMIT} записями"
+
+        now = datetime.datetime.now()
+        bucket = now.replace(minute=0, second=0, microsecond=0)
+        expires = now + datetime.timedelta(days=cls.KEEP_DAYS)
+        collection = cls._get_collection()
+        for ix in range(0, len(lines), cls.BUCKET_SIZE):
+            chunk = lines[ix: ix + cls.BUCKET_SIZE]
+            collection.update_one(
+                {
+                    'record_id': record_id,
+                    'bucket': bucket,
+                    'count': {'$lte': cls.BUCKET_SIZE - len(chunk)},
+                },  # заполненный блок продолжается новым
+                {
+                    '$push': {'lines': {'$each': chunk}},
+                    '$inc': {'count': len(chunk)},
+                    '$max': {'expires': expires},
+                },
+                upsert=True,
+            )
+        return written + len(lines)
+
+    @classmethod
+    def lines_of(cls, record_id: ObjectId) -> list:
+        """Записи журнала операции в порядке внесения"""
+        lines = []
+        for log in cls.objects(
+                record_id=record_id,
+        ).order_by('bucket', 'id').only('lines').as_pymongo():
+            lines.extend(log.get('lines') or [])
+        return lines
+
+    @classmethod
+    def purge(cls, record_ids: list):
+        """Удалить журналы операций"""
+        cls.objects(record_id__in=record_ids).delete()
@@ -1,12 +1,14 @@
 from uuid import UUID
 from bson import ObjectId
 
+from pymongo import UpdateOne
 from mongoengine import Document, QuerySet, \
-    ObjectIdField, UUIDField, IntField, StringField, BooleanField
+    ObjectIdField, UUIDField, IntField, StringField, BooleanField, \
+    DateTimeField
 
 from processing.models.billing.service_type import ServiceTypeGisName
 
-from app.gis.utils.common import sb, as_guid
+from app.gis.utils.common import sb, as_guid, get_time
 from app.gis.utils.nsi import NSI_GROUP, NSIRAO_GROUP, PRIVATE_GROUP, \
     get_list_group
 
@@ -18,6 +20,8 @@ PRIVATE_SERVICES: dict = {
          ' (главный коммунальный ресурс)'  # частные случаи НСИ 2?
 }
 
+NSI_BULK_SIZE = 1000  # ссылок в одном bulk_write
+
 
 class nsiRef(Document):
     """Ссылка на элемент справочника"""
@@ -133,6 +137,62 @@ class nsiRef(Document):
 
         return nsi_ref  # : nsiRef
 
+    @classmethod
+    def store_many(cls, registry_number: int, elements: list,
+            provider_id: ObjectId = None) -> int:
+        """
+        Создать (или обновить) ссылки на элементы справочника
+
+        Записываются только новые и измененные ссылки, ссылки с теми же
+        кодами, но иными идентификаторами (ППАК и СИТ) удаляются
+
+        :param elements: [ (идентификатор, код, название) ]
+        :returns: количество записанных ссылок
+        """
+        refs: dict = {}  # идентификатор: (код, название)
+        for element_guid, element_code, element_name in elements:
+            if not isinstance(element_guid, UUID):
+                element_guid = as_guid(element_guid)
+            assert isinstance(element_guid, UUID), \
+                "Некорректный идентификатор элемента справочника"
+            refs[element_guid] = (element_code, element_name)
+        if not refs:  # нет элементов?
+            return 0
+
+        collection = cls._get_collection()
+
+        replaced_query: dict = {'reg_num': registry_number,  # ~ by_code
+            'code': {'$in': [code for code, _ in refs.values()]},
+            '_id': {'$nin': [*refs]}}
+        if provider_id:
+            replaced_query['provider_id'] = provider_id
+        collection.delete_many(replaced_query)  # WARN изменить ключ нельзя
+
+        existing: dict = {ref['_id']: ref for ref in collection.find(
+            {'_id': {'$in': [*refs]}}, {'reg_num': 1, 'code': 1, 'name': 1},
+        )}
+
+        requests: list = []
+        for element_guid, (element_code, element_name) in refs.items():
+            ref: dict = existing.get(element_guid)
+            if ref and ref.get('reg_num') == registry_number and \
+                    ref.get('code') == element_code and \
+                    ref.get('name') == element_name:  # не изменилась?
+                continue
+
+            update: dict = {'$set': {'reg_num': registry_number,
+                'code': element_code, 'name': element_name}}
+            if provider_id:  # WARN организация ссылки не изменяется
+                update['$setOnInsert'] = {'provider_id': provider_id}
+            requests.append(UpdateOne({'_id': element_guid}, update,
+                upsert=True))
+
+        for start in range(0, len(requests), NSI_BULK_SIZE):
+            collection.bulk_write(requests[start:start + NSI_BULK_SIZE],
+                ordered=False)
+
+        return len(requests)
+
     @classmethod
     def remove(cls, element_guid) -> None:
         """
@@ -242,3 +302,68 @@ class nsiRef(Document):
         ).order_by('-created').first() if code else None  # код 0 не встречается
 
         return gis_ref.as_req if gis_ref else None
+
+
+class nsiSync(Document):
+    """Состояние загрузки (изменений) справочника"""
+
+    meta = {
+        'db_alias': 'legacy-db',
+        'collection': 'NSISync',
+        'indexes': [
+            {'fields': ['reg_num', 'provider_id'], 'unique': True},
+        ], 'index_background': True, 'auto_create_index': False,
+    }
+
+    reg_num = IntField(required=True, verbose_name="Реестровый № справочника")
+    provider_id = ObjectIdField(  # только для частных справочников
+        verbose_name="Идентификатор организации")
+
+    modified = DateTimeField(
+        verbose_name="Время изменения последнего загруженного элемента")
+    synced = DateTimeField(verbose_name="Время последней загрузки")
+
+    @classmethod
+    def watermarks(cls, *reg_num_s: int, provider_id: ObjectId = None) -> dict:
+        """
+        Время изменения последних загруженных элементов справочников
+
+        :returns: { RegistryNumber: ModifiedAfter }
+        """
+        # WARN ГИС ЖКХ возвращает время без часового пояса, так и передаем
+        return {sync['reg_num']: sync['modified']
+            for sync in cls.objects(__raw__={
+                'reg_num': {'$in': [*reg_num_s]}, 'provider_id': provider_id,
+                'modified': {'$ne': None},
+            }).only('reg_num', 'modified').as_pymongo()}
+
+    @staticmethod
+    def last_modified(item_elements, modified=None):
+        """Время изменения последнего из элементов (или modified)"""
+        modified_s: list = [element.Modified for element in item_elements
+            if getattr(element, 'Modified', None)]
+        if modified:  # загруженных ранее (страниц справочника) элементов?
+            modified_s.append(modified)
+
+        return max(modified_s) if modified_s else None
+
+    @classmethod
+    def advance(cls, registry_number: int, item_elements,
+            provider_id: ObjectId = None, modified=None) -> None:
+        """
+        Сдвинуть время изменения последнего загруженного элемента
+
+        Время определяется по (всем) полученным элементам справочника
+
+        :param modified: время изменения последнего элемента предыдущих
+            страниц справочника
+        """
+        update: dict = {'$set': {'synced': get_time()}}
+
+        modified = cls.last_modified(item_elements, modified)
+        if modified:  # получены элементы с временем изменения?
+            update['$max'] = {'modified': modified}
+
+        cls._get_collection().update_one(
+            {'reg_num': registry_number, 'provider_id': provider_id},
+            update, upsert=True)
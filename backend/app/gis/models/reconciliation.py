@@ -0,0 +1,275 @@
+import logging
+from collections import Counter
+
+from bson import ObjectId
+
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+from mongoengine import Document, ObjectIdField, DictField, DateTimeField
+
+from app.gis.models.choices import GisObjectType, GisRecordStatusType, \
+    GisGUIDStatusType
+from app.gis.models.gis_record import GisRecord
+from app.gis.models.guid import GUID
+
+from app.gis.utils.common import get_time
+
+logger = logging.getLogger('c300')
+
+RECONCILED_TAGS: set = {
+    GisObjectType.HOUSE, GisObjectType.AREA,
+    *GUID.ACCOUNT_TAGS, *GUID.METER_TAGS,
+}  # признаки сверяемых объектов дома
+
+RECONCILIATION_BULK_SIZE = 500  # сводок домов в одном bulk_write
+
+
+def _is_true(guid: dict) -> bool:
+    """Данные ГИС ЖКХ (документа) идентификатора загружены? ~ GUID.is_true"""
+    if guid['tag'] in GUID.UNIQUE_TAGS:
+        return guid.get('unique') is not None
+    elif guid['tag'] in GUID.VERSION_TAGS:
+        return guid.get('version') is not None
+
+    return guid.get('gis') is not None or guid.get('root') is not None
+
+
+class GisReconciliation(Document):
+    """
+    Сводка сверки объектов дома организации с ГИС ЖКХ
+
+    Количество идентификаторов по признакам и состояниям, несопоставленные
+    (без данных ГИС ЖКХ) и ошибочные объекты, время последнего обмена
+    по операциям. Строится плановой задачей (build) и дополняется
+    изменениями при записи идентификаторов операций дома (GUID.write)
+    """
+
+    meta = {
+        'db_alias': 'legacy-db',
+        'collection': 'GisReconciliation',
+        'indexes': [
+            {'fields': ['provider_id', 'house_id'], 'unique': True},
+        ], 'index_background': True, 'auto_create_index': False,
+    }
+
+    provider_id = ObjectIdField(required=True,
+        verbose_name="Идентификатор организации (поставщика информации)")
+    house_id = ObjectIdField(required=True, verbose_name="Идентификатор дома")
+
+    counts = DictField(  # 'Tag': 'status': количество
+        verbose_name="Количество идентификаторов по признакам и состояниям")
+    unmapped = DictField(  # 'ObjectId': 'Tag'
+        verbose_name="Объекты без (загруженных) данных ГИС ЖКХ")
+    errors = DictField(  # 'ObjectId': 'Tag'
+        verbose_name="Объекты с ошибкой (последней) выгрузки")
+    exported = DictField(  # 'Operation': datetime
+        verbose_name="Время последнего обмена по операциям")
+
+    built = DateTimeField(verbose_name="Время построения сводки")
+    updated = DateTimeField(verbose_name="Время последнего изменения сводки")
+
+    @classmethod
+    def of_provider(cls, provider_id: ObjectId, *house_id_s: ObjectId) -> list:
+        """Сводки (домов) организации"""
+        query: dict = {'provider_id': provider_id}  # индекс
+        if house_id_s:
+            query['house_id'] = {'$in': [*house_id_s]}
+
+        return list(cls.objects(__raw__=query).exclude('id').as_pymongo())
+
+    @classmethod
+    def build(cls, provider_id: ObjectId, house_id_s: list) -> int:
+        """
+        Построить сводки сверки домов организации
+
+        :returns: количество сохраненных сводок
+        """
+        if not house_id_s:
+            return 0
+
+        from app.area.models.area import Area
+        from app.meters.models.meter import AreaMeter, HouseMeter
+        from processing.models.billing.account import Tenant
+
+        # ObjectId: (HouseId, 'Tag' или None - признак ЛС не определен)
+        housed: dict = {house_id: (house_id, GisObjectType.HOUSE)
+            for house_id in house_id_s}
+
+        for area in Area.objects(__raw__={
+            'house._id': {'$in': house_id_s}, 'is_deleted': {'$ne': True},
+        }).only('house').as_pymongo():
+            housed[area['_id']] = (area['house']['_id'], GisObjectType.AREA)
+        for tenant in Tenant.objects(__raw__={
+            'area.house._id': {'$in': house_id_s}, 'is_deleted': {'$ne': True},
+        }).only('area.house').as_pymongo():
+            housed[tenant['_id']] = (tenant['area']['house']['_id'], None)
+        for meter in AreaMeter.objects(__raw__={
+            'area.house._id': {'$in': house_id_s}, 'is_deleted': {'$ne': True},
+        }).only('area.house').as_pymongo():
+            housed[meter['_id']] = \
+                (meter['area']['house']['_id'], GisObjectType.AREA_METER)
+        for meter in HouseMeter.objects(__raw__={
+            'house._id': {'$in': house_id_s}, 'is_deleted': {'$ne': True},
+        }).only('house').as_pymongo():
+            housed[meter['_id']] = \
+                (meter['house']['_id'], GisObjectType.HOUSE_METER)
+
+        built = get_time()
+        summaries: dict = {house_id: {
+            'provider_id': provider_id, 'house_id': house_id,
+            'counts': {}, 'unmapped': {}, 'errors': {}, 'exported': {},
+            'built': built, 'updated': built,
+        } for house_id in house_id_s}
+
+        mapped: set = set()  # объекты с данными ГИС ЖКХ
+        guids = GUID.objects(__raw__={'$or': [
+            {'provider_id': provider_id,  # ('provider_id', '-saved')
+                'tag': {'$in': [*RECONCILED_TAGS - {GisObjectType.HOUSE}]}},
+            {'object_id': {'$in': house_id_s},  # индекс
+                'tag': GisObjectType.HOUSE},  # общие данные домов
+        ]}).only(
+            'tag', 'object_id', 'status', 'gis', 'root', 'version', 'unique',
+        ).as_pymongo()
+        for guid in guids:
+            house_id, tag = housed.get(guid['object_id'], (None, None))
+            if house_id is None or tag not in {None, guid['tag']}:
+                continue  # объект другого дома (или с другим признаком)
+
+            summary: dict = summaries[house_id]
+            tag_counts: dict = summary['counts'].setdefault(guid['tag'], {})
+            status: str = guid.get('status') or GisGUIDStatusType.UNKNOWN
+            tag_counts[status] = tag_counts.get(status, 0) + 1
+
+            if status == GisGUIDStatusType.ERROR:
+                summary['errors'][str(guid['object_id'])] = guid['tag']
+            if _is_true(guid):
+                mapped.add(guid['object_id'])
+            else:  # WARN ЛС может иметь идентификаторы нескольких признаков
+                summary['unmapped'][str(guid['object_id'])] = guid['tag']
+
+        for object_id, (house_id, tag) in housed.items():
+            if object_id in mapped:  # WARN в том числе ЛС другого признака
+                summaries[house_id]['unmapped'].pop(str(object_id), None)
+            elif str(object_id) not in summaries[house_id]['unmapped']:
+                summaries[house_id]['unmapped'][str(object_id)] = \
+                    tag or 'Tenant'  # нет идентификатора (ЛС любого признака)
+
+        for exchange in GisRecord.objects.aggregate({'$match': {
+            'provider_id': provider_id,  # ('provider_id', '-saved')
+            'house_id': {'$in': house_id_s},
+            'status': {'$in': [
+                GisRecordStatusType.DONE, GisRecordStatusType.WARNING,
+                GisRecordStatusType.ERROR,
+            ]},
+        }}, {'$group': {
+            '_id': {'house_id': '$house_id', 'operation': '$operation'},
+            'saved': {'$max': '$saved'},
+        }}, allowDiskUse=True):
+            summaries[exchange['_id']['house_id']]['exported'][
+                exchange['_id']['operation']] = exchange['saved']
+
+        requests: list = [ReplaceOne(
+            {'provider_id': provider_id, 'house_id': house_id},
+            summary, upsert=True,
+        ) for house_id, summary in summaries.items()]
+
+        collection = cls._get_collection()
+        for index in range(0, len(requests), RECONCILIATION_BULK_SIZE):
+            collection.bulk_write(
+                requests[index:index + RECONCILIATION_BULK_SIZE],
+                ordered=False,
+            )
+
+        return len(requests)
+
+    @classmethod
+    def delta(cls, provider_id: ObjectId, house_id: ObjectId,
+            operation: str, guids) -> 'ReconciliationDelta':
+        """Подготовить изменения сводки дома до записи идентификаторов"""
+        return ReconciliationDelta(provider_id, house_id, operation,
+            [guid for guid in guids if guid.tag in RECONCILED_TAGS])
+
+
+class ReconciliationDelta:
+    """
+    Изменения сводки сверки дома в результате записи идентификаторов
+
+    Предыдущие состояния (заменяемых или удаляемых) идентификаторов
+    загружаются до записи, сводка изменяется одним запросом после нее
+    (apply). Отсутствующая сводка не создается - ее построит плановая задача
+    """
+
+    def __init__(self, provider_id: ObjectId, house_id: ObjectId,
+            operation: str, guids: list):
+
+        self.provider_id = provider_id
+        self.house_id = house_id
+        self.operation = operation
+        self.guids = guids
+
+        existing: list = [guid.id for guid in guids if guid.id]
+        self._previous: dict = {guid['_id']: guid['status']
+            for guid in GUID.objects(__raw__={
+                '_id': {'$in': existing},
+            }).only('status').as_pymongo()
+                if guid.get('status')} if existing else {}
+
+    def update(self) -> dict:
+        """Изменения (запрос на изменение) сводки"""
+        counts = Counter()
+        changes: dict = {'$set': {
+            'updated': get_time(),
+        }, '$max': {
+            f'exported.{self.operation}': get_time(),
+        }}
+        unset: dict = {}
+        objects: dict = {}  # ObjectId: [идентификаторы]
+
+        for guid in self.guids:
+            previous: str = self._previous.get(guid.id)
+            if previous:
+                counts[f'counts.{guid.tag}.{previous}'] -= 1
+            if not guid.is_deleted:  # идентификатор не удаляется?
+                counts[f'counts.{guid.tag}.{guid.status}'] += 1
+            objects.setdefault(guid.object_id, []).append(guid)
+
+        # WARN ЛС может иметь идентификаторы нескольких признаков ~ build
+        for object_id, guids in objects.items():
+            object_key: str = str(object_id)
+            actual: list = [guid for guid in guids if not guid.is_deleted]
+
+            if any(actual):  # ~ is_true хотя бы одного
+                unset[f'unmapped.{object_key}'] = 1
+            else:  # все удаляются или без данных ГИС ЖКХ
+                changes['$set'][f'unmapped.{object_key}'] = \
+                    (actual or guids)[0].tag
+
+            erroneous: list = [guid for guid in actual
+                if guid.status == GisGUIDStatusType.ERROR]
+            if erroneous:
+                changes['$set'][f'errors.{object_key}'] = erroneous[0].tag
+            else:
+                unset[f'errors.{object_key}'] = 1
+
+        increments: dict = {key: value
+            for key, value in counts.items() if value}  # без нулевых
+        if increments:
+            changes['$inc'] = increments
+        if unset:
+            changes['$unset'] = unset
+
+        return changes
+
+    def apply(self):
+        """Изменить (имеющуюся) сводку дома"""
+        if not self.guids:
+            return
+        try:
+            GisReconciliation._get_collection().update_one(
+                {'provider_id': self.provider_id, 'house_id': self.house_id},
+                self.update(),
+                upsert=False,  # строится плановой задачей
+            )
+        except PyMongoError as error:
+            logger.warning('GIS reconciliation of house %s is not updated: %s',
+                self.house_id, error)
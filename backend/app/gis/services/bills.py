@@ -30,7 +30,7 @@ from app.accruals.models.accrual_document import AccrualDoc
 from processing.models.billing.payment import Payment
 from processing.models.billing.accrual import Accrual
 from processing.models.billing.service_type import ServiceType, \
-    ServiceTypeGisName, ServiceTypeGisBind
+    ServiceTypeGisName, ServiceTypeGisBind, GisTitleDuplicateError
 
 from processing.models.choices import (
     AccrualsSectorType, ConsumptionType,
@@ -391,27 +391,12 @@ class Bills(WebService):
             # endregion СПРАВОЧНИКИ УСЛУГ (ОРГАНИЗАЦИИ)
 
             # region СОПОСТАВЛЕНИЯ УСЛУГ (ОРГАНИЗАЦИИ)
-            titled_refs: dict = {}
-
-            for nsi in ServiceTypeGisName.objects(__raw__={
-                # WARN ServiceTypeGisName.provider = owner, а не doc.provider
-                'provider': self.provider_id, 'closed': None,  # актуальные
-                'reference_number': {'$in': [
-                    # WARN кроме элементов справочника №2 ~ "КР на ОДН"
-                    *ServiceTypeGisName.service_nsi(),  # справочники услуг
-                    '50'  # общий справочник жилищных услуг
-                ]},
-            }).as_pymongo().order_by('reference_number'):
-                title: str = nsi['gis_title']
-                ref: tuple = (int(nsi['reference_number']),
-                    nsi['position_number'])
-                if title in titled_refs:  # одноименные элементы справочников?
-                    dup: tuple = titled_refs[title]
-                    raise PublicError("Элементы частных справочников (услуг)"
-                        f" ГИС ЖКХ {ref[0]}.{ref[1]} и {dup[0]}.{dup[1]}"
-                        f" имеют совпадающее наименование {sb(title)}")
-
-                titled_refs[title] = ref
+            try:  # WARN ServiceTypeGisName.provider = owner, а не doc.provider
+                titled_refs: dict = \
+                    ServiceTypeGisName.ref_codes_of(self.provider_id)
+            except GisTitleDuplicateError as error:  # одноименные элементы?
+                raise PublicError(f"Элементы частных справочников (услуг)"
+                    f" ГИС ЖКХ: {error}")
 
             self._provider_service_binds: dict = {}  # ObjectId:(reg_num,'code')
 
@@ -466,6 +451,8 @@ class Bills(WebService):
              is_spam=not self.DEBUG_SERVICES)
             # endregion УСЛУГИ ТАРИФНЫХ ПЛАНОВ
 
+            self._compile_service_table()
+
         def _load_accounts_data(self):
 
             self._typed_tenant_guids: dict = {}  # 'AccountType': TenantId: GUID
@@ -639,6 +626,69 @@ class Bills(WebService):
 
             return self._tariff_service_types[service_id]
 
+        def _compile_service_table(self):
+            """
+            Таблица услуг начислений операции: данные услуги, элемент
+            справочника ГИС ЖКХ и признаки кода услуги вычисляются один раз
+            на операцию, а не для каждой услуги каждого ПД
+            """
+            service_ids: list = Accrual.objects(__raw__={
+                '_id': {'$in': self.object_ids},
+            }).distinct('services.service_type')
+
+            missing_ids: list = [_id for _id in service_ids
+                if _id not in self._tariff_service_types]
+            for service_type in ServiceType.objects(__raw__={
+                '_id': {'$in': missing_ids},
+            }).as_pymongo() if missing_ids else []:  # одним запросом
+                service_type['caption'] = sb(service_type['title']) or \
+                    (f"с кодом {service_type['code']}"
+                        if service_type.get('code')
+                        else f"с ид. {service_type['_id']}")
+                # WARN добавляем загруженную к услугам тарифного плана
+                self._tariff_service_types[service_type['_id']] = service_type
+
+                self.warning(f"Услуга {service_type['caption']}"
+                    " отсутствует в тарифном плане организации")
+
+            self._service_table: dict = {}  # ServiceTypeId: {service,...}
+            for service_id in service_ids:
+                if service_id in self._tariff_service_types:
+                    self._compiled_service(service_id)
+
+        def _compiled_service(self, service_id: ObjectId) -> dict:
+
+            compiled: dict = self._service_table.get(service_id)
+            if compiled is not None:
+                return compiled
+
+            service: dict = self._get_service_type(service_id)
+            code: str = service.get('code')  # может отсутствовать!
+            ref: tuple = self._provider_service_binds.get(service_id)
+
+            if not code or not is_municipal_service(code):
+                split = None  # жилищная или дополнительная услуга
+            elif is_individual_service(code):
+                split = 'individual'  # инд. потребление
+            elif is_public_service(code):
+                split = 'public'  # потребление при СОИ
+            else:  # целевое потребление не определено!
+                split = ''
+
+            compiled = dict(
+                service=service, code=code, ref=ref,
+                # загружены данные ГИС ЖКХ элемента справочника (услуги)?
+                nsi=ref in self._provider_nsi_references if ref else False,
+                split=split,
+                public=bool(code) and is_public_service(code),
+                heating=bool(code) and is_heating(code),
+                waste_water=bool(code) and is_waste_water(code),
+                resource=resource_nsi_code_of(code)
+                    if split == 'public' else None,
+            )
+            self._service_table[service_id] = compiled
+            return compiled
+
         def _payment_document(self, accrual: dict) -> Optional[dict]:
 
             def __code_or_title(_id) -> str:
@@ -799,29 +849,26 @@ class Bills(WebService):
                         totals['recalc'].values()), \
                         "Сумма перерасчетов по услугам не совпадает по причинам"
 
-                    _service_id = _embedded['service_type']  # : ObjectId
                     # WARN отсутствующие в ТП услуги добавляются
-                    _service: dict = self._get_service_type(_service_id)
-                    _service_code = _service.get('code')  # может отсутствовать!
+                    _compiled: dict = \
+                        self._compiled_service(_embedded['service_type'])
 
-                    if not _service_code:  # услуга без кода?
-                        continue  # дополнительная услуга?
-                    elif not is_municipal_service(_service_code):  # НЕ КУ?
+                    if _compiled['split'] is None:  # услуга без кода или НЕ КУ?
                         continue  # жилищная или дополнительная услуга!
-                    elif is_individual_service(_service_code):
+                    elif _compiled['split'] == 'individual':
                         _split = totals['individual']  # инд. потребление
                         _split['consumption'] += _embedded['consumption']
-                    elif is_public_service(_service_code):
+                    elif _compiled['split'] == 'public':
                         _split = totals['public']  # потребление при СОИ
-                        if is_heating(_service_code):  # WARN только Отопление
+                        if _compiled['heating']:  # WARN только Отопление
                             _split['consumption'] += _embedded['consumption']
                         # группируем по коду (НЕ главного) комм. ресурса (НСИ 2)
-                        _nsi_code: int = resource_nsi_code_of(_service_code)
                         _included: dict = totals['included']
-                        _included[_nsi_code].append(_embedded)
+                        _included[_compiled['resource']].append(_embedded)
                     else:  # целевое потребление не определено!
                         self.warning("Целевое потребление коммунальной услуги"
-                            f" {sb(_service['title'])} не определено")
+                            f" {sb(_compiled['service']['title'])}"
+                            " не определено")
                         continue  # пропускаем услугу
 
                     # вложенный словарь передается по ссылке и дополняется
@@ -829,7 +876,7 @@ class Bills(WebService):
                     _split['result'] += service_result  # Итого к оплате
 
                     _method: str = _embedded.get('method')  # Метод расчета
-                    if (is_waste_water(_service_code) and  # Водоотведение
+                    if (_compiled['waste_water'] and  # Водоотведение
                             _method != ConsumptionType.METER_WO):  # без ПУ?
                         self.log(warn="Метод определения затраченного объема"
                             ' "Водоотведения" переопределен как "Без счетчика"')
@@ -1191,16 +1238,16 @@ class Bills(WebService):
                 service_id: ObjectId = embedded['service_type']
 
                 # проверяем наличие услуги в тарифном плане ПД
-                service: dict = self._get_service_type(service_id)
-                service_code: str = service.get('code')  # код услуги
+                compiled: dict = self._compiled_service(service_id)
+                service: dict = compiled['service']
 
                 # получаем номер (int) справочника услуг и код (str) элемента
-                ref: tuple = self._provider_service_binds.get(service_id)
+                ref: tuple = compiled['ref']
                 if not ref:  # элемент справочника не загружен из ГИС ЖКХ?
                     self.failure(pd_guid, "Получены начисления по услуге"
                         f" {service['caption']} без сопоставления")
                     return  # пропускаем ПД с услугой без сопоставления
-                elif ref not in self._provider_nsi_references:
+                elif not compiled['nsi']:
                     # данные ГИС ЖКХ элемента справочника (услуги) не загружены?
                     self.failure(pd_guid, "Не загружены данные ГИС ЖКХ"
                         f" элемента справочника {ref[0]}.{ref[1]}")
@@ -1222,8 +1269,8 @@ class Bills(WebService):
                     #     " выгружаться в отдельном ПД или как «Дополнительная»")
                     # return  # пропускаем ПД с неверно сопоставленным КР
                 elif ref == (50, '1'):  # Содержание жилого помещения?
-                    if service_code and is_public_service(service_code):  # ОДН?
-                        if is_heating(service_code):  # Отопление?
+                    if compiled['public']:  # ОДН?
+                        if compiled['heating']:  # Отопление?
                             self.failure(pd_guid, f"Услуга {service['caption']}"
                                 " не сопоставлена с «Отоплением»")
                             return  # пропускаем ПД с услугой на ОДН в ЖУ
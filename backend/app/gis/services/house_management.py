@@ -1569,6 +1569,9 @@ class HouseManagement(WebService):
             GisObjectType.AREA: 70,
         }
 
+        CONTEXT_ATTRS = ('_area_ids', '_entity_guids', '_area_guids',
+            '_areas', '_area_living')  # данные помещений и жильцов дома
+
         REAL_PAYER_NAME: bool = False  # True - ФИО, False - "Жилец кв. 1"
 
         @property
@@ -1787,20 +1790,6 @@ class HouseManagement(WebService):
             assert self.object_type in GUID.ACCOUNT_TAGS, \
                 "Некорректный (неподдерживаемый) тип ЛС операции"
 
-            self._areas: dict = {area['_id']: area  # данные помещений
-                for area in Area.objects(__raw__={
-                    '_id': {'$in': self._area_ids},
-                }).only(
-                    '_type', 'house', 'is_shared',
-                    'number', 'str_number', 'str_number_full',
-                    'area_total', 'area_total_history', 'area_living',
-                ).as_pymongo()}
-
-            self._area_living: dict = self._get_householder_mates(*self._areas)
-            self.log("Количество жильцов с ответственным квартиросъемщиком:"
-                + sp(f"{_id} = {_count}"
-                    for _id, _count in self._area_living.items()))
-
             # загружаем идентификаторы ГИС ЖКХ лицевых счетов заданного типа
             self._typed_guids = \
                 self.mapped_guids(self.object_type, *self.object_ids)
@@ -1886,6 +1875,22 @@ class HouseManagement(WebService):
             self._area_guids: dict = {} if not self._area_ids else \
                 HouseManagement.load_area_guids(self, *self._area_ids)
 
+            # WARN данные помещений всех (частей) ЛС загружаются однократно
+            self._areas: dict = {area['_id']: area  # данные помещений
+                for area in Area.objects(__raw__={
+                    '_id': {'$in': self._area_ids},
+                }).only(
+                    '_type', 'house', 'is_shared',
+                    'number', 'str_number', 'str_number_full',
+                    'area_total', 'area_total_history', 'area_living',
+                ).as_pymongo()}
+
+            self._area_living: dict = {} if not self._areas else \
+                self._get_householder_mates(*self._areas)
+            self.log("Количество жильцов с ответственным квартиросъемщиком:"
+                + sp(f"{_id} = {_count}"
+                    for _id, _count in self._area_living.items()))
+
         def prepare(self, *tenant_id_s: ObjectId):
             """Подготовка к выгрузке ЛС по направлению платежа"""
             typed_accounts: dict = get_typed_accounts(*tenant_id_s)
@@ -2347,6 +2352,9 @@ class HouseManagement(WebService):
             GisObjectType.UO_ACCOUNT: 70,
         }
 
+        CONTEXT_ATTRS = ('_area_ids', '_area_guids', '_tenant_ids',
+            '_tenant_guids', '_shared_areas')  # данные помещений и ЛС дома
+
         @property
         def is_collective(self) -> bool:
             """Выгрузка данных ИПУ?"""
@@ -2593,36 +2601,29 @@ class HouseManagement(WebService):
                 **update_data,
             })  # обновляем данные ПУ
 
-        def _area_meters(self) -> dict:
+        def _get_area_tenant_guids(self) -> dict:
+            """Идентификаторы ГИС ЖКХ (ЛС) жильцов в помещениях"""
+            assert self._tenant_guids, "Требуются идентификаторы ГИС ЖКХ ЛС"
 
-            def get_area_tenant_guids() -> dict:
-                """Идентификаторы ГИС ЖКХ (ЛС) жильцов в помещениях"""
-                assert self._tenant_guids, "Требуются идентификаторы ГИС ЖКХ ЛС"
+            area_tenant_guids: dict = {}  # AreaId: [ TenantGUID,... ]
 
-                area_tenant_guids: dict = {}  # AreaId: [ TenantGUID,... ]
-
-                for tenant in Tenant.objects(__raw__={
-                    '_id': {'$in': self._tenant_ids}, 'area': {'$ne': None},
-                }).only('area').as_pymongo():
-                    tenant_guid: GUID = self._tenant_guids.get(tenant['_id'])
-                    if not tenant_guid:  # отсутствуют данные ГИС ЖКХ ЛС?
-                        continue
+            for tenant in Tenant.objects(__raw__={
+                '_id': {'$in': self._tenant_ids}, 'area': {'$ne': None},
+            }).only('area').as_pymongo():
+                tenant_guid: GUID = self._tenant_guids.get(tenant['_id'])
+                if not tenant_guid:  # отсутствуют данные ГИС ЖКХ ЛС?
+                    continue
 
-                    tenant_guids: list = area_tenant_guids.setdefault(
-                        tenant['area']['_id'], []
-                    )
-                    # Duplicate unique value...declared for identity constraint
-                    if tenant_guid.gis not in tenant_guids:
-                        tenant_guids.append(tenant_guid.gis)
+                tenant_guids: list = area_tenant_guids.setdefault(
+                    tenant['area']['_id'], []
+                )
+                # Duplicate unique value...declared for identity constraint
+                if tenant_guid.gis not in tenant_guids:
+                    tenant_guids.append(tenant_guid.gis)
 
-                return area_tenant_guids
+            return area_tenant_guids
 
-            if self._area_ids:
-                self._shared_areas: list = Area.objects(__raw__={
-                    '_id': {'$in': self._area_ids},  # ~ AreaMeter.area._id
-                    'is_shared': True,  # WARN CommunalArea - недостоверный признак
-                }).distinct('id')
-                self._tenant_guids: dict = get_area_tenant_guids()  # перезаписываем
+        def _area_meters(self) -> dict:
 
             self._meter_guids: dict = \
                 self.mapped_guids(GisObjectType.AREA_METER, *self.object_ids)
@@ -2681,6 +2682,13 @@ class HouseManagement(WebService):
                 self._tenant_guids: dict = \
                     HouseManagement.load_account_guids(self, *self._tenant_ids)
 
+                self._shared_areas: list = Area.objects(__raw__={
+                    '_id': {'$in': self._area_ids},  # ~ AreaMeter.area._id
+                    'is_shared': True,  # WARN CommunalArea - недостоверный признак
+                }).distinct('id')
+                self._tenant_guids: dict = \
+                    self._get_area_tenant_guids()  # перезаписываем
+
         def prepare(self, *meter_id_s: ObjectId):
             """Подготовка к выгрузке ИПУ и ОДПУ"""
             assert meter_id_s, \
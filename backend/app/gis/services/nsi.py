@@ -9,8 +9,9 @@ from app.gis.utils.common import as_guid, get_time, sb
 from app.gis.utils.nsi import get_element_name, get_element_unit, \
     get_actual_elements, get_last_elements, resource_nsi_code_of, \
     okei_code_of, service_nsi_code_of, PRIVATE_GROUP, REFERENCE_NAMES
+from app.gis.utils.nsi_cache import warm_nsi_cache
 
-from app.gis.models.nsi_ref import nsiRef, PRIVATE_SERVICES
+from app.gis.models.nsi_ref import nsiRef, nsiSync, PRIVATE_SERVICES
 
 from processing.models.billing.service_type import \
     ServiceTypeGisName, ServiceTypeGisBind
@@ -216,17 +217,18 @@ class Nsi(WebService):
             if self._reg_num in PRIVATE_SERVICES:  # справочник услуг?
                 self._store_item(export_result)  # сохраняем справочник
                 self._housing_services()  # WARN создаем "Жилищные услуги"
+                warm_nsi_cache(self.provider_id)  # после записи результата
             # TODO работы и услуги организации (НСИ 59, 219) есть в Системе
             else:  # иной (НЕ услуг) частный справочник загружаем как общий!
-                for element in get_actual_elements(export_result.NsiElement):
-                    element_name: str = get_element_name(
-                        element.NsiElementField, self._item_name)
-
-                    # TODO собрать элементы справочника и сохранить все вместе
-                    nsiRef.store(element.GUID, self._reg_num, element.Code,
-                        element_name, self.provider_id)
-                    self.log(f"Полученный элемент с кодом {element.Code}"
-                        f" (частного) справочника №{self._reg_num} сохранен")
+                stored: int = nsiRef.store_many(self._reg_num, [(
+                    element.GUID, element.Code,
+                    get_element_name(element.NsiElementField, self._item_name),
+                ) for element in get_actual_elements(export_result.NsiElement)],
+                    self.provider_id)
+                nsiSync.advance(self._reg_num, export_result.NsiElement,
+                    self.provider_id)  # WARN только для справочников НЕ услуг
+                self.log(f"Сохранены {stored} новых и измененных элементов"
+                    f" (частного) справочника №{self._reg_num}")
 
                 self.warning(f"Принадлежащий {self.provider_name} (частный)"
                     f" справочник №{self._reg_num} сохранен как общий")
@@ -241,15 +243,32 @@ class Nsi(WebService):
 
                 self(RegistryNumber=registry_number)
 
-        def by_reg_num(self, registry_number: int):
+        def by_reg_num(self, registry_number: int, full: bool = False):
+            """
+            Загрузить частный справочник организации
 
+            Справочники (НЕ услуг) загружаются с времени изменения последнего
+            загруженного элемента, full - загрузить все элементы
+            """
             assert registry_number in PRIVATE_GROUP, \
                 f"Справочник №{registry_number} не является частным"
 
-            self.log(info=f"Загружается принадлежащий {self.provider_name}"
-                f" частный справочник №{registry_number}")
-
-            self(RegistryNumber=registry_number)
+            # WARN справочники услуг сверяются с имеющимися полностью
+            modified_after = None if full or registry_number in \
+                PRIVATE_SERVICES else nsiSync.watermarks(registry_number,
+                    provider_id=self.provider_id).get(registry_number)
+
+            if modified_after:  # загружались ранее?
+                self.log(info=f"Загружаются измененные с {modified_after}"
+                    f" элементы принадлежащего {self.provider_name}"
+                    f" частного справочника №{registry_number}")
+                self(RegistryNumber=registry_number,
+                    ModifiedAfter=modified_after)
+            else:  # загрузка всех элементов справочника!
+                self.log(info=f"Загружается принадлежащий"
+                    f" {self.provider_name} частный справочник"
+                    f" №{registry_number}")
+                self(RegistryNumber=registry_number)
 
     class importAdditionalServices(ServiceOperation):
         """Передать данные справочника 1: Дополнительные услуги"""
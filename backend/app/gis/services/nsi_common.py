@@ -2,7 +2,7 @@ from app.gis.core.web_service import WebService
 from app.gis.core.custom_operation import ExportOperation
 
 from app.gis.models.choices import GisManagerContext
-from app.gis.models.nsi_ref import nsiRef
+from app.gis.models.nsi_ref import nsiRef, nsiSync
 
 from app.gis.utils.common import sb
 from app.gis.utils.nsi import get_item_name, \
@@ -18,22 +18,25 @@ class NsiItemExportOperation(ExportOperation):
         registry_number: int = export_result.NsiItemRegistryNumber
         item_name: str = get_item_name(registry_number)
 
-        self.log(warn=f"Сохранение элементов справочника №{registry_number}"
-            " может занять продолжительное время")  # TODO bulk_write
+        actual_elements: list = \
+            get_actual_elements(export_result.NsiElement)
 
-        # TODO полученные элементы справочников сохраняются по одному
-        for element in get_actual_elements(export_result.NsiElement):
-            element_name: str = get_element_name(element.NsiElementField,
-                item_name)  # имя поля иногда совпадает с названием спр-ка
+        # сохраняем записи NSI, GUID сохранять не нужно!
+        stored: int = nsiRef.store_many(registry_number, [(
+            element.GUID, element.Code,  # имя поля иногда совпадает
+            get_element_name(element.NsiElementField, item_name),
+        ) for element in actual_elements])  # без provider_id - общий
 
-            # сохраняем запись NSI, GUID сохранять не нужно!
-            nsiRef.store(element.GUID, registry_number, element.Code,
-                element_name)  # без provider_id - общий справочник
-            self.log("Сохранен элемент общего справочника"
-                f" №{registry_number}.{element.Code}: {sb(element_name)}")
+        self._advance(registry_number, export_result)
 
-        self.log(info=f"Элементы общего справочника №{registry_number}:"
-            f" {sb(item_name)} успешно сохранены")
+        self.log(info=f"Из {len(actual_elements)} полученных актуальных"
+            f" элементов общего справочника №{registry_number}:"
+            f" {sb(item_name)} сохранены {stored} новых и измененных")
+
+    def _advance(self, registry_number: int, export_result):
+        """Сдвинуть время изменения последнего загруженного элемента"""
+        # WARN по всем полученным (в том числе неактуальным) элементам
+        nsiSync.advance(registry_number, export_result.NsiElement)
 
 
 class NsiCommon(WebService):
@@ -56,7 +59,10 @@ class NsiCommon(WebService):
         @property
         def description(self) -> str:
 
-            return f"№{self.request['RegistryNumber']}"  # Int32
+            return f"№{self.request['RegistryNumber']}" + (  # Int32
+                f" изменения с {self.request['ModifiedAfter']:%d.%m.%Y %H:%M}"
+                    if self.request.get('ModifiedAfter') else ''
+            )
 
     class exportNsiPagingItem(NsiItemExportOperation):
 
@@ -88,6 +94,11 @@ class NsiCommon(WebService):
                     next_record = self._record.heir(  # идентичная операция
                         Page=current_page + 1  # со следующим номером страницы
                     )
+                    # время изменения сдвигается после последней страницы
+                    next_record.options = {**(next_record.options or {}),
+                        'nsi_modified': nsiSync.last_modified(
+                            nsi_paging_item.NsiElement, self['nsi_modified']
+                        )}
                     next_record.save()  # WARN не сохраняется при создании
 
                     self.log(warn=f"Загружается {current_page + 1} страница из"
@@ -97,3 +108,17 @@ class NsiCommon(WebService):
                     # WARN текущая запись сохраняется менеджером (в store)
 
             return nsi_paging_item  # элемент передается в метод сохранения
+
+        def _advance(self, registry_number: int, export_result):
+            """
+            Сдвинуть время изменения последнего загруженного элемента
+            после сохранения последней страницы справочника
+
+            Иначе элементы не сохраненной (из-за ошибки) страницы
+            не загружались бы последующими загрузками изменений
+            """
+            if export_result.CurrentPage < export_result.TotalPages:
+                return  # время передается следующей странице (в _parse)
+
+            nsiSync.advance(registry_number, export_result.NsiElement,
+                modified=self['nsi_modified'])  # и предыдущих страниц
@@ -2,7 +2,7 @@ from bson import ObjectId
 
 from mongoengine.document import Document
 from mongoengine.fields import StringField, DateTimeField, \
-    ListField, DictField
+    ListField, DictField, IntField
 from mongoengine.base.fields import ObjectIdField
 
 from app.gis.utils.common import get_time
@@ -33,6 +33,10 @@ class GisTask(Document):
 
     error = StringField(verbose_name="Ошибка в процессе выполнения")
 
+    queue_depth = IntField(verbose_name="Количество операций в очереди")
+    queue_lag = IntField(
+        verbose_name="Время ожидания первой в очереди операции (сек.)")
+
     saved = DateTimeField(required=True, verbose_name="Дата и время сохранения")
 
     _dist_ = DictField(db_field='distributed', default=None)  # TODO УДАЛИТЬ
@@ -46,7 +50,8 @@ class GisTask(Document):
 
     def save(self, **kwargs):
 
-        if self.error or self.operations:  # ошибка или выполнены?
+        if self.error or self.operations \
+                or self.queue_depth:  # ошибка, выполнены или очередь?
             super().save(**kwargs)  # сохраняем документ
 
     def add_provider(self, provider_id: ObjectId):
@@ -66,3 +71,8 @@ class GisTask(Document):
             self.houses = [house_id]
         elif house_id not in self.houses:
             self.houses.append(house_id)
+
+    def set_queue_stats(self, depth: int, lag: int):
+
+        self.queue_depth = depth or None  # 0 ~ null не сохраняется
+        self.queue_lag = lag or None
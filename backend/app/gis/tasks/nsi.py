@@ -3,65 +3,83 @@ from bson import ObjectId
 from app.gis.services.nsi import Nsi
 from app.gis.services.nsi_common import NsiCommon
 
+from app.gis.models.nsi_ref import nsiSync
+
 from app.gis.utils.nsi import get_list_group, get_item_name, \
     NSI_GROUP, NSIRAO_GROUP, PAGED_NSI
 from app.gis.workers.config import gis_celery_app
 
 
 @gis_celery_app.task(name='gis.import_group_nsi', ignore_result=True)
-def import_group_nsi(group_name: str, start_from: int = 0, **options):
+def import_group_nsi(group_name: str, start_from: int = 0,
+        full: bool = False, **options):
     """
     Загрузка из ГИС ЖКХ группы общих справочников
 
     :param group_name: 'NSI' или 'NSIRAO'
     :param start_from: номер справочника с которого начнется загрузка (исключ.)
+    :param full: загрузить все (не только измененные) элементы справочников
     """
     nsi_reg_nums = [*NSI_GROUP] if group_name == 'NSI' else [*NSIRAO_GROUP]
 
     nsi_reg_nums.sort(key=lambda num: num)  # сортируем справочники по номерам
     limited_reg_nums: list = [num for num in nsi_reg_nums if num > start_from]
 
-    import_common_nsi(limited_reg_nums, **options)
+    import_common_nsi(limited_reg_nums, full, **options)
 
 
 @gis_celery_app.task(name='gis.import_common_nsi', ignore_result=True)
-def import_common_nsi(registry_numbers: list, **options):
+def import_common_nsi(registry_numbers: list, full: bool = False, **options):
     """
     Загрузка из ГИС ЖКХ (определенных) общих справочников
 
+    Операции загрузки справочников выполняются параллельно, загружаются
+    измененные после последнего загруженного (ModifiedAfter) элементы
+
     :param registry_numbers: номера общих справочников для загрузки
+    :param full: загрузить все (не только измененные) элементы справочников
     """
     assert registry_numbers, "Для загрузки необходимы номера справочников"
 
+    # время изменения последних загруженных элементов всех справочников
+    watermarks: dict = {} if full else nsiSync.watermarks(*registry_numbers)
+
     for registry_number in registry_numbers or [*NSI_GROUP, *NSIRAO_GROUP]:
         list_group: str = get_list_group(registry_number)  # группа
         item_name: str = get_item_name(registry_number)  # название
 
+        request_data: dict = dict(
+            ListGroup=list_group, RegistryNumber=registry_number
+        )
+        modified_after = watermarks.get(registry_number)
+        if modified_after:  # загружался ранее?
+            request_data['ModifiedAfter'] = modified_after  # только изменения
+
         if registry_number in PAGED_NSI:  # постраничная выгрузка? (70, 196)
             _export = NsiCommon.exportNsiPagingItem(**options)
 
             _export.log(info=f"Загружается первая страница общего"
                 f" справочника №{registry_number}: «{item_name}»")
 
-            _export(Page=1,  # Обязательное! Минимум = 1
-                ListGroup=list_group, RegistryNumber=registry_number)
+            _export(Page=1, **request_data)  # Обязательное! Минимум = 1
         else:  # стандартная (не постраничная) выгрузка!
             _export = NsiCommon.exportNsiItem(**options)
 
             _export.log(info="Загружаются элементы общего справочника"
                 f" №{registry_number}: «{item_name}»")
 
-            _export(ListGroup=list_group, RegistryNumber=registry_number)
+            _export(**request_data)  # WARN выполняется отдельной задачей
 
 
 @gis_celery_app.task(name='gis.import_provider_nsi')
-def import_provider_nsi(provider_id: ObjectId, registry_number: int, **options):
+def import_provider_nsi(provider_id: ObjectId, registry_number: int,
+        full: bool = False, **options):
     """
     Загрузка из ГИС ЖКХ (определенных) частных справочников организации
     """
     Nsi.exportDataProviderNsiItem(
         provider_id, **options
-    ).by_reg_num(registry_number)
+    ).by_reg_num(registry_number, full)
 
 
 @gis_celery_app.task(name='gis.export_additional_services')
@@ -3,13 +3,15 @@ from bson import ObjectId
 from app.gis.workers.config import gis_celery_app
 from settings import GIS
 
-from app.gis.models.choices import GisRecordStatusType, IDLE_RECORD_STATUSES
+from app.gis.models.choices import IDLE_RECORD_STATUSES, GisRecordQueueType
 from app.gis.models.gis_record import GisRecord
 from app.gis.models.guid import GUID
 from app.gis.models.gis_queued import GisQueued, QueuedType
+from app.gis.models.reconciliation import GisReconciliation
 
 from app.gis.utils.common import sb, get_time
-from app.gis.utils.houses import get_provider_metering_house_ids
+from app.gis.utils.houses import get_provider_metering_house_ids, \
+    get_binded_houses
 
 from app.gis.tasks.async_operation import fetch_result
 from app.gis.tasks.gis_task import GisTask
@@ -18,6 +20,8 @@ from app.gis.services.house_management import HouseManagement
 from app.gis.services.device_metering import DeviceMetering
 from app.gis.services.bills import Bills
 
+SWEEP_LIMIT: int = 500  # операций из очереди за один запуск плановой задачи
+
 
 @gis_celery_app.task(name='gis.reanimate', ignore_result=True)
 def reanimate(saved_days_ago: int = 2, acked_hours_ago: int = 24):
@@ -30,16 +34,23 @@ def reanimate(saved_days_ago: int = 2, acked_hours_ago: int = 24):
     """
     task = GisTask(name='gis.reanimate')
     try:
+        acked_before = get_time(hours=-acked_hours_ago)
+        saved_after = get_time(days=-saved_days_ago)
+        GisRecord.dequeue_stale(GisRecordQueueType.REANIMATE,
+            saved_after)  # давно не сохранявшиеся
+        task.set_queue_stats(*GisRecord.queue_stats(
+            GisRecordQueueType.REANIMATE, acked_before
+        ))  # до проверки разрешения
+
         if not GIS.get('reanimate_exec'):  # не перезапускать просроченные?
             raise PermissionError(
                 "Перезапуск просроченных операций не выполняется"
             )
 
-        task.operations = GisRecord.objects(__raw__={  # записи об операциях
-            'saved': {'$gt': get_time(days=-saved_days_ago)},
-            'acked': {'$lt': get_time(hours=-acked_hours_ago)},
-            'status': GisRecordStatusType.EXECUTING,  # Выполняется
-        }).order_by('saved').distinct('id')
+        # выполняемые (получившие квитанцию) записи об операциях
+        task.operations = [record['_id'] for record in GisRecord.queued_in(
+            GisRecordQueueType.REANIMATE, acked_before, SWEEP_LIMIT,
+        ).only('id').as_pymongo()]
 
         if not task.operations:  # нет подлежащих перезапуску?
             raise ValueError(
@@ -153,34 +164,23 @@ def resurrect(saved_days_ago: int = 5):
     """
     task = GisTask(name='gis.resurrect')
     try:
+        saved_before = get_time()
+        saved_after = get_time(days=-saved_days_ago)
+        GisRecord.dequeue_stale(GisRecordQueueType.RESURRECT,
+            saved_after)  # давно не сохранявшиеся
+        task.set_queue_stats(*GisRecord.queue_stats(
+            GisRecordQueueType.RESURRECT, saved_before
+        ))  # до проверки разрешения
+
         if not GIS.get('resurrect_errors'):  # не перезапускать ошибочные?
             raise PermissionError(
                 "Перезапуск ошибочных операций не выполняется"
             )
 
-        error_limit = 'Исчерпан лимит получения результата обработки сообщения'
-        error_retry = (
-            'EXP001000: Произошла ошибка при передаче данных. Попробуйте '
-            'осуществить передачу данных повторно. В случае, если повторная '
-            'передача данных не проходит - направьте обращение в службу '
-            'поддержки пользователей ГИС ЖКХ.'
-        )
-        error_send_request = ('Превышено ограничение по времени выполнения '
-                              'задачи отправки запроса операции')
-        error_fetch_result = ('Превышено ограничение по времени выполнения '
-                              'задачи получения результата операции')
-
-        error_messages = [
-            error_limit,
-            error_retry,
-            error_send_request,
-            error_fetch_result
-        ]
-        task.operations = GisRecord.objects(__raw__={
-            "status": GisRecordStatusType.ERROR,  # статус Ошибка
-            "error": {"$in": error_messages},  # перечисленные ошибки
-            'saved': {'$gt': get_time(days=-saved_days_ago)},
-        }).order_by('saved').distinct("_id")
+        # завершившиеся ошибкой (сбоем) ГИС ЖКХ записи об операциях
+        task.operations = [record['_id'] for record in GisRecord.queued_in(
+            GisRecordQueueType.RESURRECT, saved_before, SWEEP_LIMIT,
+        ).only('id').as_pymongo()]
 
         if not task.operations:  # нет подлежащих перезапуску?
             raise ValueError(
@@ -196,6 +196,7 @@ def resurrect(saved_days_ago: int = 5):
                 unset__ack_guid=1,  # удаляем id ответа
                 unset__acked=1,  # удаляем дату ответа
                 set__options__is_resurrected=True,  # помечаем, как восставшую
+                unset__queue=1, unset__queued=1,  # исключаем из очереди
             )
             # Перезапускаем задачу
             from app.gis.tasks.async_operation import send_request
@@ -278,6 +279,33 @@ def collected():  # Meter.readings
         task.save()
 
 
+@gis_celery_app.task(name='gis.reconciled', ignore_result=True)
+def reconciled(*provider_s: ObjectId):
+    """
+    Построить сводки сверки домов организаций с ГИС ЖКХ
+
+    :param provider_s: организации или все выгружающие изменения в ГИС ЖКХ
+    """
+    task = GisTask(name='gis.reconciled')
+    try:
+        if not provider_s:  # находим выгружающие изменения в ГИС ЖКХ организации
+            from processing.models.billing.provider.main import Provider
+            provider_s = Provider.objects(
+                gis_online_changes=True
+            ).distinct('id')
+
+        for provider_id in provider_s:
+            house_ids: list = [*get_binded_houses(provider_id)]
+            if not house_ids:  # нет управляемых домов?
+                continue
+            task.add_provider(provider_id)
+            GisReconciliation.build(provider_id, house_ids)
+    except Exception as error:
+        task.error = str(error)
+    finally:
+        task.save()
+
+
 @gis_celery_app.task(name='gis.cleanup', ignore_result=True)
 def cleanup(older: int = 2, newer: int = None):
     """
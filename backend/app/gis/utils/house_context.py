@@ -0,0 +1,64 @@
+import logging
+import pickle
+from typing import Optional
+
+import redis
+
+from app.caching.core.redis import CACHE_REDIS
+
+logger = logging.getLogger('c300')
+
+HOUSE_CONTEXT_TTL = 2 * 60 * 60  # части операции выполняются следом
+
+
+class HouseContextCache:
+    """
+    Общие для частей (распределенной) операции данные дома - контекст.
+
+    Загруженные порождающей операцией данные (идентификаторы ГИС ЖКХ
+    помещений и ЛС, данные помещений и жильцов) сохраняются в Redis
+    под ключом дома, порождающей записи и типа объектов вместе с
+    идентификаторами объектов операции. Порожденные части получают
+    контекст, если их объекты входят в сохраненные, иначе (и без Redis)
+    загружают данные сами
+    """
+
+    PREFIX = 'gis:house_context'
+
+    def __init__(self, ttl=HOUSE_CONTEXT_TTL):
+        self.ttl = ttl
+
+    def _key(self, house_id, record_id, object_type) -> str:
+        return f'{self.PREFIX}:{house_id}:{record_id}:{object_type}'
+
+    def put(self, house_id, record_id, object_type,
+            object_ids, data: dict) -> bool:
+        """Сохранить контекст объектов операции"""
+        try:
+            CACHE_REDIS.redis.set(
+                self._key(house_id, record_id, object_type),
+                pickle.dumps((frozenset(object_ids), data)),
+                ex=self.ttl,
+            )
+        except (redis.RedisError, pickle.PicklingError) as error:
+            logger.warning('GIS house context is not saved: %s', error)
+            return False
+        return True
+
+    def get(self, house_id, record_id, object_type,
+            object_ids) -> Optional[dict]:
+        """Контекст, включающий объекты операции, или None"""
+        try:
+            raw = CACHE_REDIS.redis.get(self._key(house_id, record_id, object_type))
+        except redis.RedisError as error:
+            logger.warning('GIS house context is unavailable: %s', error)
+            return None
+        if raw is None:
+            return None
+        shared_ids, data = pickle.loads(raw)
+        if not shared_ids.issuperset(object_ids):  # другой набор объектов?
+            return None
+        return data
+
+
+HOUSE_CONTEXT = HouseContextCache()
@@ -0,0 +1,114 @@
+import logging
+import pickle
+import threading
+from collections import OrderedDict
+
+import redis
+
+from app.caching.core.redis import CACHE_REDIS
+
+logger = logging.getLogger('c300')
+
+# записи прежних версий удаляются по истечении, изменения справочников
+# в обход save/delete (без сброса версии) видны не позднее
+NSI_CACHE_TTL = 60 * 60
+NSI_LOCAL_CACHE_SIZE = 512  # записей в памяти процесса
+
+
+class NsiCache:
+    """
+    Общий для процессов кэш справочников (НСИ) услуг организаций.
+
+    Данные хранятся в Redis под ключом с версией справочников организации,
+    перед ними в каждом процессе - LRU-кэш. Изменение справочников или
+    сопоставлений услуг организации увеличивает версию, после чего данные
+    всех процессов перестают быть актуальными. Без Redis данные
+    загружаются из базы (без кэширования)
+    """
+
+    PREFIX = 'nsi'
+
+    def __init__(self, local_size=NSI_LOCAL_CACHE_SIZE, ttl=NSI_CACHE_TTL):
+        self.local_size = local_size
+        self.ttl = ttl
+        self._local = OrderedDict()  # ключ: (версия, данные)
+        self._lock = threading.Lock()
+
+    def _version_key(self, provider_id) -> str:
+        return f'{self.PREFIX}:version:{provider_id}'
+
+    def _data_key(self, kind, provider_id, reg_nums, version) -> str:
+        return f'{self.PREFIX}:{kind}:{provider_id}:' \
+            f'{",".join(str(num) for num in reg_nums)}:{version}'
+
+    def get(self, kind: str, provider_id, loader, reg_nums=()):
+        """
+        Данные справочников организации из кэша или загрузчика
+
+        :param kind: вид данных ('references', 'mappings',...)
+        :param loader: функция загрузки данных из базы
+        :param reg_nums: номера справочников, входящие в ключ
+        """
+        local_key = (kind, provider_id, tuple(reg_nums))
+        try:
+            version = int(CACHE_REDIS.redis.get(self._version_key(provider_id)) or 0)
+        except redis.RedisError as error:
+            logger.warning('NSI cache is unavailable: %s', error)
+            return loader()
+
+        with self._lock:
+            cached = self._local.get(local_key)
+            if cached is not None and cached[0] == version:
+                self._local.move_to_end(local_key)
+                return cached[1]
+
+        data_key = self._data_key(kind, provider_id, reg_nums, version)
+        try:
+            raw = CACHE_REDIS.redis.get(data_key)
+        except redis.RedisError:
+            raw = None
+        if raw is not None:
+            data = pickle.loads(raw)
+        else:
+            data = loader()
+            try:
+                CACHE_REDIS.redis.set(data_key, pickle.dumps(data), ex=self.ttl)
+            except redis.RedisError as error:
+                logger.warning('NSI cache is not stored: %s', error)
+
+        with self._lock:
+            self._local[local_key] = (version, data)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+        return data
+
+    def invalidate(self, provider_id):
+        """Сбросить кэш справочников организации во всех процессах"""
+        with self._lock:
+            for key in [k for k in self._local if k[1] == provider_id]:
+                del self._local[key]
+        try:
+            CACHE_REDIS.redis.incr(self._version_key(provider_id))
+        except redis.RedisError as error:
+            logger.warning('NSI cache is not invalidated: %s', error)
+
+
+NSI_CACHE = NsiCache()
+
+
+def warm_nsi_cache(provider_id):
+    """
+    Загрузить в кэш (заново) справочники и сопоставления услуг организации
+    """
+    from processing.models.billing.service_type import \
+        ServiceTypeGisName, ServiceTypeGisBind, GisTitleDuplicateError
+
+    NSI_CACHE.invalidate(provider_id)  # иначе вернутся прежние данные
+
+    ServiceTypeGisName.references(provider_id)
+    ServiceTypeGisBind.mappings_of(provider_id)
+    try:
+        ServiceTypeGisName.ref_codes_of(provider_id)
+    except GisTitleDuplicateError as error:  # одноименные элементы
+        logger.warning('NSI cache is not warmed: %s', error)
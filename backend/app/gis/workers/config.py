@@ -67,6 +67,10 @@ GIS_TASK_SCHEDULE = {
         'task': 'gis.cleanup',
         'schedule': crontab(minute=11, hour=0),  # 03:11 MSK
     },
+    'gis-reconciled-every-night': {
+        'task': 'gis.reconciled',  # сводки сверки домов с ГИС ЖКХ
+        'schedule': crontab(minute=44, hour=2),  # 05:44 MSK
+    },
     'gis-reanimate-every-night': {
         'task': 'gis.reanimate',
         'schedule': crontab(minute=11, hour=4),  # 07:11 MSK
@@ -1,5 +1,7 @@
 import re
 import itertools
+import bisect
+import functools
 from datetime import datetime
 
 from bson import ObjectId
@@ -68,6 +70,230 @@ class HouseValidationError(ValidationError):
     pass
 
 
+_AREA_NUMBER_REGEX = re.compile(r'^(\d{1,6})([ЖНП])?$')
+_NO_LOW = -1  # диапазон «до», например -10
+_NO_HIGH = float('inf')  # диапазон «от», например 10-
+
+
+class AreasRange:
+    """
+    Разобранный диапазон помещений привязки дома, например '1-120, 5Н, 10П-'
+
+    Хранит по типам помещений упорядоченные непересекающиеся интервалы
+    номеров. Разбирается один раз на строку диапазона (compile), поддерживает
+    проверку вхождения помещения ((тип, номер) in areas_range), пересечение
+    диапазонов (&) и формирование mongodb-запроса
+    """
+
+    __slots__ = ('intervals', 'unbounded')
+
+    def __init__(self, intervals: dict, unbounded=()):
+        # тип помещения: ((от, до),...) - только для чтения
+        self.intervals = intervals
+        # части строки с бесконечными диапазонами
+        self.unbounded = tuple(unbounded)
+
+    @classmethod
+    def compile(cls, str_range: str) -> 'AreasRange':
+        """Разобранный (кэшированный) диапазон помещений"""
+        return _compile_areas_range(str_range)
+
+    def __bool__(self):
+        return bool(self.intervals)
+
+    def __contains__(self, area) -> bool:
+        """Входит ли помещение (тип, номер) в диапазон"""
+        area_type, number = area
+        intervals = self.intervals.get(area_type)
+        if not intervals:
+            return False
+        ix = bisect.bisect_right(intervals, (number, _NO_HIGH)) - 1
+        return ix >= 0 and intervals[ix][0] <= number <= intervals[ix][1]
+
+    def __and__(self, other: 'AreasRange') -> 'AreasRange':
+        """Пересечение диапазонов"""
+        intervals = {}
+        for area_type, own in self.intervals.items():
+            result = []
+            ix, jx = 0, 0
+            others = other.intervals.get(area_type, ())
+            while ix < len(own) and jx < len(others):
+                low = max(own[ix][0], others[jx][0])
+                high = min(own[ix][1], others[jx][1])
+                if low <= high:
+                    result.append((low, high))
+                if own[ix][1] < others[jx][1]:
+                    ix += 1
+                else:
+                    jx += 1
+            if result:
+                intervals[area_type] = tuple(result)
+        return AreasRange(intervals)
+
+    def to_query(self, path='') -> dict:
+        """
+        Mongodb-запрос помещений диапазона: отдельные номера - $in,
+        интервалы - $gte/$lte
+        :param path: префикс квартирного поля, если поиск производится
+                     в чужой коллекции по денормализованному полю
+        """
+        path_dot = path + '.' if path else ''
+        path_type = path_dot + '_type'
+        path_number = path_dot + 'number'
+
+        queries = []
+        for area_type in sorted(self.intervals):
+            numbers = []
+            for low, high in self.intervals[area_type]:
+                if low == high:
+                    numbers.append(low)
+                    continue
+                condition = {}
+                if low != _NO_LOW:
+                    condition['$gte'] = low
+                if high != _NO_HIGH:
+                    condition['$lte'] = high
+                queries.append({path_type: area_type, path_number: condition})
+            if numbers:
+                queries.append({
+                    path_type: area_type,
+                    path_number: (
+                        numbers[0] if len(numbers) == 1 else {'$in': numbers}
+                    ),
+                })
+        return {'$or': queries}
+
+    def to_list(self) -> list:
+        """Список (тип, номер) помещений диапазона"""
+        if self.unbounded:
+            raise HouseValidationError(
+                'Некорректные значения '
+                'диапазона: {}'.format(', '.join(self.unbounded))
+            )
+        return [
+            (area_type, number)
+            for area_type in sorted(self.intervals)
+            for low, high in self.intervals[area_type]
+            for number in range(low, high + 1)
+        ]
+
+
+@functools.lru_cache(maxsize=4096)
+def _compile_areas_range(str_range: str) -> AreasRange:
+    parts = {}  # тип помещения: [(от, до),...]
+    unbounded = []
+    invalids = []
+
+    # Разбираем все диапазоны и одиночные значения в списки
+    for part in str_range.upper().replace(' ', '').split(','):
+        numbers = []
+        for str_number in part.split('-'):
+            if not str_number:
+                numbers.append(None)
+                continue
+
+            match = _AREA_NUMBER_REGEX.match(str_number)
+            if not match:
+                invalids.append(part)
+                break
+
+            number, letter = match.groups()
+            # Определяем тип квартиры, исходя из полученной литеры
+            _type = AREA_TYPES.get(letter) if letter else 'LivingArea'
+            if not _type:
+                invalids.append(part)
+                break
+            numbers.append((_type, int(number)))
+
+        if part in invalids:
+            continue
+
+        if len(numbers) == 1:
+            if numbers[0]:
+                # Конкретный номер
+                _type, number = numbers[0]
+                parts.setdefault(_type, []).append((number, number))
+        elif len(numbers) == 2:
+            low, high = numbers
+            if not low and not high:
+                invalids.append(part)
+            elif not low:
+                # Бесконечный диапазон «до», например -10
+                parts.setdefault(high[0], []).append((_NO_LOW, high[1]))
+                unbounded.append(part)
+            elif not high:
+                # Бесконечный диапазон «от», например 10-
+                parts.setdefault(low[0], []).append((low[1], _NO_HIGH))
+                unbounded.append(part)
+            elif low[1] > high[1] or low[0] != high[0]:
+                invalids.append(part)
+            else:
+                # Диапазон «от и до», например 5-10
+                parts.setdefault(low[0], []).append((low[1], high[1]))
+        else:
+            invalids.append(part)
+
+    if invalids:
+        # Ошибка, если обнаружена хоть одна некорректная часть диапазона
+        raise HouseValidationError(
+            'Некорректные значения '
+            'диапазона: {}'.format(', '.join(invalids))
+        )
+
+    intervals = {}
+    for _type, ranges in parts.items():
+        merged = []
+        for low, high in sorted(ranges):
+            if merged and low <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+            else:
+                merged.append((low, high))
+        intervals[_type] = tuple(merged)
+    return AreasRange(intervals, unbounded)
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_area_str_numbers(str_range: str) -> frozenset:
+    """Строковые номера помещений диапазона привязки, например '1-3А'"""
+    area_str_numbers = set()
+
+    str_range = str_range.upper()
+    parts = str_range.replace(' ', '').split(',')
+
+    for part in parts:
+        if '-' in part:
+            range_start, range_end = part.split('-')
+
+            range_start_number = int(
+                ''.join([ch for ch in range_start if ch.isdigit()])
+            )
+            range_start_letter = ''.join(
+                [ch for ch in range_start if ch.isalpha()]
+            )
+            range_end_number = int(
+                ''.join([ch for ch in range_end if ch.isdigit()])
+            )
+            range_end_letter = ''.join(
+                [ch for ch in range_end if ch.isalpha()]
+            )
+            if range_start_letter != range_end_letter:
+                pass  # TODO raise
+
+            # NOTE range с обратным порядком(напр. 5-4) вернет пустой список
+            number_list = [
+                str(number) + range_end_letter
+                for number in range(
+                    range_start_number,
+                    range_end_number + 1
+                )
+            ]
+            for area_str_number in number_list:
+                area_str_numbers.add(area_str_number)
+        else:
+            area_str_numbers.add(part)
+    return frozenset(area_str_numbers)
+
+
 class Lift(EmbeddedDocument):
     id = ObjectIdField(db_field="_id")
     desc = StringField(null=True, verbose_name='Описание лифта')
@@ -1197,6 +1423,7 @@ class House(Document, BindedModelMixin):
         HouseGroupBinds,
         verbose_name='Привязки к группе домов',
     )
+    _HOUSE_BINDS_KEYS = ('_id', None)
     harvested_region_standard = FloatField(
         null=True,
         verbose_name='Уборочная площадь з.участка по нормативу'
@@ -1591,8 +1818,12 @@ class House(Document, BindedModelMixin):
                 setl_home_address_changed = True
             else:
                 self.setl_home_address = None
+        porches_changed = not self._created and self._is_triggers(['porches'])
 
         result = super().save(*args, **kwargs)
+        if porches_changed:
+            from app.caching.models.filters import FilterDataVersion
+            FilterDataVersion.bump(self.id)
         rebuild_fias_tree = False
         if address_changed:
             self.foreign_denormalize()
@@ -1628,8 +1859,8 @@ class House(Document, BindedModelMixin):
 
     def foreign_denormalize(self):
         from app.caching.tasks.denormalization import \
-            foreign_denormalize_data
-        foreign_denormalize_data.delay(
+            schedule_foreign_denormalize
+        schedule_foreign_denormalize(
             model_from=House,
             field_name='address',
             object_id=self.pk,
@@ -1707,43 +1938,7 @@ class House(Document, BindedModelMixin):
         return list(areas.values())
 
     def _parse_numbers(self, service_bind):
-        area_str_numbers = set()
-
-        str_range = service_bind['areas_range'].upper()
-        parts = str_range.replace(' ', '').split(',')
-
-        for part in parts:
-            if '-' in part:
-                range_start, range_end = part.split('-')
-
-                range_start_number = int(
-                    ''.join([ch for ch in range_start if ch.isdigit()])
-                )
-                range_start_letter = ''.join(
-                    [ch for ch in range_start if ch.isalpha()]
-                )
-                range_end_number = int(
-                    ''.join([ch for ch in range_end if ch.isdigit()])
-                )
-                range_end_letter = ''.join(
-                    [ch for ch in range_end if ch.isalpha()]
-                )
-                if range_start_letter != range_end_letter:
-                    pass  # TODO raise
-
-                # NOTE range с обратным порядком(напр. 5-4) вернет пустой список
-                number_list = [
-                    str(number) + range_end_letter
-                    for number in range(
-                        range_start_number,
-                        range_end_number + 1
-                    )
-                ]
-                for area_str_number in number_list:
-                    area_str_numbers.add(area_str_number)
-            else:
-                area_str_numbers.add(part)
-        return area_str_numbers
+        return set(_parse_area_str_numbers(service_bind['areas_range']))
 
     def is_rural(self):
 
@@ -1937,68 +2132,7 @@ class House(Document, BindedModelMixin):
         Разбор строкового диапазона квартир в список номеров и типов квартир
         :param str_range: строка диапазона
         """
-        str_range = str_range.upper()
-        invalids = []
-        areas = []
-
-        # Разбираем все диапазоны и одиночные значения в списки
-        for part in str_range.replace(' ', '').split(','):
-            numbers = []
-            for str_number in part.split('-'):
-                if not str_number:
-                    numbers.append('')
-                    continue
-
-                match = re.match(r'^(\d{1,6})([ЖНП])?$', str_number)
-                if not match:
-                    invalids.append(part)
-                    break
-
-                number, letter = match.groups()
-                # Определяем тип квартиры, исходя из полученной литеры
-                _type = (
-                    AREA_TYPES.get(letter.upper())
-                    if letter
-                    else 'LivingArea'
-                )
-                if not _type:
-                    invalids.append(part)
-                    break
-                numbers.append((_type, int(number)))
-
-            if part in invalids:
-                continue
-
-            if len(numbers) == 1:
-                if numbers[0]:
-                    # Конкретный номер
-                    areas.append(numbers[0])
-            elif len(numbers) == 2:
-                if not numbers[0] or not numbers[1]:
-                    invalids.append(part)
-                    continue
-
-                # Диапазон «от и до», например 5-10
-                condition = (
-                        numbers[0][1] > numbers[1][1]
-                        or numbers[0][0] != numbers[1][0]
-                )
-                if condition:
-                    invalids.append(part)
-                    continue
-
-                for number in range(numbers[0][1], numbers[1][1] + 1):
-                    areas.append((numbers[0][0], number))
-            else:
-                invalids.append(part)
-
-        if invalids:
-            # Ошибка, если обнаружена хоть одна некорректная часть диапазона
-            raise HouseValidationError(
-                'Некорректные значения '
-                'диапазона: {}'.format(', '.join(invalids))
-            )
-        return areas
+        return AreasRange.compile(str_range).to_list()
 
     @staticmethod
     def parse_areas_range_to_query(str_range, path=''):
@@ -2008,95 +2142,7 @@ class House(Document, BindedModelMixin):
         :param path: префикс квартирного поля, если поиск производится
                      в чужой коллекции по денормализованному полю
         """
-        str_range = str_range.upper()
-        queries = []
-        invalids = []
-
-        # Формируем пути к полям
-        # (по-умолчанию перфикса нет, ибо ищем в родной коллекции)
-        path_dot = path + '.' if path else ''
-        path_type = path_dot + '_type'
-        path_number = path_dot + 'number'
-
-        # Разбираем все диапазоны и одиночные значения в списки
-        for part in str_range.replace(' ', '').split(','):
-            numbers = []
-            for str_number in part.split('-'):
-                if not str_number:
-                    numbers.append('')
-                    continue
-
-                match = re.match(r'^(\d{1,6})([ЖНП])?$', str_number)
-                if not match:
-                    invalids.append(part)
-                    break
-
-                number, letter = match.groups()
-
-                # Определяем тип квартиры, исходя из полученной литеры
-                _type = (
-                    AREA_TYPES.get(letter.upper()) if letter else 'LivingArea'
-                )
-                if not _type:
-                    invalids.append(part)
-                    break
-                numbers.append({
-                    path_type: _type,
-                    path_number: int(number),
-                })
-
-            if part in invalids:
-                continue
-
-            if len(numbers) == 1:
-                if numbers[0]:
-                    # Конкретный номер
-                    queries.append(numbers[0])
-            elif len(numbers) == 2:
-                if not numbers[0] and not numbers[1]:
-                    invalids.append(part)
-                    continue
-
-                if part.startswith('-'):
-                    # Бесконечный диапазон «до», например -10
-                    queries.append({
-                        path_type: numbers[1][path_type],
-                        path_number: {'$lte': numbers[1][path_number]},
-                    })
-                elif part.endswith('-'):
-                    # Бесконечный диапазон «от», например 10-
-                    queries.append({
-                        path_type: numbers[0][path_type],
-                        path_number: {'$gte': numbers[0][path_number]},
-                    })
-                else:
-                    # Диапазон «от и до», например 5-10
-                    condition = (
-                            numbers[0][path_number] > numbers[1][path_number]
-                            or numbers[0][path_type] != numbers[1][path_type]
-                    )
-                    if condition:
-                        invalids.append(part)
-                        continue
-
-                    queries.append({
-                        path_type: numbers[0][path_type],
-                        path_number: {
-                            '$gte': numbers[0][path_number],
-                            '$lte': numbers[1][path_number]
-                        },
-                    })
-            else:
-                invalids.append(part)
-
-        if invalids:
-            # Ошибка, если обнаружена хоть одна некорректная часть диапазона
-            raise HouseValidationError(
-                'Некорректные значения '
-                'диапазона: {}'.format(', '.join(invalids))
-            )
-
-        return {'$or': queries}
+        return AreasRange.compile(str_range).to_query(path)
 
     def _denormalize_developer(self):
         """ Принадлежит ли дом застройщику """
@@ -2371,7 +2417,10 @@ class House(Document, BindedModelMixin):
             provider_ids = self._get_providers_including_deleted()
 
         for _id in provider_ids:
-            create_provider_fias_tree_cache.delay(provider_id=_id)
+            create_provider_fias_tree_cache.delay(
+                provider_id=_id,
+                house_id=self.id,
+            )
 
         return provider_ids
 
@@ -1,4 +1,7 @@
+from urllib.parse import parse_qs
+
 from api.v4.telephony.consumers.base import BaseConsumer
+from app.messages.core.notifier import NOTICES_GROUP, DELTA_NOTICES_GROUP
 
 
 class MessengerConsumer(BaseConsumer):
@@ -6,10 +9,14 @@ class MessengerConsumer(BaseConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.user_id = self.scope["user"]
-        self.channel = f"updates_{str(self.user_id)}"
-        self.channel_name = f"updates_{str(self.user_id)}"
+        self.channel = NOTICES_GROUP.format(self.user_id)
+        self.channel_name = NOTICES_GROUP.format(self.user_id)
 
     async def websocket_connect(self, event):
+        # ?notices=delta - клиент принимает только изменившиеся уведомления
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        if 'delta' in query.get('notices', []):
+            self.channel = DELTA_NOTICES_GROUP.format(self.user_id)
         await self.accept()
         await self.channel_layer.group_add(self.channel, self.channel_name)
 
@@ -0,0 +1,96 @@
+from pymongo import UpdateMany, UpdateOne
+
+from app.messages.models.messenger import MessageEmbedded, UserTasks
+
+# сколько мессенджеров обновляется одним bulk_write
+NOTICES_CHUNK_SIZE = 1000
+
+
+def fan_out_notices(accounts_ids, obj_key, message='new', obj_id=None,
+                    count=0, url='', chunk_size=NOTICES_CHUNK_SIZE,
+                    progress=None):
+    """
+    Рассылка уведомления в мессенджеры пользователей пачками.
+
+    На каждую пачку пользователей - один bulk_write: создание недостающих
+    мессенджеров, обновление уведомления с obj_id у тех, у кого оно уже
+    есть, и добавление остальным. Повторный вызов с тем же obj_id
+    не создаёт дублей
+
+    :param progress: функция (обработано, всего) для отчёта о ходе рассылки
+    :returns: количество пользователей
+    """
+    accounts_ids = list(dict.fromkeys(accounts_ids))
+    total = len(accounts_ids)
+    collection = UserTasks._get_collection()
+    for ix in range(0, total, chunk_size):
+        chunk = accounts_ids[ix: ix + chunk_size]
+        collection.bulk_write(
+            _get_chunk_requests(chunk, obj_key, message, obj_id, count, url),
+            ordered=True,
+        )
+        UserTasks.ws_notify(chunk, [(obj_key, obj_id)])
+        if progress:
+            progress(ix + len(chunk), total)
+    return total
+
+
+def _get_chunk_requests(accounts_ids, obj_key, message, obj_id, count, url):
+    skeleton = {
+        k: v for k, v in UserTasks.empty_messenger().items() if k != obj_key
+    }
+    if not obj_id:
+        notice = {
+            'text': message,
+            'unread': True,
+            'url': url,
+            'count': count,
+        }
+        return [
+            UpdateOne(
+                {'account': account_id},
+                {'$set': {obj_key: notice}, '$setOnInsert': skeleton},
+                upsert=True,
+            )
+            for account_id in accounts_ids
+        ]
+
+    requests = [
+        UpdateOne(
+            {'account': account_id},
+            {'$setOnInsert': {**skeleton, obj_key: []}},
+            upsert=True,
+        )
+        for account_id in accounts_ids
+    ]
+    update_set_query = {
+        f'{obj_key}.$.text': message,
+        f'{obj_key}.$.unread': True,
+    }
+    if url:
+        update_set_query[f'{obj_key}.$.url'] = url
+    if count:
+        update_set_query[f'{obj_key}.$.count'] = count
+    requests.append(
+        UpdateMany(
+            {'account': {'$in': accounts_ids}, f'{obj_key}.id': obj_id},
+            {'$set': update_set_query},
+        ),
+    )
+    notice = MessageEmbedded(
+        id=obj_id,
+        text=message,
+        url=url,
+        count=count,
+        unread=True,
+    ).to_mongo().to_dict()
+    requests.append(
+        UpdateMany(
+            {
+                'account': {'$in': accounts_ids},
+                f'{obj_key}.id': {'$ne': obj_id},
+            },
+            {'$push': {obj_key: notice}},
+        ),
+    )
+    return requests
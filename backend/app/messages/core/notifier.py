@@ -0,0 +1,207 @@
+import asyncio
+import atexit
+import json
+import logging
+import threading
+
+from asgiref.sync import async_to_sync
+from bson import ObjectId
+
+from api.v4.serializers import json_serializer
+
+logger = logging.getLogger('c300')
+
+# окно, в течение которого изменения мессенджера одного пользователя
+# склеиваются в одно уведомление
+NOTICES_COALESCE_SECONDS = 0.3
+# событие с полным списком уведомлений
+FULL_NOTICES_EVENT = 'get.notices'
+# событие только с изменившимися уведомлениями
+DELTA_NOTICES_EVENT = 'get.notices.delta'
+# группа всех подключений пользователя (полный список уведомлений)
+NOTICES_GROUP = 'updates_{}'
+# группа подключений, запросивших изменения (?notices=delta)
+DELTA_NOTICES_GROUP = 'updates_delta_{}'
+
+
+def get_notices_from_raw(messenger: dict, fields_order, changes=None) -> list:
+    """
+    Преобразует сырые данные мессенджера в список сообщений
+
+    :param messenger: документ UserTasks (as_pymongo или to_mongo)
+    :param fields_order: порядок полей мессенджера
+    :param changes: {поле: {id сообщения, ...} или None (всё поле)} -
+        если передан, возвращаются только изменившиеся сообщения
+    """
+    result = []
+    for field_name in fields_order:
+        if changes is not None and field_name not in changes:
+            continue
+        ids = changes.get(field_name) if changes is not None else None
+        value = messenger.get(field_name)
+        if isinstance(value, dict):
+            tasks = [value]
+        elif isinstance(value, list):
+            tasks = [v for v in value if isinstance(v, dict)]
+            if field_name != 'reports':
+                tasks = list({v.get('id'): v for v in tasks}.values())
+        else:
+            tasks = []
+        for task in tasks:
+            if ids is not None and not _task_in_ids(task, ids):
+                continue
+            result.append(_get_message_from_raw(task, field_name))
+    return result
+
+
+def _task_in_ids(task: dict, ids: set) -> bool:
+    extra = task.get('extra') or {}
+    keys = (task.get('id'), extra.get('task_id'), extra.get('report_id'))
+    return any(key is not None and str(key) in ids for key in keys)
+
+
+def _get_message_from_raw(task: dict, obj_name: str) -> dict:
+    result = dict(task)
+    result['obj'] = obj_name
+    if 'extra' in result:
+        result.update(result.pop('extra') or {})
+    return result
+
+
+class NoticesNotifier:
+    """
+    Отправка уведомлений мессенджера через WebSocket.
+
+    Изменения копятся NOTICES_COALESCE_SECONDS, после чего мессенджеры всех
+    затронутых пользователей читаются одним запросом и уведомления уходят
+    одной пачкой. Подключения NOTICES_GROUP всегда получают весь список
+    (FULL_NOTICES_EVENT); подключениям DELTA_NOTICES_GROUP, если известно,
+    какие сообщения изменились, отправляются только они (DELTA_NOTICES_EVENT)
+    """
+
+    def __init__(self, coalesce_seconds=NOTICES_COALESCE_SECONDS):
+        self.coalesce_seconds = coalesce_seconds
+        self._lock = threading.Lock()
+        self._pending = {}  # account_id: {поле: {id, ...} | None} | None
+        self._timer = None
+
+    def notify(self, accounts, changes=None):
+        """
+        Запланировать уведомление пользователей
+
+        :param accounts: список id пользователей
+        :param changes: [(поле, id сообщения или None), ...] или None,
+            если изменился весь мессенджер
+        """
+        with self._lock:
+            for account_id in accounts:
+                if isinstance(account_id, str):
+                    account_id = ObjectId(account_id)
+                self._merge(account_id, changes)
+            if self.coalesce_seconds <= 0:
+                start_timer = False
+            else:
+                start_timer = self._timer is None
+                if start_timer:
+                    self._timer = threading.Timer(
+                        self.coalesce_seconds,
+                        self.flush,
+                    )
+                    self._timer.daemon = True
+        if self.coalesce_seconds <= 0:
+            self.flush()
+        elif start_timer:
+            self._timer.start()
+
+    def _merge(self, account_id, changes):
+        if account_id in self._pending and self._pending[account_id] is None:
+            return
+        if changes is None:
+            self._pending[account_id] = None
+            return
+        pending = self._pending.setdefault(account_id, {})
+        for field_name, obj_id in changes:
+            if obj_id is None:
+                pending[field_name] = None
+            elif field_name not in pending or pending[field_name] is not None:
+                pending.setdefault(field_name, set()).add(str(obj_id))
+
+    def flush(self):
+        """Отправить все накопленные уведомления"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        if not pending:
+            return
+        try:
+            self._send(self._get_group_messages(pending))
+        except Exception as error:
+            logger.exception('ws notices not sent: %s', error)
+
+    @staticmethod
+    def _get_group_messages(pending):
+        from app.messages.models.messenger import UserTasks
+
+        fields_order = UserTasks._fields_ordered
+        messengers = {
+            messenger['account']: messenger
+            for messenger in UserTasks.objects(
+                account__in=list(pending),
+            ).as_pymongo()
+        }
+        result = []
+        for account_id, changes in pending.items():
+            messenger = messengers.get(account_id, {})
+            full_message = _get_group_message(
+                FULL_NOTICES_EVENT,
+                get_notices_from_raw(messenger, fields_order),
+            )
+            result.append((NOTICES_GROUP.format(account_id), full_message))
+            if changes is None:
+                delta_message = full_message
+            else:
+                delta_message = _get_group_message(
+                    DELTA_NOTICES_EVENT,
+                    {
+                        'fields': list(changes),
+                        'notices': get_notices_from_raw(
+                            messenger,
+                            fields_order,
+                            changes,
+                        ),
+                    },
+                )
+            result.append(
+                (DELTA_NOTICES_GROUP.format(account_id), delta_message),
+            )
+        return result
+
+    @staticmethod
+    def _send(group_messages):
+        from channels.layers import get_channel_layer
+
+        channel_layer = get_channel_layer()
+
+        async def send_all():
+            await asyncio.gather(*(
+                channel_layer.group_send(channel_name, data)
+                for channel_name, data in group_messages
+            ))
+
+        async_to_sync(send_all)()
+
+
+def _get_group_message(event: str, data) -> dict:
+    return {
+        'type': 'response.proxy',
+        'event': event,
+        'data': json.dumps(
+            data,
+            default=json_serializer,
+            ensure_ascii=False,
+        ),
+    }
+
+
+NOTIFIER = NoticesNotifier()
+atexit.register(NOTIFIER.flush)
@@ -2,7 +2,6 @@ import collections
 import json
 from datetime import datetime
 
-from asgiref.sync import async_to_sync
 from bson import ObjectId
 from mongoengine import (
     EmbeddedDocument,
@@ -20,6 +19,7 @@ from mongoengine import (
 )
 
 from api.v4.serializers import json_serializer
+from app.messages.core.notifier import NOTIFIER, get_notices_from_raw
 from app.messages.models.choices import OBJECT_CHOICES
 from constants.common import TASK_STATES
 import logging
@@ -200,7 +200,7 @@ class UserTasks(Document):
         ).update(
             push__reports=msg,
         )
-        cls.ws_notify(account_id)
+        cls.ws_notify(account_id, [('reports', task_id)])
 
     def clean_report_tasks(self):
         text_value_list = ['success', 'failed', 'finished']
@@ -276,7 +276,7 @@ class UserTasks(Document):
             },
         )
         if updated:
-            cls.ws_notify(account_id)
+            cls.ws_notify(account_id, [('reports', report_id)])
         return bool(updated)
 
     @classmethod
@@ -303,7 +303,7 @@ class UserTasks(Document):
             }
         )
         if updated:
-            cls.ws_notify(account_id)
+            cls.ws_notify(account_id, [('reports', report_id)])
         return bool(updated)
 
     @classmethod
@@ -341,7 +341,7 @@ class UserTasks(Document):
                 },
             },
         )
-        cls.ws_notify(account_id)
+        cls.ws_notify(account_id, [('reports', report_id)])
         return bool(updated)
 
     def clean_receipts(self, meta):
@@ -363,18 +363,7 @@ class UserTasks(Document):
         if not messenger:
             messenger = cls(
                 account=account_id,
-                reports=[],
-                gis=[],
-                journal=None,
-                news=None,
-                ticket=None,
-                cash=None,
-                receipts=[],
-                meters=[],
-                coefs=None,
-                accrual_docs=[],
-                massive_receipts=[],
-                own_contract_docs=[],
+                **cls.empty_messenger(),
             )
             messenger.save()
         return messenger
@@ -385,20 +374,27 @@ class UserTasks(Document):
             cls.objects(
                 account=account_id,
             ).upsert_one(
-                reports=[],
-                gis=[],
-                journal=None,
-                news=None,
-                ticket=None,
-                cash=None,
-                receipts=[],
-                meters=[],
-                coefs=None,
-                accrual_docs=[],
-                massive_receipts=[],
-                own_contract_docs=[],
+                **cls.empty_messenger(),
             )
 
+    @staticmethod
+    def empty_messenger():
+        """Поля пустого мессенджера, создаваемого для новых пользователей"""
+        return dict(
+            reports=[],
+            gis=[],
+            journal=None,
+            news=None,
+            ticket=None,
+            cash=None,
+            receipts=[],
+            meters=[],
+            coefs=None,
+            accrual_docs=[],
+            massive_receipts=[],
+            own_contract_docs=[],
+        )
+
     @classmethod
     def receipts_updated(cls, account_id, task_id):
         messenger = cls.get_messenger(account_id)
@@ -477,7 +473,7 @@ class UserTasks(Document):
             new_msg.count = count
         setattr(messenger, section, new_msg)
         messenger.save()
-        cls.ws_notify(account_id)
+        cls.ws_notify(account_id, [(section, None)])
 
     @classmethod
     def send_message(cls, account_id, message, url):
@@ -490,99 +486,46 @@ class UserTasks(Document):
                 url=url,
             ),
         )
-        cls.ws_notify(account_id)
+        cls.ws_notify(account_id, [('messages', None)])
 
     @classmethod
     def send_notices(cls, accounts_ids, obj_key, message='new',
-                     obj_id=None, count=0, url=''):
+                     obj_id=None, count=0, url='', progress=None):
         """
         Общий метод добавления информации о
-        новых обращении/новости/заявке в журнале
+        новых обращении/новости/заявке в журнале.
+        Рассылка идёт пачками (fan_out_notices)
         """
+        from app.messages.core.fan_out import fan_out_notices
+
         logger.debug('send_notices %s with id %s', obj_key, obj_id)
-        users_tasks = cls.objects(__raw__={'account': {'$in': accounts_ids}})
-        new_users = list(
-            set(accounts_ids)
-            - set(users_tasks.distinct('account'))
-        )
-        cls.upsert_accounts(new_users)
-        if obj_id:
-            update_queryset = users_tasks.filter(
-                __raw__={
-                    f'{obj_key}.id': obj_id,
-                },
-            )
-            update_field_key = f'{obj_key}.$'
-        else:
-            update_queryset = users_tasks
-            update_field_key = obj_key
-        # Добавим уведомление для существующих
-        if obj_id:
-            update_set_query = {
-                f'{update_field_key}.text': message,
-                f'{update_field_key}.unread': True,
-            }
-            if url:
-                update_set_query[f'{update_field_key}.url'] = url
-            if count:
-                update_set_query[f'{update_field_key}.count'] = count
-        else:
-            update_set_query = {
-                update_field_key: {
-                    'text': message,
-                    'unread': True,
-                    'url': url,
-                    'count': count,
-                },
-            }
-        res = update_queryset.update(
-            __raw__={
-                '$set': update_set_query,
-            },
+        total = fan_out_notices(
+            accounts_ids,
+            obj_key,
+            message=message,
+            obj_id=obj_id,
+            count=count,
+            url=url,
+            progress=progress,
         )
         logger.debug(
-            'send_notices %s with id %s updated %s',
-            obj_key, obj_id, res,
+            'send_notices %s with id %s sent to %s',
+            obj_key, obj_id, total,
         )
-        if obj_id:
-            res = users_tasks.filter(
-                __raw__={f'{obj_key}.id': {'$ne': obj_id}},
-            ).update(
-                **{
-                    f'push__{obj_key}': MessageEmbedded(
-                        id=obj_id,
-                        text=message,
-                        url=url,
-                        count=count,
-                        unread=True,
-                    ),
-                }
-            )
-            logger.debug(
-                'send_notices %s with id %s inserted %s',
-                obj_key, obj_id, res,
-            )
-        cls.ws_notify(accounts_ids)
 
     @classmethod
-    def ws_notify(cls, accounts):
+    def ws_notify(cls, accounts, changes=None):
         """
-        Отправка уведомлений клиенту через WebSocket
+        Отправка уведомлений клиенту через WebSocket.
+        Уведомления склеиваются и отправляются пачкой (NoticesNotifier)
+
+        :param changes: [(поле, id сообщения или None), ...] - если передан,
+            клиенту уйдут только изменившиеся сообщения
         """
-        if not isinstance(accounts, collections.Iterable):
+        if isinstance(accounts, (str, ObjectId)) \
+                or not isinstance(accounts, collections.Iterable):
             accounts = (accounts, )
-        from channels.layers import get_channel_layer
-        channel_layer = get_channel_layer()
-        for _id in accounts:  # правильно ли делать так, через цикл
-            channel_name = f'updates_{str(_id)}'
-            data = {
-                'type': 'response.proxy',
-                'event': 'get.notices',  # TODO: возможно, изменить на что-то нужное
-                'data': cls.get_notices(_id),
-            }
-            async_to_sync(channel_layer.group_send)(
-                channel_name, data
-            )
+        NOTIFIER.notify(accounts, changes)
 
     @classmethod
     def get_notices(cls, user_id):
@@ -590,33 +533,10 @@ class UserTasks(Document):
         Преобразует данные мессенджера в список сообщений
         """
         user_tasks = UserTasks.get_messenger(user_id)
-        result = []
-        for field_name in user_tasks:
-            field_value = getattr(user_tasks, field_name, None)
-            if isinstance(field_value, MessageEmbedded):
-                tasks = [field_value]
-            elif isinstance(field_value, list):
-                tasks = {
-                    v.id: v
-                    for v in field_value
-                    if isinstance(v, MessageEmbedded)
-                }
-                tasks = list(tasks.values())
-            else:
-                tasks = []
-            for task in tasks:
-                message = cls._get_message_from_task(task, field_name)
-                result.append(message)
-        for task in user_tasks.reports:
-            message = cls._get_message_from_task(task, 'reports')
-            result.append(message)
-        for task in user_tasks.messages:
-            message = cls._get_message_from_task(task, 'messages')
-            if task.unread and message not in result:
-                result.append(message)
-        # user_tasks.clean_report_tasks()
-        # user_tasks.clean_field('coefs', user_id)
-        # user_tasks.clean_field('accrual_docs', user_id)
+        result = get_notices_from_raw(
+            user_tasks.to_mongo(),
+            cls._fields_ordered,
+        )
         return json.dumps(result, default=json_serializer, ensure_ascii=False)
         # TODO: Латиница приходит в коде юникода. Возможно, нужно преобразование
 
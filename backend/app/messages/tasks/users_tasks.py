@@ -26,7 +26,12 @@ def update_users_journals(self, house_id):
         'id',
     )
     workers_id = checking_permissions(accounts, 'request_log_list')
-    UserTasks.send_notices(workers_id, 'journal', message='update')
+    UserTasks.send_notices(
+        workers_id,
+        'journal',
+        message='update',
+        progress=_task_progress(self),
+    )
 
 
 @celery_app.task(
@@ -37,7 +42,11 @@ def update_users_journals(self, house_id):
 )
 def update_users_tickets(self, accounts: list):
     """Добавление информации о новом обращении"""
-    UserTasks.send_notices(accounts, 'ticket')
+    UserTasks.send_notices(
+        accounts,
+        'ticket',
+        progress=_task_progress(self),
+    )
 
 
 @celery_app.task(
@@ -93,7 +102,24 @@ def update_users_news(self, query):
         a['_id']
         for a in Account.objects(__raw__={'$or': query}).as_pymongo().only('id')
     )
-    UserTasks.send_notices(accounts, 'news')
+    UserTasks.send_notices(
+        accounts,
+        'news',
+        progress=_task_progress(self),
+    )
+
+
+def _task_progress(task):
+    """Отчёт о ходе рассылки уведомлений в состоянии задачи"""
+
+    def progress(done, total):
+        if task.request.id:
+            task.update_state(
+                state='PROGRESS',
+                meta={'done': done, 'total': total},
+            )
+
+    return progress
 
 
 def checking_permissions(accounts_id, slug):
@@ -404,6 +404,9 @@ class Meter(Document, BindedModelMixin):
         HouseGroupBinds,
         verbose_name='Привязки к группе домов'
     )
+    # группы домов (_binds.hg) документов коллекции пересчитываются
+    # моделями AreaMeter и HouseMeter по своим ключам
+    _HOUSE_BINDS_KEYS = None
 
     def save(self, *arg, **kwargs):
         raise TypeError('Use AreaMeter or HouseMeter')
@@ -623,6 +626,12 @@ class BasicMeter(FilesDeletionMixin):
         'initial_values', 'communication',
         'check_history',
     ]  # TODO пополнить список подлежащих выгрузке полей
+    _FILTER_DATA_FIELDS = [
+        'area',
+        '_type',
+        'working_finish_date',
+        'is_deleted',
+    ]  # поля, по которым фильтруются жители (FilterDataVersion)
 
     @property
     def must_export_changes(self) -> bool:
@@ -712,9 +721,14 @@ class BasicMeter(FilesDeletionMixin):
         self.handle_resurrected()
 
         must_export_changes: bool = self.must_export_changes  # до save
+        filter_data_changed = isinstance(self, AreaMeter) \
+            and self._is_triggers(self._FILTER_DATA_FIELDS)  # до save
         result = getattr(super(), 'save')(*args, **kwargs)
 
         self.correct_empty_readings()
+        if filter_data_changed and self.area and self.area.house:
+            from app.caching.models.filters import FilterDataVersion
+            FilterDataVersion.bump(self.area.house.id)
 
         if must_export_changes:
             GisQueued.put(self, hours=2)
@@ -1276,6 +1290,7 @@ class AreaMeter(BasicMeter, Document, BindedModelMixin):
         HouseGroupBinds,
         verbose_name='Привязки к группе домов'
     )
+    _HOUSE_BINDS_KEYS = ('area.house._id', 'area._id')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1987,6 +2002,7 @@ class HouseMeter(BasicMeter, Document, BindedModelMixin):
         HouseGroupBinds,
         verbose_name='Привязки к группе домов'
     )
+    _HOUSE_BINDS_KEYS = ('house._id', None)
 
     def save(self, *args,  **kwargs):
 
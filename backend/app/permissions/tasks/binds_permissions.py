@@ -1,7 +1,9 @@
 from bson import ObjectId
 from mongoengine import Document, EmbeddedDocumentField
+from pymongo import UpdateOne
 
 from app.permissions.workers.config import joker_app
+from processing.models.billing.binds_resolver import HOUSE_GROUPS
 from processing.models.billing.provider.main import ProviderRelations
 from processing.models.permissions import Permissions
 
@@ -45,9 +47,163 @@ def process_house_binds_models(self, house_id, instantly=False):
     bind=True
 )
 def process_house_binds(self, model, house_id):
+    HOUSE_GROUPS.refresh()  # группы домов могли измениться только что
     model.process_house_binds(house_id)
 
 
+REBIND_PARTS = 8  # параллельных задач пересчета на модель
+REBIND_BATCH_SIZE = 1000  # документов в одном bulk_write
+
+
+@joker_app.task(
+    soft_time_limit=60,
+    rate_limit='100/s',
+    bind=True
+)
+def rebind_house_groups_models(self, parts=REBIND_PARTS):
+    """
+    Пересчет групп домов (_binds.hg) документов всех моделей:
+    коллекция каждой модели делится на parts диапазонов _id,
+    обрабатываемых параллельно. Модели, копирующие группы домов
+    документов другой коллекции (_HOUSE_BINDS_SOURCE), изменяются вместе
+    с документами этой коллекции
+    """
+    # импортируем все модели, чтобы определить сабклассы Document
+    import processing.models.billing
+
+    models = [
+        x
+        for x in Document.__subclasses__()
+        if getattr(x, '_HOUSE_BINDS_KEYS', None)
+    ]
+    for model in models:
+        dependents = [
+            x
+            for x in Document.__subclasses__()
+            if getattr(x, '_HOUSE_BINDS_SOURCE', None)
+            and x._HOUSE_BINDS_SOURCE[0] == model._get_collection_name()
+        ]
+        for id_from, id_till in _get_id_ranges(model, parts):
+            rebind_house_groups.delay(model, id_from, id_till, dependents)
+
+
+@joker_app.task(
+    soft_time_limit=30 * 60,
+    rate_limit='100/s',
+    bind=True
+)
+def rebind_house_groups(self, model, id_from, id_till=None, dependents=()):
+    """
+    Пересчет групп домов (_binds.hg) документов модели в диапазоне _id,
+    записываются только документы с изменившимися привязками
+
+    :param dependents: модели, копирующие группы домов документов модели
+    """
+    from processing.models.billing.area_bind import AreaBind
+
+    HOUSE_GROUPS.refresh()
+    house_key, area_key = model._HOUSE_BINDS_KEYS
+    query = {'_id': {'$gte': id_from}}
+    if id_till:
+        query['_id']['$lt'] = id_till
+    query = model.objects(__raw__=query)._query
+    projection = {'_binds.hg': True, house_key: True}
+    if area_key:
+        projection[area_key] = True
+    documents = model._get_collection().find(
+        query,
+        projection,
+        batch_size=REBIND_BATCH_SIZE,
+    )
+    updated = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == REBIND_BATCH_SIZE:
+            updated += _rebind_batch(model, batch, house_key, area_key,
+                                     AreaBind, dependents)
+            batch = []
+    if batch:
+        updated += _rebind_batch(model, batch, house_key, area_key, AreaBind,
+                                 dependents)
+    return f'{updated} updated'
+
+
+def _rebind_batch(model, documents, house_key, area_key, area_bind_model,
+                  dependents=()):
+    area_providers = {}
+    if area_key:
+        areas = {_get_key(document, area_key) for document in documents}
+        areas.discard(None)
+        for bind in area_bind_model.objects(
+                area__in=list(areas),
+                closed=None,
+        ).only('area', 'provider').as_pymongo():
+            area_providers.setdefault(bind['area'], []).append(
+                bind['provider'],
+            )
+    requests = []
+    changed = {}  # группы домов: документы
+    for document in documents:
+        house_id = _get_key(document, house_key)
+        if not house_id:
+            continue
+        # документ без помещения (домовая заявка) привязан ко всему дому
+        if area_key and _get_key(document, area_key):
+            providers = area_providers.get(_get_key(document, area_key))
+            groups = HOUSE_GROUPS.provider_house_groups(house_id, providers) \
+                if providers else []
+        else:
+            groups = HOUSE_GROUPS.house_groups(house_id)
+        current = (document.get('_binds') or {}).get('hg') or []
+        if set(groups) != set(current):
+            requests.append(
+                UpdateOne(
+                    {'_id': document['_id']},
+                    {'$set': {'_binds.hg': groups}},
+                ),
+            )
+            changed.setdefault(tuple(groups), []).append(document['_id'])
+    if not requests:
+        return 0
+    result = model._get_collection().bulk_write(requests, ordered=False)
+    for dependent in dependents:
+        field_name = dependent._HOUSE_BINDS_SOURCE[1]
+        for groups, ids in changed.items():
+            dependent._get_collection().update_many(
+                {field_name: {'$in': ids}},
+                {'$set': {'_binds.hg': list(groups)}},
+            )
+    return result.modified_count
+
+
+def _get_key(document, key):
+    value = document
+    for name in key.split('.'):
+        value = value.get(name) if isinstance(value, dict) else None
+    return value
+
+
+def _get_id_ranges(model, parts):
+    """Диапазоны _id документов модели равной протяженности по времени"""
+    collection = model._get_collection()
+    query = model.objects._query
+    first = collection.find_one(query, {'_id': True}, sort=[('_id', 1)])
+    if not first:
+        return []
+    last = collection.find_one(query, {'_id': True}, sort=[('_id', -1)])
+    started = first['_id'].generation_time
+    step = (last['_id'].generation_time - started) / parts
+    bounds = [first['_id']] + [
+        ObjectId.from_datetime(started + step * ix) for ix in range(1, parts)
+    ] + [None]
+    return [
+        (bounds[ix], bounds[ix + 1])
+        for ix in range(parts)
+        if bounds[ix + 1] is None or bounds[ix] < bounds[ix + 1]
+    ]
+
+
 @joker_app.task(
     bind=True,
     max_retries=7,
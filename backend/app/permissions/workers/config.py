@@ -10,6 +10,12 @@ PERMISSIONS_TASK_ROUTES = {
     'app.permissions.tasks.binds_permissions.process_house_binds': {
         'queue': _QUEUE,
     },
+    'app.permissions.tasks.binds_permissions.rebind_house_groups_models': {
+        'queue': _QUEUE,
+    },
+    'app.permissions.tasks.binds_permissions.rebind_house_groups': {
+        'queue': _QUEUE,
+    },
     'app.permissions.tasks.binds_permissions.process_provider_binds_models': {
         'queue': _QUEUE,
     },
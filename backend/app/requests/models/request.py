@@ -378,6 +378,7 @@ class Request(BindedModelMixin, Document):
         default=AreaEmbedded(),
         verbose_name='Квартира',
     )
+    _HOUSE_BINDS_KEYS = ('house._id', 'area._id')
     tenant = EmbeddedDocumentField(
         TenantEmbedded,
         default=TenantEmbedded(),
@@ -5463,6 +5463,47 @@ class TestWhatever(unittest.TestCase):
     def tearDown(self):
         self.dbf_table.close()
         self.vfp_table.close()
+class TestColumnar(unittest.TestCase):
+    "Testing columnar mode..."
+    specs = 'name C(25); paid L; qty N(11,5); orderdate D'
+    rows = [
+        ('Иванов', True, 1.5, datetime.date(2024, 1, 31)),
+        ('Петров', False, None, None),
+        (None, None, -20.125, datetime.date(1999, 12, 1)),
+        ]
+    def test_read_table(self):
+        "columns of a table written by Table"
+        from dbf.columnar import ColumnarTable
+        path = os.path.join(tempdir, 'tempcolumnar')
+        table = Table(path, self.specs, dbf_type='db3', codepage='cp866')
+        table.open()
+        for row in self.rows:
+            table.append(row)
+        delete(table[1])
+        table.close()
+        with ColumnarTable(path + '.dbf') as columnar:
+            self.assertEqual(len(columnar), 3)
+            self.assertEqual(columnar.field_names, ['name', 'paid', 'qty', 'orderdate'])
+            columns = columnar.columns()
+            self.assertEqual(columns['name'], ['Иванов', ''])
+            self.assertEqual(columns['paid'], [True, None])
+            self.assertEqual(list(columns['qty']), [1.5, -20.125])
+            self.assertEqual(columns['orderdate'], [datetime.date(2024, 1, 31), datetime.date(1999, 12, 1)])
+            self.assertEqual(len(columnar.column('name', with_deleted=True)), 3)
+            self.assertEqual(columnar.deleted(), [False, True, False])
+    def test_write_records(self):
+        "records written in batches are read by Table"
+        from dbf.columnar import write_records
+        path = os.path.join(tempdir, 'tempcolumnar.dbf')
+        self.assertEqual(write_records(path, self.specs, self.rows, batch_size=2), 3)
+        table = Table(path)
+        table.open()
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table[0].name.strip(), 'Иванов')
+        self.assertEqual(table[0].orderdate, Date(2024, 1, 31))
+        self.assertEqual(table[2].qty, -20.125)
+        self.assertTrue(table[1].orderdate is NullDate or not table[1].orderdate)
+        table.close()
 # main
 if __name__ == '__main__':
     tempdir = tempfile.mkdtemp()
@@ -0,0 +1,81 @@
+"""
+Сравнение записи и чтения реестра DBF: построчный API dbf.Table
+и колоночный режим dbf.columnar (ColumnarTable, write_records)
+
+    python -m local_tests.dbf_columnar_benchmark [кол-во строк]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+# вендорная библиотека lib/dbf импортируется как пакет dbf
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib',
+))
+
+import dbf  # noqa: E402
+from dbf.columnar import ColumnarTable, write_records  # noqa: E402
+
+SPECS = 'account C(13); fio C(60); address C(120); summa N(12,2); ' \
+    'pay_date D; is_paid L'
+
+
+def get_rows(count: int):
+    for n in range(count):
+        yield (
+            f'{n:013d}',
+            'Иванов Иван Иванович',
+            'г. Санкт-Петербург, ул. Садовая, д. 1, кв. 1',
+            n % 10000 * 1.17,
+            date(2024, 1 + n % 12, 1 + n % 28),
+            n % 2 == 0,
+        )
+
+
+def write_by_record(path: str, count: int):
+    table = dbf.Table(path, SPECS, codepage='cp866')
+    table.open(dbf.READ_WRITE)
+    for row in get_rows(count):
+        table.append(row)
+    table.close()
+
+
+def read_by_record(path: str) -> int:
+    table = dbf.Table(path)
+    table.open(dbf.READ_ONLY)
+    values = [
+        (record.account, record.fio, record.address, record.summa,
+            record.pay_date, record.is_paid)
+        for record in table
+    ]
+    table.close()
+    return len(values)
+
+
+def read_by_column(path: str) -> int:
+    with ColumnarTable(path) as table:
+        columns = table.columns()
+    return len(columns['account'])
+
+
+def _measure(name: str, func):
+    started = time.monotonic()
+    func()
+    print(f'{name}: {time.monotonic() - started:.2f} с')
+
+
+if __name__ == '__main__':
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    directory = tempfile.mkdtemp()
+    record_path = os.path.join(directory, 'by_record.dbf')
+    column_path = os.path.join(directory, 'by_column.dbf')
+
+    _measure('Table.append', lambda: write_by_record(record_path, rows_count))
+    _measure(
+        'write_records',
+        lambda: write_records(column_path, SPECS, get_rows(rows_count)),
+    )
+    _measure('Table (по записям)', lambda: read_by_record(column_path))
+    _measure('ColumnarTable', lambda: read_by_column(record_path))
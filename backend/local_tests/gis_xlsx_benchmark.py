@@ -0,0 +1,74 @@
+"""
+Сравнение способов заполнения шаблонов ГИС ЖКХ на выгрузке 100 тыс. ЛС:
+XlsxTemplateWriter, openpyxl и LibreOffice (pyoo, если доступен)
+
+    python -m local_tests.gis_xlsx_benchmark [кол-во строк]
+"""
+import resource
+import sys
+import time
+from datetime import date
+
+from bson import ObjectId
+
+from processing.data_producers.gis.accounts import (
+    AccountsCommonFields,
+    AccountsDataProducer,
+)
+
+
+class BenchmarkAccountsProducer(AccountsDataProducer):
+
+    rows_count = 100000
+
+    def get_entries(self, produce_method_name, export_task=None,
+                    static_data=False):
+        if produce_method_name != 'get_entry_common':
+            return []
+        return [
+            {
+                AccountsCommonFields.ENTRY_N: n,
+                AccountsCommonFields.ACCOUNT_NUMBER: f'{n:010d}',
+                AccountsCommonFields.HCS_UID: str(ObjectId()),
+                AccountsCommonFields.ACCOUNT_TYPE: 'ЛС УО',
+                AccountsCommonFields.IS_RENTER: 'Нет',
+                AccountsCommonFields.FAMILY_NAME: 'Иванов',
+                AccountsCommonFields.NAME: 'Иван',
+                AccountsCommonFields.PATRONYMIC_NAME: 'Иванович',
+                AccountsCommonFields.ACCOUNT_PRIVATE_DOC_DATE: date.today(),
+                AccountsCommonFields.AREA_SUMMARY: 54.3,
+                AccountsCommonFields.RESIDENTS_NUMBER: 3,
+            }
+            for n in range(1, self.rows_count + 1)
+        ]
+
+
+class FakeExportTask:
+    id = 'benchmark'
+
+
+def _measure(name, func):
+    started = time.monotonic()
+    try:
+        xlsx = func()
+    except Exception as error:
+        print(f'{name}: пропущен ({error!r})')
+        return
+    xlsx.seek(0, 2)
+    print(
+        f'{name}: {time.monotonic() - started:.1f} с, '
+        f'{xlsx.tell() / 2 ** 20:.1f} МБ, '
+        f'пик памяти процесса '
+        f'{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} МБ'
+    )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        BenchmarkAccountsProducer.rows_count = int(sys.argv[1])
+    producer = BenchmarkAccountsProducer({})
+    task = FakeExportTask()
+    # пик памяти накопительный, поэтому потоковая запись измеряется первой
+    _measure('XlsxTemplateWriter', lambda: producer.get_xlsx(task))
+    _measure('openpyxl', producer.get_xlsx_openpyxl)
+    _measure('pyoo', lambda: producer.get_xlsx_pyoo(task))
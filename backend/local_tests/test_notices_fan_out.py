@@ -0,0 +1,82 @@
+from time import monotonic
+from unittest import TestCase, mock
+
+from bson import ObjectId
+
+from app.messages.core.fan_out import fan_out_notices
+from app.messages.models.messenger import UserTasks
+from mongoengine_connections import (
+    register_testing_mongoengine_connections,
+    destroy_testing_mongoengine_connections,
+)
+
+
+class NoticesFanOutTestCase(TestCase):
+    """
+    Нагрузочный тест рассылки уведомления на 50 тыс. пользователей
+
+        python -m pytest local_tests/test_notices_fan_out.py
+    """
+
+    recipients_count = 50000
+    time_limit = 60
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        register_testing_mongoengine_connections()
+        cls.accounts = [ObjectId() for _ in range(cls.recipients_count)]
+        # половина пользователей уже с мессенджерами
+        UserTasks._get_collection().insert_many([
+            {'account': account_id, 'news': None}
+            for account_id in cls.accounts[::2]
+        ])
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        UserTasks.objects(account__in=cls.accounts).delete()
+        destroy_testing_mongoengine_connections()
+
+    @mock.patch.object(UserTasks, 'ws_notify')
+    def test_fan_out(self, ws_notify):
+        progress = []
+        started = monotonic()
+        total = fan_out_notices(
+            self.accounts,
+            'news',
+            progress=lambda done, all_: progress.append(done),
+        )
+        self.assertLess(monotonic() - started, self.time_limit)
+        self.assertEqual(total, self.recipients_count)
+        self.assertEqual(progress[-1], self.recipients_count)
+        self.assertEqual(ws_notify.call_count, len(progress))
+        self.assertEqual(
+            UserTasks.objects(
+                account__in=self.accounts,
+                news__text='new',
+            ).count(),
+            self.recipients_count,
+        )
+
+    @mock.patch.object(UserTasks, 'ws_notify')
+    def test_fan_out_idempotent(self, ws_notify):
+        notice_id = ObjectId()
+        for _ in range(2):
+            fan_out_notices(self.accounts, 'meters', obj_id=notice_id)
+        duplicates = list(
+            UserTasks.objects(
+                account__in=self.accounts,
+            ).aggregate(
+                {'$unwind': '$meters'},
+                {'$match': {'meters.id': notice_id}},
+                {'$group': {'_id': '$account', 'count': {'$sum': 1}}},
+                {'$match': {'count': {'$gt': 1}}},
+            )
+        )
+        self.assertEqual(duplicates, [])
+        self.assertEqual(
+            UserTasks.objects(
+                account__in=self.accounts,
+                meters__id=notice_id,
+            ).count(),
+            self.recipients_count,
+        )
@@ -37,6 +37,7 @@ def mask_personal_data(logger, task, provider_id):
     #     data=list(tenants.as_pymongo())
     # ).save()
     counter = 0
+    changed = []
     for tenant in tenants._iter_results():
         if 'PrivateTenant' in tenant._type:
             tenant.last_name = mask_str(tenant.last_name)
@@ -44,5 +45,9 @@ def mask_personal_data(logger, task, provider_id):
         elif 'LegalTenant' in tenant._type:
             tenant.name = mask_str(tenant.name)
             counter += 1
-        tenant.save()
+        changed.append(tenant)
+        if len(changed) == 1000:
+            Tenant.save_many(changed)
+            changed = []
+    Tenant.save_many(changed)
     logger(f'Замаскировала {counter} жителей')
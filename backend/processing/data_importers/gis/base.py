@@ -7,6 +7,9 @@ import settings
 from tools.pyoo_helpers import cell_address_to_coordinates, column_letter_to_number, ROW_PARSE_STEP, MAX_COLUMNS
 
 
+# сколько строк листа передаётся в метод импорта за раз
+IMPORT_BATCH_SIZE = 500
+
 GIS_ERROR_STATUSES = (
     'FMT',
     'INT',
@@ -51,51 +54,110 @@ class BaseGISDataImporter:
 
         return parsed_links
 
+    def _parse_links_openpyxl(self, workbook) -> dict:
+        """
+        Связи между листами для потокового чтения: значения связанного
+        листа читаются одним проходом и индексируются по значению
+        для сравнения
+
+        :returns: {link: {'if_column': индекс, 'values': {match: value}}}
+        """
+        parsed_links = {}
+        for target_schema in self.XLSX_WORKSHEETS.values():
+            if 'links' not in target_schema:
+                continue
+
+            for link_target, link_schema in target_schema['links'].items():
+                linked_schema = \
+                    self.XLSX_WORKSHEETS[link_schema['from_worksheet']]
+                linked_worksheet = \
+                    workbook.get_sheet_by_name(link_schema['from_worksheet'])
+                match_ix = _column_index(
+                    linked_schema['columns'][link_schema['if_match']['linked']]
+                )
+                value_ix = _column_index(
+                    linked_schema['columns'][link_target]
+                )
+                values = {}
+                for row in linked_worksheet.iter_rows(
+                        min_row=linked_schema['start_row'],
+                        values_only=True):
+                    match = _row_value(row, match_ix)
+                    value = _row_value(row, value_ix)
+                    if match is None and value is None:
+                        continue
+                    values.setdefault(match, value)  # первое совпадение
+
+                parsed_links[link_target] = {
+                    'if_column': _column_index(
+                        target_schema['columns'][
+                            link_schema['if_match']['target']
+                        ]
+                    ),
+                    'values': values,
+                }
+
+        return parsed_links
+
     def import_xlsx_openpyxl(self, import_task):
 
         from openpyxl import load_workbook, Workbook
         from openpyxl.worksheet.worksheet import Worksheet
-        from openpyxl.cell.read_only import EmptyCell
 
         file = get_file_from_gridfs(file_id=import_task.import_file, raw=True)
-        # print('LOADING WORKBOOK', import_task.import_file, 'PLEASE WAIT!')
         book: Workbook = load_workbook(file,
             read_only=True, keep_vba=True,  # VBA-скрипты не выполняются
             data_only=False, keep_links=True)  # сохраняем внешние ссылки
 
-        parsed_links: dict = self._parse_links(book)
+        parsed_links: dict = self._parse_links_openpyxl(book)
 
         for ws_title, ws_schema in self.XLSX_WORKSHEETS.items():
             worksheet: Worksheet = book.get_sheet_by_name(ws_title)
-
-            for row_num, row in enumerate(worksheet.rows, start=1):
-                if row_num < ws_schema['start_row']:  # max_row считает не верно
+            # буквы колонок переводятся в индексы один раз на лист
+            columns = {
+                title: _column_index(coord)
+                for title, coord in ws_schema['columns'].items()
+            }
+            batch = []
+            # max_row считает не верно, поэтому читаем до конца листа
+            for row in worksheet.iter_rows(min_row=ws_schema['start_row'],
+                                           values_only=True):
+                row_data = {
+                    title: _row_value(row, column_ix)
+                    for title, column_ix in columns.items()
+                }
+                if not any(row_data.values()):
                     continue
 
-                row_data = {}
                 links = {}
-
-                for title, coord in ws_schema['columns'].items():
-                    row_data[title] = None
-                    for cell in row:  # : ReadOnlyCell, EmptyCell
-                        if isinstance(cell, EmptyCell):
-                            continue
-                        elif cell.coordinate == coord + str(row_num):  # A5
-                            row_data[title] = cell.value
-                            break  # TODO поиск ячейки без итерации по строке
-
-                for link, conditions in parsed_links.items():
-                    for condition in conditions:
-                        if worksheet[
-                            condition['if_column'] + str(row_num)
-                        ].value == condition['match']:
-                            links[link] = condition['value']
-                            break
-
-                if any(row_data.values()):
-                    entry_import_method = \
-                        getattr(self, ws_schema['entry_import_method'])
-                    entry_import_method(row_data, import_task, links, ws_schema)
+                for link, link_index in parsed_links.items():
+                    match = _row_value(row, link_index['if_column'])
+                    if match in link_index['values']:
+                        links[link] = link_index['values'][match]
+
+                batch.append((row_data, links))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    self._import_entries_batch(batch, import_task, ws_schema)
+                    batch = []
+
+            if batch:
+                self._import_entries_batch(batch, import_task, ws_schema)
+
+    def _import_entries_batch(self, batch: list, import_task, ws_schema):
+        """
+        Передача пачки строк листа в метод импорта. Если в схеме листа
+        задан batch_import_method, он получает пачку целиком
+        [(row_data, links), ...], иначе строки передаются
+        в entry_import_method по одной
+        """
+        if ws_schema.get('batch_import_method'):
+            getattr(self, ws_schema['batch_import_method'])(
+                batch, import_task, ws_schema,
+            )
+            return
+        entry_import_method = getattr(self, ws_schema['entry_import_method'])
+        for row_data, links in batch:
+            entry_import_method(row_data, import_task, links, ws_schema)
 
     def import_xlsx_pyoo(self, import_task):
 
@@ -156,6 +218,17 @@ class BaseGISDataImporter:
         temp_file.close()
 
 
+def _column_index(column_letters: str) -> int:
+    """Индекс колонки в строке листа по её буквам (A -> 0)"""
+    from openpyxl.utils import column_index_from_string
+
+    return column_index_from_string(column_letters) - 1
+
+
+def _row_value(row: tuple, column_ix: int):
+    return row[column_ix] if column_ix < len(row) else None
+
+
 def is_status_error(status_string: str):
     return True if not status_string or any([status_string.startswith(err) for err in GIS_ERROR_STATUSES]) else False
 
@@ -2,6 +2,7 @@ import datetime
 
 from app.area.models.area import Area
 from app.meters.models.meter import AreaMeter, ReadingsValidationError
+from processing.models.billing.meter_event import MeterReadingEvent
 from processing.models.billing.payment import WrongLineReadings
 from processing.models.choices import ReadingsCreator
 
@@ -40,11 +41,75 @@ def save_readings_from_registry(area_id, registry_readings, current_period,
         начислений (параметр в какой месяц идут показания счетчиков - в следующий,
         текущий или предыдущий), прибавить 1 месяц. @ssv
     """
-    # получим все счетчики по этой квартире, отфильтруем только по
-    #  данному или меньшему периоду и оставим только последнее
-    # показание, если показаний нет - отфильтровываем
+    save_registry_readings_batch(
+        [(area_id, registry_readings, raw_string)],
+        current_period,
+        registry_number,
+        registry_date,
+    )
+
+
+def save_registry_readings_batch(registry_rows, current_period,
+                                 registry_number, registry_date):
+    """
+    Сохраняет показания счетчиков из всех строк реестра разом: счетчики
+    всех квартир получаются одним запросом с последним показанием до
+    периода, показания и ошибочные строки пишутся пачками
+
+    :param registry_rows: [(area_id, registry_readings, raw_string), ...]
+    """
+    for rows in _split_registry_rows(registry_rows):
+        meters = _get_areas_meters(
+            [area_id for area_id, _, _ in rows],
+            current_period,
+        )
+        units = []
+        for area_id, registry_readings, raw_string in rows:
+            area_meters = meters.get(area_id, [])
+            for m_types in METER_TYPES_ORDER:
+                units.append(_match_readings_for(
+                    area_id,
+                    {
+                        k: v for k, v in registry_readings.items()
+                        if k in m_types
+                    },
+                    [m for m in area_meters if m['_type'] in m_types],
+                    raw_string,
+                ))
+        _save_matched_readings(
+            units,
+            current_period,
+            registry_number,
+            registry_date,
+        )
+
+
+def _split_registry_rows(registry_rows):
+    """
+    Разбивает строки реестра на очереди, в каждой из которых квартира
+    встречается один раз: повторные показания по квартире сохраняются
+    после предыдущих
+    """
+    rounds = []
+    for row in registry_rows:
+        for rows in rounds:
+            if row[0] not in rows:
+                rows[row[0]] = row
+                break
+        else:
+            rounds.append({row[0]: row})
+    return [list(rows.values()) for rows in rounds]
+
+
+def _get_areas_meters(areas_ids, current_period):
+    """
+    Счетчики квартир, действующие в периоде, с последним показанием
+    до периода (или начальными значениями, если показаний нет)
+
+    :returns: {area_id: [счетчик, ...]}
+    """
     query = {
-        'area._id': area_id,
+        'area._id': {'$in': list(set(areas_ids))},
         'working_start_date': {'$lte': current_period},
         '$or': [
             {'working_finish_date': {'$gt': current_period}},
@@ -53,39 +118,49 @@ def save_readings_from_registry(area_id, registry_readings, current_period,
         'is_automatic': {'$ne': True},
         'is_deleted': {'$ne': True}
     }
-    meters = AreaMeter.objects(__raw__=query).as_pymongo().all()
-    # оставим только последнее показание
+    meters = AreaMeter.objects(__raw__=query).aggregate(
+        {
+            '$project': {
+                '_type': 1,
+                'area._id': 1,
+                'serial_number': 1,
+                'initial_values': 1,
+                'readings': {
+                    '$arrayElemAt': [
+                        {
+                            '$filter': {
+                                'input': {'$ifNull': ['$readings', []]},
+                                'as': 'r',
+                                'cond': {
+                                    '$lt': ['$$r.period', current_period],
+                                },
+                            },
+                        },
+                        -1,
+                    ],
+                },
+            },
+        },
+    )
+    result = {}
     for meter in meters:
         meter['_type'] = meter['_type'][0]
-        meter['readings'] = list(
-            filter(lambda x: x['period'] < current_period, meter['readings'])
-        )
-        if meter['readings']:
-            meter['readings'] = meter['readings'][-1]
-        else:
+        if not meter.get('readings'):
             meter['readings'] = {'values': meter['initial_values']}
-
-    for m_types in METER_TYPES_ORDER:
-        _save_readings_for(
-            area_id,
-            {k: v for k, v in registry_readings.items() if k in m_types},
-            [m for m in meters if m['_type'] in m_types],
-            current_period,
-            registry_number,
-            registry_date,
-            raw_string,
-        )
+        result.setdefault(meter['area']['_id'], []).append(meter)
+    return result
 
 
-def _save_readings_for(area_id, registry_readings, meters, period,
-                       registry_number, registry_date, raw_string,
-                       all_names_required=True):
+def _match_readings_for(area_id, registry_readings, meters, raw_string,
+                        all_names_required=True):
     """
-    Сохраняет показания счетчиков из реестров для указаных типов
+    Сопоставляет показания из реестра счетчикам квартиры указанных типов
 
-    :param names: перечень типов, напр. (COLD_WAM_NAME, HOT_WAM_NAME)
-    :param all_names_required: если True, должны быть показания для всех типов,
-        переданных в names
+    :param all_names_required: если True, должны быть показания для всех
+        счетчиков
+    :returns: {'area_id', 'raw_string', 'readings': [(meter_id, values)],
+        'missed': количество счетчиков без показаний или None, если
+        показания сохранять не нужно}
     """
     new_readings = []
     for meter_type, readings in registry_readings.items():
@@ -95,30 +170,55 @@ def _save_readings_for(area_id, registry_readings, meters, period,
         paired = _merge_meters_to_readings(readings, type_meters)
         if paired:
             new_readings.extend(paired)
+    if len(new_readings) == len(meters) or not all_names_required:
+        missed = None
+    else:
+        missed = abs(len(new_readings) - len(meters))
+    return {
+        'area_id': area_id,
+        'raw_string': raw_string,
+        'readings': new_readings if missed is None else [],
+        'missed': missed,
+        'readings_count': len(new_readings),
+    }
+
+
+def _save_matched_readings(units, period, registry_number, registry_date):
+    """
+    Добавляет сопоставленные показания счетчикам и сохраняет пачками
+    показания, события их изменения и ошибочные строки реестра
+    """
+    meters_ids = {
+        meter_id
+        for unit in units
+        for meter_id, _ in unit['readings']
+    }
+    meters = {
+        meter.pk: meter
+        for meter in AreaMeter.objects(pk__in=list(meters_ids))
+    } if meters_ids else {}
     comment = 'Реестр №{}'.format(registry_number)
-    # Если найдены соответствующие счетчики для всех показаний или
-    # если не обязательно наличие всех типов
     meters_to_save = []
-    errors = []
-    area_data = None
-    meters_with_no_readings = 0
-    meters_ins = []
-    if len(new_readings) == len(meters) or not all_names_required:
-        for readings in new_readings:
-            meter = AreaMeter.objects(pk=readings[0]).get()
+    bad_units = []
+    for unit in units:
+        errors = []
+        meters_ins = []
+        unit_meters = []
+        meters_with_no_readings = unit['missed'] or 0
+        for meter_id, values in unit['readings']:
+            meter = meters[meter_id]
             meters_ins.append(meter)
-            area_data = meter.area
             try:
                 meter.add_readings(
                     period,
-                    readings[1],
+                    values,
                     ReadingsCreator.REGISTRY,
                     None,
                     comment=comment,
                 )
-                meters_to_save.append(meter)
+                unit_meters.append(meter)
             except ReadingsValidationError as e:
-                if any(readings[1]):
+                if any(values):
                     errors.append(
                         'Счётчик {} ({}). {}'.format(
                             METER_TYPE_DESCRIPTION[meter._type[0]],
@@ -128,27 +228,73 @@ def _save_readings_for(area_id, registry_readings, meters, period,
                     )
                 else:
                     meters_with_no_readings += 1
-    else:
-        meters_with_no_readings = abs(len(new_readings) - len(meters))
-    if meters_with_no_readings and meters_with_no_readings != len(new_readings):
-        errors.append(
-            'Количество показаний не соответствует количеству счётчиков',
-        )
-    if errors:
-        if not area_data:
-            area_data = Area.objects(pk=area_id).get()
-        _save_bad_reading(
-            area_data,
-            meters_ins,
-            raw_string,
-            period,
-            errors,
-            registry_number,
-            registry_date,
-        )
-    else:
-        for meter in meters_to_save:
-            meter.save(ignore_meter_validation=True)
+        if (
+                meters_with_no_readings
+                and meters_with_no_readings != unit['readings_count']
+        ):
+            errors.append(
+                'Количество показаний не соответствует количеству счётчиков',
+            )
+        if errors:
+            bad_units.append((unit, meters_ins, errors))
+        else:
+            meters_to_save.extend(unit_meters)
+    _bulk_save_meters_readings(meters_to_save)
+    _bulk_save_bad_readings(bad_units, period, registry_number, registry_date)
+
+
+def _bulk_save_meters_readings(meters):
+    """
+    Сохраняет счетчики с новыми показаниями (со всеми проверками и
+    денормализацией save), а события изменения показаний - одной вставкой
+    после всех счетчиков
+    """
+    if not meters:
+        return
+    events = []
+    for meter in meters:
+        # события сохраняются после счетчиков одной вставкой
+        meter_events = meter.readings_change_log
+        meter.readings_change_log = []
+        meter.save(ignore_meter_validation=True)
+        events.extend(meter_events)
+    if events:
+        # insert минует MeterReadingEvent.save, где проставляется created_at
+        created_at = datetime.datetime.now()
+        for event in events:
+            if not event.created_at:
+                event.created_at = created_at
+        MeterReadingEvent.objects.insert(events, load_bulk=False)
+
+
+def _bulk_save_bad_readings(bad_units, period, registry_number,
+                            registry_date):
+    if not bad_units:
+        return
+    areas_ids = {
+        unit['area_id']
+        for unit, meters, _ in bad_units
+        if not meters
+    }
+    areas = {
+        area.pk: area
+        for area in Area.objects(pk__in=list(areas_ids))
+    } if areas_ids else {}
+    WrongLineReadings.objects.insert(
+        [
+            _get_bad_reading(
+                meters[-1].area if meters else areas[unit['area_id']],
+                meters,
+                unit['raw_string'],
+                period,
+                errors,
+                registry_number,
+                registry_date,
+            )
+            for unit, meters, errors in bad_units
+        ],
+        load_bulk=False,
+    )
 
 
 def _merge_meters_to_readings(readings, meter_list):
@@ -186,10 +332,10 @@ def _merge_meters_to_readings(readings, meter_list):
     return result
 
 
-def _save_bad_reading(area, meters, raw_string, period, errors,
-                      registry_number, registry_date):
+def _get_bad_reading(area, meters, raw_string, period, errors,
+                     registry_number, registry_date):
     """
-    Добавим плохие строки показаний
+    Плохая строка показаний (не сохраняется)
     """
     last_reading_meters = []
     try:
@@ -207,7 +353,7 @@ def _save_bad_reading(area, meters, raw_string, period, errors,
                 ))
     except Exception:
         pass
-    WrongLineReadings(
+    return WrongLineReadings(
         area={
             '_id': area.id if hasattr(area, 'id') else area.pk,
             '_type': area._type,
@@ -226,5 +372,5 @@ def _save_bad_reading(area, meters, raw_string, period, errors,
         month=period,
         meters=last_reading_meters,
         errors=errors
-    ).save()
+    )
 
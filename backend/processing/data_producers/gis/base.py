@@ -16,6 +16,7 @@ try:  # импортируем если установлено (не импор
 except ImportError:
     uno_exceptions = ()
 
+from processing.data_producers.gis.xlsx_writer import XlsxTemplateWriter
 from tools.fakefiles import InMemoryFile
 from tools.pyoo_helpers import column_letter_to_number, MAX_COLUMNS, retry
 
@@ -34,8 +35,15 @@ class BaseGISDataProducer:
 
     def get_entries(self, produce_method_name, export_task, static_data=False):
 
-        entries = []
+        return list(self.iter_entries(
+            produce_method_name,
+            export_task,
+            static_data,
+        ))
 
+    def iter_entries(self, produce_method_name, export_task,
+                     static_data=False):
+        """Строки листа по мере формирования (без накопления в памяти)"""
         sources: list = [None] if static_data else self.entry_sources.values()
         for entry_source in sources:
             produce_method = getattr(self, produce_method_name)  # foo
@@ -44,12 +52,9 @@ class BaseGISDataProducer:
                 continue  # get_capital_repair_data -> None
             elif isinstance(entry, list) and \
                     all(isinstance(sub_entry, dict) for sub_entry in entry):
-                for sub_entry in entry:
-                    entries.append(sub_entry)
+                yield from entry
             elif isinstance(entry, dict):
-                entries.append(entry)
-
-        return entries
+                yield entry
 
     def get_xlsx_openpyxl(self):
 
@@ -73,6 +78,36 @@ class BaseGISDataProducer:
 
         return memfile
 
+    def get_xlsx(self, export_task):
+        """
+        Заполнение шаблона без LibreOffice: строки потоком пишутся
+        в XML листов шаблона (XlsxTemplateWriter)
+        """
+        logger.info(
+            'Task %s entered "%s.get_xlsx"',
+            export_task.id,
+            self.__class__.__name__,
+        )
+        sheets_data = {
+            ws_title: (
+                ws_schema['start_row'],
+                ws_schema['columns'],
+                self.iter_entries(
+                    ws_schema['entry_produce_method'],
+                    export_task,
+                    ws_schema.get('static_page', False)
+                ),
+            )
+            for ws_title, ws_schema in self.XLSX_WORKSHEETS.items()
+        }
+        xlsx = XlsxTemplateWriter(self.XLSX_TEMPLATE).write(sheets_data)
+        logger.info(
+            'Task %s left "%s.get_xlsx"',
+            export_task.id,
+            self.__class__.__name__,
+        )
+        return xlsx
+
     @retry(
         exceptions=uno_exceptions,
         tries=4
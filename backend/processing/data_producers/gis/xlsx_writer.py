@@ -0,0 +1,242 @@
+import itertools
+import math
+import posixpath
+import re
+import tempfile
+from datetime import date, datetime
+from html import unescape
+from xml.sax.saxutils import escape
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from tools.pyoo_helpers import column_letter_to_number
+
+# сколько строк копится перед записью в архив
+ROWS_WRITE_STEP = 1000
+# начало отсчета сериальных дат Excel (с учетом 29.02.1900)
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+_SHEET_RE = re.compile(r'<sheet\b[^>]*?/>')
+_RELATIONSHIP_RE = re.compile(r'<Relationship\b[^>]*?/>')
+_ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+_SHEET_DATA_RE = re.compile(
+    r'<sheetData\s*/>|<sheetData\b[^>]*>(.*?)</sheetData>',
+    re.S,
+)
+_ROW_RE = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_ROW_NUMBER_RE = re.compile(r'<row\b[^>]*?\br="(\d+)"')
+_CELL_RE = re.compile(r'<c\b([^>]*?)/?>')
+_COL_RE = re.compile(r'<col\b([^>]*?)/>')
+_DIMENSION_RE = re.compile(r'<dimension\b[^>]*?/>')
+_ILLEGAL_XML_CHARS_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_CALC_CHAIN_CONTENT_TYPE_RE = re.compile(
+    r'<Override\b[^>]*?PartName="/xl/calcChain.xml"[^>]*?/>',
+)
+_CALC_CHAIN_RELATIONSHIP_RE = re.compile(
+    r'<Relationship\b[^>]*?Target="[^"]*calcChain.xml"[^>]*?/>',
+)
+
+
+class XlsxTemplateWriter:
+    """
+    Заполнение листов xlsx-шаблона без LibreOffice и без загрузки книги.
+
+    Архив шаблона копируется как есть, а в XML заполняемых листов строки
+    данных дописываются потоком: строки шаблона до start_row (заголовки)
+    и после заполненных строк сохраняются, стили ячеек берутся из первой
+    строки шаблона в области данных или из стиля колонки. Текст пишется
+    inline-строками, поэтому sharedStrings.xml не меняется, числа и даты
+    (сериальные) - числами
+    """
+
+    def __init__(self, template_path: str):
+        self.template_path = template_path
+
+    def write(self, sheets_data: dict, output=None):
+        """
+        :param sheets_data: {название листа: (start_row, columns, rows)},
+            где columns - {ключ: буквы колонки}, rows - итерируемые
+            (в том числе генератор) {ключ: значение}, читаются один раз
+        :param output: файл для записи, по умолчанию временный файл
+        :returns: файл с книгой, указатель в начале
+        """
+        if output is None:
+            output = tempfile.TemporaryFile()
+        with ZipFile(self.template_path) as template:
+            sheet_paths = self._get_sheet_paths(template)
+            filled = {
+                sheet_paths[title]: data
+                for title, data in sheets_data.items()
+                if title in sheet_paths
+            }
+            with ZipFile(output, 'w', ZIP_DEFLATED) as result:
+                for item in template.infolist():
+                    if item.filename == 'xl/calcChain.xml':
+                        # цепочка вычислений пересоздаётся Excel
+                        continue
+                    if item.filename in filled:
+                        self._write_sheet(
+                            template.read(item).decode('utf-8'),
+                            result,
+                            item.filename,
+                            *filled[item.filename],
+                        )
+                        continue
+                    content = template.read(item)
+                    if item.filename == '[Content_Types].xml':
+                        content = _CALC_CHAIN_CONTENT_TYPE_RE.sub(
+                            '', content.decode('utf-8'),
+                        ).encode('utf-8')
+                    elif item.filename == 'xl/_rels/workbook.xml.rels':
+                        content = _CALC_CHAIN_RELATIONSHIP_RE.sub(
+                            '', content.decode('utf-8'),
+                        ).encode('utf-8')
+                    result.writestr(item, content)
+        output.seek(0)
+        return output
+
+    @staticmethod
+    def _get_sheet_paths(template) -> dict:
+        """Пути XML листов в архиве по названиям листов"""
+        relationships = {}
+        rels_xml = template.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+        for relationship in _RELATIONSHIP_RE.findall(rels_xml):
+            attrs = dict(_ATTR_RE.findall(relationship))
+            target = attrs.get('Target', '')
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join('xl', target))
+            relationships[attrs.get('Id')] = target
+        sheets = {}
+        workbook_xml = template.read('xl/workbook.xml').decode('utf-8')
+        for sheet in _SHEET_RE.findall(workbook_xml):
+            attrs = dict(_ATTR_RE.findall(sheet))
+            if attrs.get('r:id') in relationships:
+                sheets[unescape(attrs['name'])] = \
+                    relationships[attrs['r:id']]
+        return sheets
+
+    def _write_sheet(self, sheet_xml, result, filename,
+                     start_row, columns, rows):
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:  # нет данных - лист шаблона без изменений
+            result.writestr(filename, sheet_xml.encode('utf-8'))
+            return
+        sheet_data = _SHEET_DATA_RE.search(sheet_xml)
+        head = _DIMENSION_RE.sub('', sheet_xml[:sheet_data.start()])
+        tail = sheet_xml[sheet_data.end():]
+        template_rows = _ROW_RE.findall(sheet_data.group(1) or '')
+
+        # строки шаблона после данных отбираются, когда известно их число
+        before, after, data_styles = [], [], {}
+        for row_xml in template_rows:
+            row_number = int(_ROW_NUMBER_RE.match(row_xml).group(1))
+            if row_number < start_row:
+                before.append(row_xml)
+                continue
+            if row_number == start_row:
+                data_styles = self._get_cells_styles(row_xml)
+            after.append((row_number, row_xml))
+        cells = self._compile_columns(
+            columns,
+            self._get_columns_styles(head),
+            data_styles,
+        )
+
+        with result.open(filename, 'w', force_zip64=True) as sheet_file:
+            sheet_file.write(head.encode('utf-8'))
+            sheet_file.write(b'<sheetData>')
+            sheet_file.write(''.join(before).encode('utf-8'))
+            chunk = []
+            end_row = start_row  # первая строка после данных
+            for row_number, row in enumerate(
+                    itertools.chain((first_row,), rows), start_row):
+                chunk.append(self._get_row_xml(row_number, row, cells))
+                end_row = row_number + 1
+                if len(chunk) >= ROWS_WRITE_STEP:
+                    sheet_file.write(''.join(chunk).encode('utf-8'))
+                    chunk = []
+            sheet_file.write(''.join(chunk).encode('utf-8'))
+            sheet_file.write(''.join(
+                row_xml
+                for row_number, row_xml in after
+                if row_number >= end_row
+            ).encode('utf-8'))
+            sheet_file.write(b'</sheetData>')
+            sheet_file.write(tail.encode('utf-8'))
+
+    @staticmethod
+    def _get_columns_styles(head_xml) -> dict:
+        """Стили колонок листа {индекс колонки: стиль}"""
+        styles = {}
+        for col in _COL_RE.findall(head_xml):
+            attrs = dict(_ATTR_RE.findall(col))
+            if 'style' not in attrs:
+                continue
+            for ix in range(int(attrs['min']) - 1, int(attrs['max'])):
+                styles[ix] = attrs['style']
+        return styles
+
+    @staticmethod
+    def _get_cells_styles(row_xml) -> dict:
+        """Стили ячеек строки шаблона {буквы колонки: стиль}"""
+        styles = {}
+        for cell in _CELL_RE.findall(row_xml):
+            attrs = dict(_ATTR_RE.findall(cell))
+            if 's' in attrs:
+                styles[attrs['r'].rstrip('0123456789')] = attrs['s']
+        return styles
+
+    @staticmethod
+    def _compile_columns(columns, columns_styles, cells_styles) -> list:
+        """[(ключ, буквы колонки, атрибут стиля), ...] в порядке колонок"""
+        compiled = []
+        for key, letters in columns.items():
+            ix = column_letter_to_number(letters)
+            style = cells_styles.get(letters, columns_styles.get(ix))
+            compiled.append((
+                ix,
+                key,
+                letters,
+                f' s="{style}"' if style is not None else '',
+            ))
+        compiled.sort(key=lambda column: column[0])
+        return [column[1:] for column in compiled]
+
+    @staticmethod
+    def _get_row_xml(row_number, row, cells) -> str:
+        result = [f'<row r="{row_number}">']
+        for key, letters, style in cells:
+            cell = _get_cell_xml(f'{letters}{row_number}', style, row.get(key))
+            if cell:
+                result.append(cell)
+        result.append('</row>')
+        return ''.join(result)
+
+
+def _get_cell_xml(ref, style, value) -> str:
+    if value is None or value == '':
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{style} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        return f'<c r="{ref}"{style}><v>{value!r}</v></c>'
+    if isinstance(value, (datetime, date)):
+        # дата - числом (сериальная дата Excel) в ячейке со стилем даты
+        return f'<c r="{ref}"{style}><v>{_get_serial_date(value)!r}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS_RE.sub('', str(value)))
+    return (
+        f'<c r="{ref}"{style} t="inlineStr">'
+        f'<is><t xml:space="preserve">{text}</t></is></c>'
+    )
+
+
+def _get_serial_date(value):
+    """Дата (и время) - количество дней от EXCEL_EPOCH"""
+    if not isinstance(value, datetime):
+        return (value - EXCEL_EPOCH.date()).days
+    delta = value.replace(tzinfo=None) - EXCEL_EPOCH
+    if not delta.seconds and not delta.microseconds:
+        return delta.days
+    return delta.days + (delta.seconds + delta.microseconds / 1e6) / 86400
@@ -6,6 +6,7 @@ from uuid import uuid4
 
 import mongoengine
 from dateutil.relativedelta import relativedelta
+from pymongo import UpdateOne
 
 from app.auth.models.embeddeds import AccountEmbedded
 
@@ -1378,6 +1379,7 @@ class Tenant(
         HouseGroupBinds,
         verbose_name='Привязки к организации и группе домов (P,HG и D)'
     )
+    _HOUSE_BINDS_KEYS = ('area.house._id', 'area._id')
     grace_period = EmbeddedDocumentListField(
         ResponsibleTenantGracePeriod,
         verbose_name='Льготный период у ответственного жильца для пеней.',
@@ -1809,7 +1811,68 @@ class Tenant(
         'email',
     ]
 
+    _HEAVY_SAVE_FIELDS = [
+        'area._id',
+        'statuses',
+        'is_developer',
+        'family.householder',
+        'email',
+        *AUTH_FIELDS,
+    ]  # изменения, требующие проверок и денормализаций по одному жителю
+    _FILTER_DATA_FIELDS = [
+        '_type',
+        'area',
+        '_binds',
+        'statuses',
+        'is_developer',
+        'is_deleted',
+        'is_privileged',
+        'coefs',
+        'number',
+        'str_name',
+        'short_name',
+    ]  # поля, по которым фильтруются жители (FilterDataVersion)
+    _SAVE_MANY_BATCH_SIZE = 1000  # запросов в одном bulk_write
+
     def save(self, *args, **kwargs):
+        pending = self._prepare_save(*args, **kwargs)
+        result = super().save(*args, **kwargs)
+        if pending['denormalize_fields']:
+            from app.caching.tasks.denormalization import \
+                schedule_foreign_denormalize
+            for field in pending['denormalize_fields']:
+                schedule_foreign_denormalize(
+                    model_from=Tenant,
+                    field_name=field,
+                    object_id=self.pk,
+                )
+        if 'LegalTenant' in self._type:
+            self.denormalize_legal_entity()
+        if pending['actor_denormalize']:
+            self.denormalize_actor_owner()
+        self.mirroring_to_actors(pending['changed'])  # changed до save
+        if pending['settings_access']:
+            self.mirror_limited_access()
+        if pending['filter_data_changed'] and self.area:
+            from app.caching.models.filters import FilterDataVersion
+            FilterDataVersion.bump(self.area.house.id)
+
+        if not kwargs.get('ignore_scheduling') \
+                and pending['must_export_changes']:
+            from app.gis.models.gis_queued import GisQueued
+            if not self.statuses.is_accounting:  # ЛС закрыт?
+                GisQueued.put(self, weeks=4)  # откладываем выгрузку изменений
+            else:
+                GisQueued.put(self)
+
+        return result
+
+    def _prepare_save(self, *args, **kwargs) -> dict:
+        """
+        Проверки и денормализации жителя перед записью
+
+        :returns: данные для действий после записи
+        """
         self.validate_no_access_user()
         self.validate_fields()
         self.validate()
@@ -1839,35 +1902,202 @@ class Tenant(
             changed = {}
         else:
             changed = {k: getattr(self, k) for k in self._changed_fields}
+        return dict(
+            denormalize_fields=denormalize_fields,
+            actor_denormalize=actor_denormalize,
+            changed=changed,
+            settings_access=self._is_triggers(['settings']),
+            filter_data_changed=self._is_triggers(self._FILTER_DATA_FIELDS),
+            must_export_changes=self.must_export_changes,  # до save!
+        )
 
-        settings_access = self._is_triggers(['settings'])
-        must_export_changes = self.must_export_changes  # до save!
-        result = super().save(*args, **kwargs)
-        if denormalize_fields:
-            from app.caching.tasks.denormalization import \
-                foreign_denormalize_data
-            for field in denormalize_fields:
-                foreign_denormalize_data.delay(
+    def _needs_single_save(self) -> bool:
+        """Требует ли сохранение жителя проверок с запросами к базе"""
+        return bool(
+            self._created
+            or not self.number
+            or not self._binds
+            or self._is_triggers(self._HEAVY_SAVE_FIELDS)
+            or (
+                self.is_family_householder
+                and self.family.householder != self.id
+            )
+        )
+
+    @classmethod
+    def save_many(cls, tenants, **kwargs) -> int:
+        """
+        Сохранение измененных жителей одной пакетной записью
+
+        Для массовых изменений (скриптов, импорта). Жители проверяются и
+        денормализуются в памяти, записываются через bulk_write, после чего
+        однократно для всего набора выполняются: изменение обратных ролей
+        сожителей (одним запросом на помещение), обновление владельцев
+        в Actor, постановка в очередь выгрузки в ГИС ЖКХ. Новые жители и
+        изменения, требующие проверок по базе (перенос в другое помещение,
+        статусы, глава семьи, доступ в ЛКЖ), сохраняются по одному (save).
+
+        :param kwargs: параметры save (ignore_family, ignore_scheduling,...)
+        :returns: количество сохраненных жителей
+        """
+        tenants = list(tenants)
+        single, bulk = [], []
+        for tenant in tenants:
+            if tenant._needs_single_save():
+                single.append(tenant)
+            else:
+                bulk.append(tenant)
+        if not kwargs.get('ignore_family'):
+            bulk += cls._denormalize_mates_family_roles(bulk, tenants)
+
+        for tenant in single:
+            tenant.save(**kwargs)
+
+        pending = []
+        requests = []
+        for tenant in bulk:
+            prepared = tenant._prepare_save(**dict(kwargs, ignore_family=True))
+            sets, unsets = tenant._delta()
+            if not sets and not unsets:
+                continue
+            update = {}
+            if sets:
+                update['$set'] = sets
+            if unsets:
+                update['$unset'] = unsets
+            requests.append(UpdateOne({'_id': tenant.pk}, update))
+            pending.append((tenant, prepared))
+        for ix in range(0, len(requests), cls._SAVE_MANY_BATCH_SIZE):
+            cls._get_collection().bulk_write(
+                requests[ix:ix + cls._SAVE_MANY_BATCH_SIZE],
+                ordered=False,
+            )
+        for tenant, _ in pending:
+            tenant._clear_changed_fields()
+
+        cls._after_save_many(pending, **kwargs)
+        return len(single) + len(pending)
+
+    @classmethod
+    def _denormalize_mates_family_roles(cls, tenants, batch) -> list:
+        """
+        Изменение обратных ролей сожителей жителей одним запросом
+        на помещение (аналог denormalize_family_roles)
+
+        :param batch: все сохраняемые жители (сожители берутся из них)
+        :returns: измененные сожители, отсутствующие в batch
+        """
+        in_batch = {tenant.pk: tenant for tenant in batch}
+        by_area = {}
+        for tenant in tenants:
+            if not (
+                    tenant._is_triggers(['family.relations'])
+                    and tenant.family and tenant.family.relations
+            ):
+                continue
+            changed_indexes = tenant._get_changed_family_indexes()
+            by_area.setdefault(tenant.area.id, []).extend(
+                (tenant, relation.related_to,
+                    tenant._get_id_from_referenced_field(relation.role))
+                for num, relation in enumerate(tenant.family.relations)
+                if changed_indexes is None or num in changed_indexes
+            )
+
+        loaded = []
+        mates = dict(in_batch)
+        mate_roles = {}  # (роль, пол жителя): обратная роль
+        for changes in by_area.values():
+            mate_ids = {
+                related_to for _, related_to, _ in changes
+                if related_to not in mates
+            }
+            if mate_ids:
+                for mate in cls.objects(id__in=list(mate_ids)):
+                    mates[mate.pk] = mate
+                    loaded.append(mate)
+            for tenant, related_to, role in changes:
+                key = (role, tenant.sex)
+                if key not in mate_roles:
+                    mate_roles[key] = tenant._get_new_mate_role(role)
+                tenant._apply_mate_family_role(
+                    mates[related_to], mate_roles[key],
+                )
+        return loaded
+
+    @classmethod
+    def _after_save_many(cls, pending, **kwargs):
+        """Действия после пакетной записи жителей (аналог save)"""
+        from app.caching.tasks.denormalization import \
+            schedule_foreign_denormalize
+        from app.caching.models.filters import FilterDataVersion
+        from app.gis.models.gis_queued import GisQueued
+
+        for tenant, prepared in pending:
+            for field in prepared['denormalize_fields']:
+                schedule_foreign_denormalize(
                     model_from=Tenant,
                     field_name=field,
-                    object_id=self.pk,
+                    object_id=tenant.pk,
                 )
-        if 'LegalTenant' in self._type:
-            self.denormalize_legal_entity()
-        if actor_denormalize:
-            self.denormalize_actor_owner()
-        self.mirroring_to_actors(changed)  # changed до save
-        if settings_access:
-            self.mirror_limited_access()
+            if 'LegalTenant' in tenant._type:
+                tenant.denormalize_legal_entity()
+            if prepared['settings_access']:
+                tenant.mirror_limited_access()
+
+        cls._denormalize_actor_owners([
+            tenant for tenant, prepared in pending
+            if prepared['actor_denormalize']
+        ])
+        for house_id in {
+            tenant.area.house.id for tenant, prepared in pending
+            if prepared['filter_data_changed'] and tenant.area
+        }:
+            FilterDataVersion.bump(house_id)
 
-        if not kwargs.get('ignore_scheduling') and must_export_changes:
-            from app.gis.models.gis_queued import GisQueued
-            if not self.statuses.is_accounting:  # ЛС закрыт?
-                GisQueued.put(self, weeks=4)  # откладываем выгрузку изменений
-            else:
-                GisQueued.put(self)
+        if kwargs.get('ignore_scheduling'):
+            return
+        exported = [
+            tenant for tenant, prepared in pending
+            if prepared['must_export_changes']
+        ]
+        GisQueued.put_many(  # откладываем выгрузку изменений закрытых ЛС
+            [tenant for tenant in exported if not tenant.statuses.is_accounting],
+            weeks=4,
+        )
+        GisQueued.put_many(
+            [tenant for tenant in exported if tenant.statuses.is_accounting],
+        )
 
-        return result
+    @classmethod
+    def _denormalize_actor_owners(cls, tenants):
+        """Обновление владельцев в Actor (аналог denormalize_actor_owner)"""
+        if not tenants:
+            return
+        from app.auth.models.actors import Actor
+        from app.house.models.house import House
+        tenants = {tenant.pk: tenant for tenant in tenants}
+        actors = {}  # владелец: первый Actor
+        for actor in Actor.objects(
+                owner__id__in=list(tenants),
+        ).only('id', 'owner.id').as_pymongo():
+            actors.setdefault(actor['owner']['_id'], actor['_id'])
+        if not actors:
+            return
+        houses = {
+            house.pk: Actor.get_house_business_types(house)
+            for house in House.objects(pk__in=list({
+                tenants[owner_id].area.house.id for owner_id in actors
+            })).only('id', 'service_binds')
+        }
+        Actor._get_collection().bulk_write([
+            UpdateOne({'_id': actor_id}, {'$set': {
+                'owner': AccountEmbedded.from_tenant(
+                    tenant=tenants[owner_id],
+                    business_types=houses[tenants[owner_id].area.house.id],
+                ).to_mongo(),
+            }})
+            for owner_id, actor_id in actors.items()
+        ], ordered=False)
 
     def denormalize_actor_owner(self):
         from app.auth.models.actors import Actor
@@ -2164,6 +2394,12 @@ class Tenant(
     def _set_mate_family_role(self, role, related_to):
         """Установка обратной роли сожителю"""
         mate = Tenant.objects(pk=related_to).get()
+        self._apply_mate_family_role(mate, self._get_new_mate_role(role))
+        # Передадим флаг, чтобы не возникло рекурсии по денормализации ролей
+        mate.save(ignore_family=True)
+
+    def _apply_mate_family_role(self, mate, new_role_id):
+        """Установка обратной роли сожителю (без сохранения)"""
         # Создадим роль, если
         role_create_condition = (
             # нет данных о семье
@@ -2172,7 +2408,6 @@ class Tenant(
                 # или нет данного жителя в ролях
                 or self.id not in [x.related_to for x in mate.family.relations]
         )
-        new_role_id = self._get_new_mate_role(role)
         if role_create_condition:
             new_role = FamilyRole(
                 role=new_role_id,
@@ -2187,8 +2422,6 @@ class Tenant(
                 if relation.related_to == self.id:
                     relation.role = new_role_id
                     break
-        # Передадим флаг, чтобы не возникло рекурсии по денормализации ролей
-        mate.save(ignore_family=True)
 
     def _delete_old_relations(self):
         if self.family:
@@ -2469,6 +2702,7 @@ class OtherTenant(Document, BindedModelMixin):
         HouseGroupBinds,
         verbose_name='Привязки к организации и группе домов (P, HG и D)'
     )
+    _HOUSE_BINDS_KEYS = ('area.house._id', 'area._id')
 
     @queryset_manager
     def objects(doc_cls, queryset):
@@ -115,9 +115,10 @@ class ForeignDenormalizeModelMixin(ModelMixin):
             return self._is_triggers(self._FOREIGN_DENORMALIZE_FIELDS)
 
     def _foreign_denormalize(self, denormalize_fields):
-        from app.caching.tasks.denormalization import foreign_denormalize_data
+        from app.caching.tasks.denormalization import \
+            schedule_foreign_denormalize
         for field in denormalize_fields:
-            foreign_denormalize_data.delay(
+            schedule_foreign_denormalize(
                 model_from=self.__class__,
                 field_name=field,
                 object_id=self.pk,
@@ -150,6 +151,13 @@ class ForeignDenormalizeModelMixin(ModelMixin):
 class BindedModelMixin(ModelMixin):
 
     _binds = EmbeddedDocumentField(BaseBind)
+    # (ключ дома, ключ помещения) в базе для пересчета групп домов (_binds.hg)
+    # по диапазонам _id, None - модель не пересчитывается; документ
+    # без помещения получает группы домов всего дома
+    _HOUSE_BINDS_KEYS = None
+    # (коллекция, поле ссылки) - группы домов копируются у документа
+    # другой коллекции и пересчитываются вместе с ним
+    _HOUSE_BINDS_SOURCE = None
 
     @classmethod
     def get_binds_query(cls, binds_permissions, raw: bool = False):
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+import redis
+
+from app.caching.core.redis import CACHE_REDIS
+from processing.models.billing.house_group import HouseGroup
+
+logger = logging.getLogger('c300')
+
+BINDS_VERSION_CHECK_SECONDS = 5  # допустимое отставание карты процесса
+
+
+class HouseGroupsResolver:
+    """
+    Карта групп домов (HouseGroup) процесса: дом -> организация -> группы.
+
+    Загружается одним запросом и используется при вычислении привязок
+    (_binds.hg) документов без обращения к базе. Актуальность карты
+    определяется версией в Redis, которую увеличивает изменение групп домов
+    или привязок домов (invalidate); версия проверяется не чаще раза
+    в BINDS_VERSION_CHECK_SECONDS. Без Redis группы домов загружаются
+    из базы (без кэширования)
+    """
+
+    VERSION_KEY = 'binds:house_groups:version'
+
+    def __init__(self, check_seconds=BINDS_VERSION_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._houses = None  # дом: {организация: [группы домов]}
+        self._version = None
+        self._checked = 0.0  # время последней проверки версии
+
+    def house_groups(self, house_id) -> list:
+        """Группы домов, в которые входит дом"""
+        houses = self._get_houses()
+        if houses is None:
+            return HouseGroup.objects(houses=house_id).distinct('id')
+        return [
+            group_id
+            for groups in houses.get(house_id, {}).values()
+            for group_id in groups
+        ]
+
+    def provider_house_groups(self, house_id, providers) -> list:
+        """Группы домов организаций, в которые входит дом"""
+        houses = self._get_houses()
+        if houses is None:
+            return HouseGroup.objects(
+                provider__in=providers,
+                houses=house_id,
+            ).distinct('id')
+        groups = houses.get(house_id, {})
+        # организация может повторяться (несколько привязок помещения)
+        return list(dict.fromkeys(
+            group_id
+            for provider_id in providers
+            for group_id in groups.get(provider_id, [])
+        ))
+
+    def invalidate(self):
+        """Сбросить карту групп домов во всех процессах"""
+        with self._lock:
+            self._houses = None
+        try:
+            CACHE_REDIS.redis.incr(self.VERSION_KEY)
+        except redis.RedisError as error:
+            logger.warning('House groups map is not invalidated: %s', error)
+
+    def refresh(self):
+        """Проверить версию карты при следующем обращении (без отставания)"""
+        self._checked = 0.0
+
+    def _get_houses(self):
+        now = time.monotonic()
+        if self._houses is not None and now - self._checked < self.check_seconds:
+            return self._houses
+        try:
+            version = int(CACHE_REDIS.redis.get(self.VERSION_KEY) or 0)
+        except redis.RedisError as error:
+            logger.warning('House groups map is unavailable: %s', error)
+            return None
+        with self._lock:
+            if self._houses is None or self._version != version:
+                self._houses = self._load()
+                self._version = version
+            self._checked = now
+            return self._houses
+
+    @staticmethod
+    def _load() -> dict:
+        houses = {}
+        for group in HouseGroup.objects.only(
+                'id', 'provider', 'houses',
+        ).as_pymongo():
+            for house_id in group.get('houses') or []:
+                houses.setdefault(house_id, {}).setdefault(
+                    group.get('provider'), [],
+                ).append(group['_id'])
+        return houses
+
+
+HOUSE_GROUPS = HouseGroupsResolver()
@@ -1,7 +1,7 @@
 from bson import ObjectId
 
-from processing.models.billing.house_group import HouseGroup
 from processing.models.billing.area_bind import AreaBind
+from processing.models.billing.binds_resolver import HOUSE_GROUPS
 
 from processing.models.choices import AreaType
 
@@ -74,17 +74,14 @@ def get_area_house_groups(area_id: ObjectId, house_id: ObjectId) -> list:
     if not providers:
         return []
     # отдаём группы домов
-    return HouseGroup.objects(
-        provider__in=providers,
-        houses=house_id
-    ).distinct('id')
+    return HOUSE_GROUPS.provider_house_groups(house_id, providers)
 
 
 def get_house_groups(house_id: ObjectId) -> list:
     """
     Возвращает список групп домов, к которым принадлежит дом
     """
-    return HouseGroup.objects(houses=house_id).distinct('id')
+    return HOUSE_GROUPS.house_groups(house_id)
 
 
 def get_area_number(description: str) -> tuple:
@@ -32,6 +32,8 @@ class HouseGroup(Document):
         if self.title is None:
             self.title = f"Домов: {len(self.houses)}"
         super().save(*args, **kwargs)
+        from processing.models.billing.binds_resolver import HOUSE_GROUPS
+        HOUSE_GROUPS.invalidate()
         # if self.is_total:
         #     statistic_for_house_in_cache.delay(
         #         self.houses, deleted=True, provider_id=self.provider
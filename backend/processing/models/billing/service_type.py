@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from mongoengine import Document
 from mongoengine.fields import StringField, BooleanField, DateTimeField, \
     ObjectIdField, UUIDField, ListField, EmbeddedDocumentField
@@ -5,9 +7,12 @@ from mongoengine.fields import StringField, BooleanField, DateTimeField, \
 from processing.models.billing.base import \
     BindedModelMixin, ProviderBinds, RelationsProviderBindsProcessingMixin
 
+from processing.models.billing.service_type_closure import \
+    ServiceTypeClosure
 from processing.references.service_types import SystemServiceTypesTree
 
 from app.gis.models.guid import GisTransportable
+from app.gis.utils.nsi_cache import NSI_CACHE
 
 
 MAINTENANCE_ROOT_CODE = 'maintenance'
@@ -16,6 +21,8 @@ COMMUNAL_ROOT_CODE = 'communal_services'
 
 ADDITIONAL_EXCEPTIONS = ['administrative']  # ЖУ без предка (не ДУ)
 
+CLOSURE_TTL_SECONDS = 300  # время жизни индекса замыкания в процессе
+
 
 class ServiceType(RelationsProviderBindsProcessingMixin,
                   BindedModelMixin,
@@ -56,7 +63,9 @@ class ServiceType(RelationsProviderBindsProcessingMixin,
         if not self._binds and not self.is_system:
             self._binds = ProviderBinds(pr=self._get_providers_binds())
 
-        return super().save(*args, **kwargs)
+        result = super().save(*args, **kwargs)
+        self.invalidate_closure(None if self.is_system else self.provider)
+        return result
 
     def delete(self, *args, **kwargs):
 
@@ -69,7 +78,9 @@ class ServiceType(RelationsProviderBindsProcessingMixin,
         accrual = Accrual.objects(services__service_type=self.pk).first()
         if accrual:
             raise PermissionError('Can not remove used services')
-        return super().delete(*args, **kwargs)
+        result = super().delete(*args, **kwargs)
+        self.invalidate_closure(None if self.is_system else self.provider)
+        return result
 
     @property
     def resource(self) -> str or None:
@@ -140,6 +151,86 @@ class ServiceType(RelationsProviderBindsProcessingMixin,
 
     _cached_service_tree: dict = None
 
+    _cached_parent_codes: dict = {}  # 'code': frozenset(родительские коды)
+
+    _closure_version: int = 0  # увеличивается при изменении услуг
+
+    _cached_closures: dict = {}  # ProviderId: (время построения, индекс)
+
+    @classmethod
+    def invalidate_closure(cls, provider_id=None):
+        """
+        Сбросить индексы замыкания дерева услуг
+
+        :param provider_id: организация, чьи услуги изменились;
+            None - изменились системные услуги, сбрасываются все индексы
+        """
+        cls._closure_version += 1
+        if provider_id is None:
+            cls._cached_closures.clear()
+            cls._cached_parent_codes.clear()
+            cls._cached_service_tree = None
+        else:
+            cls._cached_closures.pop(provider_id, None)
+
+    @classmethod
+    def get_closure(cls, provider_id=None,
+                    system_types=None, provider_types=None):
+        """
+        Индекс замыкания дерева услуг организации: предки и потомки услуг
+
+        Индекс строится один раз на процесс и сбрасывается при сохранении
+        или удалении услуг, а также по истечении CLOSURE_TTL_SECONDS
+        (изменения из других процессов). Если переданы списки услуг,
+        индекс строится по ним и не кэшируется
+        """
+        if system_types is not None or provider_types is not None:
+            return cls._build_closure(provider_id,
+                                      system_types, provider_types)
+
+        now = datetime.now()
+        built_at, closure = cls._cached_closures.get(provider_id, (None, None))
+        if (
+                closure is None
+                or closure.version != cls._closure_version
+                or (now - built_at).total_seconds() > CLOSURE_TTL_SECONDS
+        ):
+            closure = cls._build_closure(provider_id)
+            cls._cached_closures[provider_id] = (now, closure)
+        return closure
+
+    @classmethod
+    def _build_closure(cls, provider_id,
+                       system_types=None, provider_types=None):
+
+        if system_types is None:
+            system_types = cls.objects(
+                __raw__={'is_system': True},
+            ).only('code').as_pymongo()
+        if provider_types is None:
+            provider_types = cls.objects(
+                __raw__={'provider': provider_id},
+            ).only('parents').as_pymongo() if provider_id else []
+
+        def as_dict(service_type) -> dict:
+            if isinstance(service_type, dict):
+                return service_type
+            return {'_id': service_type.id,
+                    'code': getattr(service_type, 'code', None),
+                    'parents': getattr(service_type, 'parents', None)}
+
+        system_ids = {}
+        for service_type in map(as_dict, system_types):
+            if service_type.get('code'):
+                system_ids[service_type['code']] = service_type['_id']
+
+        return ServiceTypeClosure(
+            system_ids,
+            SystemServiceTypesTree[0]['services'],
+            [as_dict(service_type) for service_type in provider_types],
+            version=cls._closure_version,
+        )
+
     @classmethod
     def get_services_tree(cls) -> dict:
         """
@@ -269,6 +360,11 @@ class ServiceType(RelationsProviderBindsProcessingMixin,
                 ('heat_water', 'hot_water_individual'),
         }  # все услуги с двумя предками
 
+        cached: set = cls._cached_parent_codes.get(service_type_code)
+        if cached is not None:
+            return set(cached)  # копия, чтобы не портить кэш
+
+        requested_code: str = service_type_code
         parent_codes = set()
         service_type_tree = cls.get_services_tree()  # дерево услуг с кодами
 
@@ -293,6 +389,7 @@ class ServiceType(RelationsProviderBindsProcessingMixin,
             if service_type_code:  # получен код предка?
                 parent_codes.add(service_type_code)
 
+        cls._cached_parent_codes[requested_code] = frozenset(parent_codes)
         return parent_codes
 
     @classmethod
@@ -304,50 +401,9 @@ class ServiceType(RelationsProviderBindsProcessingMixin,
         Можно передать список системных услуг и услуг провайдера, чтобы не
         делать запрос в базу.
         """
-        s_types = {
-            s.code: s.id
-            for s in (
-                system_types
-                or cls.objects.filter(is_system=True).only('code')
-            )
-        }
-        p_types = (
-                provider_types
-                or cls.objects.filter(provider=provider_id).only('parents')
-        )
-
-        def get_p_children(p_type_id):
-            children = []
-            for p_p_type in p_types:
-                if p_p_type.parents and p_type_id in p_p_type.parents:
-                    children.append(p_p_type.id)
-                    children.extend(get_p_children(p_p_type.id))
-            return children
-
-        for p_type in p_types:
-            p_type.children = get_p_children(p_type.id)
-        s_types_tree = SystemServiceTypesTree[0]['services']
-
-        def get_children(main_code):
-            children = []
-            for s_code, s_data in s_types_tree.items():
-                if (
-                        s_data.get('parent_codes')
-                        and main_code in s_data['parent_codes']
-                ):
-                    children.append(s_types[s_code])
-                    children.extend(get_children(s_code))
-            return children
-
-        result = {}
-        for code, data in s_types_tree.items():
-            result[code] = [s_types[code]]
-            result[code].extend(get_children(code))
-            for p_type in p_types:
-                if p_type.parents and set(p_type.parents) & set(result[code]):
-                    result[code].append(p_type.id)
-                    result[code].extend(p_type.children)
-        return result
+        return cls.get_closure(
+            provider_id, system_types, provider_types
+        ).as_provider_tree()
 
     @classmethod
     def update_by_system_params(cls, service_types, date_on=None):
@@ -467,6 +523,11 @@ class ServiceType(RelationsProviderBindsProcessingMixin,
         return cls.objects(__raw__=query).order_by('-provider', 'title')
 
 
+class GisTitleDuplicateError(Exception):
+    """Одноименные элементы (частных) справочников услуг организации"""
+    pass
+
+
 class ServiceTypeGisName(Document, GisTransportable):
     meta = {
         'db_alias': 'legacy-db',
@@ -587,11 +648,29 @@ class ServiceTypeGisName(Document, GisTransportable):
         from app.gis.utils.nsi import SERVICE_NSI
         return [str(num) for num in SERVICE_NSI]
 
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        NSI_CACHE.invalidate(self.provider)
+        return result
+
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        NSI_CACHE.invalidate(self.provider)
+
     @classmethod
     def ref_codes_of(cls, provider_id) -> dict:
         """
-        Номера справочников с кодами элементов ГИС ЖКХ провайдера
+        Номера справочников с кодами элементов ГИС ЖКХ провайдера (кэш)
         """
+        return NSI_CACHE.get(
+            'ref_codes', provider_id,
+            lambda: cls._load_ref_codes_of(provider_id),
+            reg_nums=[*cls.service_nsi(), '50'],
+        )
+
+    @classmethod
+    def _load_ref_codes_of(cls, provider_id) -> dict:
+
         titled_refs: dict = {}
 
         for nsi in cls.objects(__raw__={
@@ -606,9 +685,10 @@ class ServiceTypeGisName(Document, GisTransportable):
 
             ref: tuple = (int(nsi['reference_number']), nsi['position_number'])
             dup: tuple = titled_refs.get(nsi['gis_title'])
-            assert not dup, f"Наименование «{title}» имеют элементы" \
-                f" {ref[0]}.{ref[1]} и {dup[0]}.{dup[1]} справочников" \
-                f" провайдера {provider_id}"
+            if dup:  # одноименные элементы справочников?
+                raise GisTitleDuplicateError(f"Наименование «{title}» имеют"
+                    f" элементы {ref[0]}.{ref[1]} и {dup[0]}.{dup[1]}"
+                    f" справочников провайдера {provider_id}")
 
             titled_refs[title] = ref
 
@@ -639,8 +719,17 @@ class ServiceTypeGisName(Document, GisTransportable):
     @classmethod
     def references(cls, provider_id) -> dict:
         """
-        Имеющиеся частные справочники услуг организации
+        Имеющиеся частные справочники услуг организации (кэш)
         """
+        return NSI_CACHE.get(
+            'references', provider_id,
+            lambda: cls._load_references(provider_id),
+            reg_nums=cls.service_nsi(),
+        )
+
+    @classmethod
+    def _load_references(cls, provider_id) -> dict:
+
         return {int(nsi['reference_number']): nsi['reference_name']
             for nsi in cls.objects(__raw__={
                 'provider': provider_id, 'closed': None,
@@ -707,13 +796,30 @@ class ServiceTypeGisBind(Document):
     service_code = StringField(verbose_name='Код услуги')
     gis_title = StringField(required=True, verbose_name='Наименование в ГИС')
 
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        NSI_CACHE.invalidate(self.provider)
+        return result
+
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        NSI_CACHE.invalidate(self.provider)
+
     @classmethod
     def mappings_of(cls, provider_id) -> dict:
         """
-        Получить сопоставления услуг определенного провайдера
+        Получить сопоставления услуг определенного провайдера (кэш)
 
         :returns: 'title': (ServiceTypeId, 'code'),...
         """
+        return NSI_CACHE.get(
+            'mappings', provider_id,
+            lambda: cls._load_mappings_of(provider_id),
+        )
+
+    @classmethod
+    def _load_mappings_of(cls, provider_id) -> dict:
+
         service_mappings: dict = {}
 
         for bind in cls.objects(__raw__={
@@ -0,0 +1,115 @@
+from collections import defaultdict
+
+
+class ServiceTypeClosure:
+    """
+    Транзитивное замыкание дерева услуг: предки и потомки каждой услуги.
+
+    Строится один раз из системного дерева (коды) и услуг организации
+    (ссылки на предков), после чего отвечает на вопросы «входит ли услуга X
+    в услугу Y» и «все потомки кода» без обхода дерева
+    """
+
+    def __init__(self, system_ids: dict, system_tree: dict,
+                 provider_types=(), version: int = 0):
+        """
+        :param system_ids: {'code': ServiceTypeId} системных услуг
+        :param system_tree: {'code': {'parent_codes': [...]}, ...}
+        :param provider_types: [{'_id': ServiceTypeId, 'parents': [...]}, ...]
+        :param version: версия индекса, с которой он построен
+        """
+        self.version = version
+        self.code_ids: dict = {
+            code: system_ids[code]
+            for code in system_tree if system_ids.get(code)
+        }
+        self.children: dict = defaultdict(list)  # ServiceTypeId: [...]
+        for code, data in system_tree.items():
+            if code not in self.code_ids:
+                continue
+            for parent_code in data.get('parent_codes') or []:
+                if parent_code in self.code_ids:
+                    self.children[self.code_ids[parent_code]].append(
+                        self.code_ids[code]
+                    )
+        for service_type in provider_types:
+            for parent_id in service_type.get('parents') or []:
+                self.children[parent_id].append(service_type['_id'])
+
+        self.descendants: dict = {}  # ServiceTypeId: [...] в порядке обхода
+        self.ancestors: dict = defaultdict(set)  # ServiceTypeId: {...}
+        for parent_id in list(self.children):
+            self._descendants_of(parent_id)
+        for parent_id, descendants in self.descendants.items():
+            for child_id in descendants:
+                self.ancestors[child_id].add(parent_id)
+        self._descendant_sets: dict = {
+            parent_id: set(descendants)
+            for parent_id, descendants in self.descendants.items()
+        }
+
+    def _descendants_of(self, parent_id, path: frozenset = frozenset()):
+        """
+        Потомки услуги с мемоизацией. Циклы в данных пропускаются,
+        неполный из-за цикла результат не запоминается
+        """
+        cached = self.descendants.get(parent_id)
+        if cached is not None:
+            return cached, True
+
+        result = []
+        seen = set()
+        complete = True
+        for child_id in self.children.get(parent_id, []):
+            if child_id in path or child_id == parent_id:
+                complete = False  # цикл в данных
+                continue
+            child_descendants, child_complete = self._descendants_of(
+                child_id, path | {parent_id}
+            )
+            complete = complete and child_complete
+            for service_id in [child_id, *child_descendants]:
+                if service_id not in seen and service_id != parent_id:
+                    seen.add(service_id)
+                    result.append(service_id)
+
+        if complete or not path:
+            self.descendants[parent_id] = result
+        return result, complete
+
+    def is_under(self, service_id, parent_id) -> bool:
+        """Является ли услуга потомком (не равной) другой услуги?"""
+        return parent_id in self.ancestors.get(service_id, ())
+
+    def is_under_code(self, service_id, code: str) -> bool:
+        """Является ли услуга потомком системной услуги с кодом?"""
+        parent_id = self.code_ids.get(code)
+        return parent_id is not None and self.is_under(service_id, parent_id)
+
+    def ancestors_of(self, service_id) -> set:
+        """Все предки услуги"""
+        return self.ancestors.get(service_id, set())
+
+    def descendants_of(self, service_id) -> set:
+        """Все потомки услуги (исключая саму услугу)"""
+        return self._descendant_sets.get(service_id, set())
+
+    def descendants_of_code(self, code: str) -> list:
+        """
+        Услуга с кодом и все её потомки, включая услуги организации
+        """
+        service_id = self.code_ids.get(code)
+        if service_id is None:
+            return []
+        return [service_id, *self.descendants.get(service_id, [])]
+
+    def as_provider_tree(self) -> dict:
+        """
+        Представление в формате ServiceType.get_provider_tree
+
+        :returns: {'code': [ServiceTypeId, ...потомки]}
+        """
+        return {
+            code: self.descendants_of_code(code)
+            for code in self.code_ids
+        }
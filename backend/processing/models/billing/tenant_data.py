@@ -65,6 +65,7 @@ class TenantData(Document, BindedModelMixin):
         HouseGroupBinds,
         verbose_name='Привязки к организации и группе домов (P,HG и D)'
     )
+    _HOUSE_BINDS_SOURCE = ('Account', 'tenant')  # привязки жителя
 
     def save(self, *args, **kwargs):
         if self._created:
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from processing.models.billing.service_type_closure import \
+    ServiceTypeClosure
+
+
+SYSTEM_TREE = {
+    'maintenance': {'parent_codes': []},
+    'elevator': {'parent_codes': ['maintenance']},
+    'hot_water': {'parent_codes': []},
+    'heating_water': {'parent_codes': ['hot_water', 'maintenance']},
+    'unknown': {'parent_codes': ['maintenance']},  # нет в базе
+}
+SYSTEM_IDS = {
+    'maintenance': 1,
+    'elevator': 2,
+    'hot_water': 3,
+    'heating_water': 4,
+}
+PROVIDER_TYPES = [
+    {'_id': 10, 'parents': [2]},
+    {'_id': 11, 'parents': [10]},
+    {'_id': 12, 'parents': [3]},
+    {'_id': 13, 'parents': []},
+]
+
+
+def test_provider_tree():
+    closure = ServiceTypeClosure(SYSTEM_IDS, SYSTEM_TREE, PROVIDER_TYPES)
+    tree = closure.as_provider_tree()
+    assert tree['maintenance'] == [1, 2, 10, 11, 4]
+    assert tree['hot_water'] == [3, 4, 12]
+    assert tree['elevator'] == [2, 10, 11]
+    assert 'unknown' not in tree
+
+
+def test_is_under():
+    closure = ServiceTypeClosure(SYSTEM_IDS, SYSTEM_TREE, PROVIDER_TYPES)
+    assert closure.is_under(11, 1)
+    assert closure.is_under_code(11, 'elevator')
+    assert not closure.is_under(11, 3)
+    assert not closure.is_under(1, 1)
+    assert not closure.is_under(13, 1)
+    assert closure.ancestors_of(4) == {1, 3}
+    assert closure.descendants_of(10) == {11}
+
+
+def test_cycle_is_ignored():
+    closure = ServiceTypeClosure(
+        SYSTEM_IDS,
+        SYSTEM_TREE,
+        [{'_id': 20, 'parents': [21]}, {'_id': 21, 'parents': [20]}],
+    )
+    assert closure.descendants_of(20) == {21}
+    assert closure.descendants_of(21) == {20}
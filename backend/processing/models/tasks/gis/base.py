@@ -78,7 +78,7 @@ class GisBaseExportTask(Task):
         self.save()
 
         try:
-            xlsx = self.PRODUCER_CLS(self.get_entries()).get_xlsx_pyoo(self)
+            xlsx = self.PRODUCER_CLS(self.get_entries()).get_xlsx(self)
         except Exception as error:
             GisImportStatus(  # сохраняем ошибку
                 task=self.parent.id,  # export_task.parent.id
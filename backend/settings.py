@@ -84,6 +84,9 @@ GIS_CELERY_REDIS_DB = 3
 GIS_BROKER_URL = 'redis://gis_redis:6379'
 S300_CELERY_REDIS_DB = 1
 S300_BROKER_URL = 'redis://redis:6379'
+# общие для процессов кэши (НСИ, группы домов, контекст операций ГИС ЖКХ)
+CACHE_REDIS_URL = 'redis://redis:6379'
+CACHE_REDIS_DB = 2
 CELERY_SOFT_TIME_MODIFIER = 1
 
 SEND_MAIL_INSTANTLY = False
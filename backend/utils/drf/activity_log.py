@@ -0,0 +1,125 @@
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from types import SimpleNamespace
+
+from pymongo.errors import PyMongoError
+
+from processing.models.logging.user_activity import UserActivity
+from utils.drf.authentication import RequestAuth
+
+logger = logging.getLogger('c300')
+
+ACTIVITY_BUFFER_SIZE = 20000  # записей в буфере процесса
+ACTIVITY_BATCH_SIZE = 500  # записей в одном insert_many
+ACTIVITY_FLUSH_SECONDS = 2.0  # максимальная задержка записи журнала
+
+
+class UserActivitySink:
+    """
+    Журнал запросов пользователей (UserActivity) процесса.
+
+    Записи складываются в кольцевой буфер и сохраняются фоновым потоком
+    пачками insert_many: по накоплении пачки или по таймеру. Запрос
+    записи не ждет: при переполнении буфера вытесняются самые старые
+    записи, их количество пишется в журнал приложения. Организация и
+    признак суперпользователя сессии определяются при сохранении, один
+    раз на сессию в пачке
+    """
+
+    def __init__(self, capacity=ACTIVITY_BUFFER_SIZE,
+                 batch_size=ACTIVITY_BATCH_SIZE,
+                 interval=ACTIVITY_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._buffer = deque(maxlen=capacity)
+        self._event = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.dropped = 0
+
+    def put(self, log: UserActivity, user=None, session=None):
+        """Поставить запись журнала в очередь на сохранение"""
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1  # вытесняется самая старая запись
+        self._buffer.append((log, user, session))
+        self._ensure_flusher()
+        if len(self._buffer) >= self.batch_size:
+            self._event.set()
+
+    def _ensure_flusher(self):
+        # после fork (воркеры uwsgi, celery) поток родителя отсутствует
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                name='user-activity-flusher',
+                daemon=True,
+            )
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._event.wait(self.interval)
+            self._event.clear()
+            try:
+                self.flush()
+            except Exception as error:
+                logger.error('UserActivity flush failed: %s', error)
+
+    def flush(self):
+        """Сохранить все накопленные записи журнала"""
+        with self._flush_lock:
+            if self.dropped:
+                logger.warning(
+                    'UserActivity buffer overflow, %d records dropped',
+                    self.dropped,
+                )
+                self.dropped = 0
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+                self._write(batch)
+
+    def _write(self, batch):
+        sessions = {}
+        documents = []
+        for log, user, session in batch:
+            if session is not None:
+                key = (log.session, log.user)
+                if key not in sessions:
+                    sessions[key] = _get_session_data(user, session)
+                log.provider, log.superuser = sessions[key]
+            documents.append(log.to_mongo())
+        try:
+            UserActivity._get_collection().insert_many(
+                documents,
+                ordered=False,
+            )
+        except PyMongoError as error:
+            logger.error(
+                'UserActivity: %d records are not saved: %s',
+                len(documents), error,
+            )
+
+
+def _get_session_data(user, session) -> tuple:
+    """Организация и признак суперпользователя сессии"""
+    request_auth = RequestAuth(SimpleNamespace(user=user, auth=session))
+    try:
+        return request_auth.get_provider_id(), request_auth.is_super()
+    except Exception:  # пользователь или сессия могли быть удалены
+        return None, None
+
+
+USER_ACTIVITY_SINK = UserActivitySink()
+atexit.register(USER_ACTIVITY_SINK.flush)
@@ -5,7 +5,6 @@ from typing import Tuple
 from bson import ObjectId
 from dateutil.parser import parse
 from django.http import HttpResponse, JsonResponse
-from django.template.response import ContentNotRenderedError
 from mongoengine import DoesNotExist
 from rest_framework import mixins, viewsets, exceptions
 from rest_framework import status
@@ -19,6 +18,7 @@ from app.personnel.models.personnel import Worker
 from lib.gridfs import get_file_from_gridfs, delete_file_in_gridfs
 from processing.models.billing.base import BindsPermissions
 from processing.models.logging.user_activity import UserActivity
+from utils.drf.activity_log import USER_ACTIVITY_SINK
 from utils.drf.authentication import RequestAuth
 from utils.drf.base_serializers import json_serializer
 
@@ -87,31 +87,31 @@ class ViewLogMixin:
     def finish_log(self, log, request, result):
         if not log:
             log = self.user_activity_log
-        request_auth = RequestAuth(request)
+        user, session = None, None
         if request.user:
             log.user = request.user.pk
         if request.auth:
             log.session = request.auth.pk
             log.session_ip = request.auth.remote_ip
-            log.provider = request_auth.get_provider_id()
-            log.superuser = request_auth.is_super()
             if request.auth.slave and request.auth.slave.account:
                 log.slave = request.auth.slave.account
+            # организация определяется при сохранении журнала
+            user, session = request.user, request.auth
         log.action = self.action
         log.result_status = result.status_code
-        if hasattr(result, 'rendered_content'):
-            content = result.rendered_content
-        else:
-            try:
-                content = result.content
-            except ContentNotRenderedError:
-                content = None
-        if content:
-            log.result_len = len(content)
         time_delta = datetime.datetime.now() - log.created
         log.millis = \
             (time_delta.seconds * 10 ** 6 + time_delta.microseconds) / 1000
-        log.save()
+
+        def put_log(response):
+            if not getattr(response, 'streaming', False) and response.content:
+                log.result_len = len(response.content)
+            USER_ACTIVITY_SINK.put(log, user, session)
+
+        if getattr(result, 'is_rendered', True):
+            put_log(result)
+        else:  # длина ответа - после отрисовки фреймворком
+            result.add_post_render_callback(put_log)
 
 
 class SerializationMixin:
@@ -2,12 +2,16 @@ from mongoengine import Q, BooleanField, EmbeddedDocumentField, \
     EmbeddedDocumentListField
 from rest_framework.filters import BaseFilterBackend
 
+from utils.drf.pagination import KeysetPagination
+
 
 class LimitFilterBackend(BaseFilterBackend):
     """
     Фильтрует по полю limit.
     """
     def filter_queryset(self, request, queryset, view):
+        if isinstance(getattr(view, 'paginator', None), KeysetPagination):
+            return queryset  # limit применяется при выборке по курсору
         limit = request.query_params.get('limit')
         offset = int(request.query_params.get('offset') or 0)
         if limit:
@@ -31,7 +35,8 @@ class ParamsFilter(BaseFilterBackend):
             query_filter = Q()
             for param, val in request.query_params.items():
                 # Убираем параметры по которым не нужно фильтровать
-                if param not in ('limit', 'offset', *self.EXCLUDE_FIELDS):
+                if param not in ('limit', 'offset', 'cursor',
+                                 *self.EXCLUDE_FIELDS):
                     boolean = False  # Является ли параметр булевым
                     # Если значение параметра напоминает булево значение
                     if val in ('true', 'false', 'null'):
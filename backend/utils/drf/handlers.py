@@ -14,8 +14,7 @@ def custom_exception_handler(exc, context):
         view_log = getattr(context['view'], 'user_activity_log')
         if view_log:
             error_str = traceback.format_exc()
-            view_log.traceback = error_str
-            view_log.save()
+            view_log.traceback = error_str  # сохраняется по завершении
     except Exception:
         pass
 
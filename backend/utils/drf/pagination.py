@@ -0,0 +1,161 @@
+import base64
+import hashlib
+from collections import OrderedDict
+
+from bson import BSON, json_util
+from bson.errors import BSONError
+from django.core.cache import cache
+from mongoengine import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, \
+    remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничная выдача по курсору вместо skip.
+
+    Курсор - закодированное значение ключа сортировки (и id) последнего
+    элемента страницы, следующая страница выбирается условием по
+    индексированному ключу, поэтому любая страница стоит как первая.
+    Количество элементов - приблизительное: без фильтров из метаданных
+    коллекции, иначе кэшируется на count_cache_seconds.
+
+    Подключается в контроллере: pagination_class = KeysetPagination,
+    ключ сортировки - атрибут контроллера cursor_ordering
+    """
+    default_limit = 150
+    max_limit = 1000
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    ordering = '-id'  # индексированное поле, '-' - по убыванию
+    count_cache_seconds = 60  # None - без количества элементов
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.count = self.get_count(queryset)
+
+        field, descending = self.get_ordering(view)
+        order_by = ['-' + field if descending else field]
+        if field != 'id':  # неуникальный ключ дополняется id
+            order_by.append('-id' if descending else 'id')
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(field, descending, *position)
+            )
+
+        page = list(queryset.order_by(*order_by).limit(self.limit + 1))
+        self.next_position = None
+        if len(page) > self.limit:
+            page = page[:self.limit]
+            self.next_position = (
+                _get_value(page[-1], field), page[-1].pk,
+            )
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', None),  # только последовательный просмотр
+            ('results', data),
+        ]))
+
+    def get_limit(self, request) -> int:
+        try:
+            return _positive_int(
+                request.query_params[self.limit_query_param],
+                strict=True,
+                cutoff=self.max_limit,
+            )
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def get_ordering(self, view) -> tuple:
+        """(поле, по убыванию?) ключа сортировки"""
+        ordering = getattr(view, 'cursor_ordering', None) or self.ordering
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def get_count(self, queryset):
+        """Приблизительное количество элементов выборки"""
+        if self.count_cache_seconds is None:
+            return None
+        collection = queryset._document._get_collection()
+        query = queryset._query
+        if not query:
+            return collection.estimated_document_count()
+
+        key = 'keyset_count:{}:{}'.format(
+            collection.name,
+            hashlib.md5(
+                json_util.dumps(query, sort_keys=True).encode()
+            ).hexdigest(),
+        )
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_cache_seconds)
+        return count
+
+    @staticmethod
+    def get_position_filter(field, descending, value, pk) -> Q:
+        """
+        Условие выборки элементов после курсора
+
+        MongoDB сортирует null (и отсутствующее поле) раньше любых значений,
+        а условия gt/lt не выбирают пустые значения и не сравниваются с null,
+        поэтому пустой ключ сортировки обрабатывается отдельно
+        """
+        operator = 'lt' if descending else 'gt'
+        if field == 'id':
+            return Q(**{'id__' + operator: pk})
+        same_value = Q(**{field: value, 'id__' + operator: pk})
+        if value is None:
+            if descending:  # пустые значения - в конце выборки
+                return same_value
+            return Q(**{field + '__ne': None}) | same_value
+        position = Q(**{'{}__{}'.format(field, operator): value}) | same_value
+        if descending:  # после значений следуют пустые
+            return position | Q(**{field: None})
+        return position
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = BSON(
+                base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            ).decode()
+            return position['v'], position['id']
+        except (TypeError, ValueError, KeyError, BSONError):
+            raise NotFound('Invalid cursor')
+
+    def encode_cursor(self, value, pk) -> str:
+        encoded = base64.urlsafe_b64encode(BSON.encode({'v': value, 'id': pk}))
+        return encoded.decode('ascii').rstrip('=')
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), 'offset',
+        )
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(*self.next_position),
+        )
+
+
+def _get_value(document, field: str):
+    """Значение (вложенного) поля документа"""
+    value = document
+    for name in field.split('__'):
+        value = getattr(value, name, None) if value is not None else None
+    return value